@@ -0,0 +1,109 @@
+'''
+encode/decode time of each installed json codec on LSP payloads.
+
+python benchmarks/bench_codec.py [--capture FILE ...] [--session FILE ...]
+
+--capture is a raw stdout capture of a language server (Content-Length framed).
+--session is recorded by lsp.client.Client(record=FILE).
+Without them, publishDiagnostics and completion payloads shaped like pyls
+output are generated.
+'''
+import sys
+import json
+import time
+import pathlib
+import argparse
+from typing import List, Tuple
+
+HERE = pathlib.Path(__file__).absolute().parent
+sys.path.append(str(HERE.parent / 'src'))
+
+
+def make_diagnostics(count: int) -> dict:
+    return {
+        'jsonrpc': '2.0',
+        'method': 'textDocument/publishDiagnostics',
+        'params': {
+            'uri': 'file:///home/user/project/module.py',
+            'diagnostics': [{
+                'source': 'pycodestyle',
+                'range': {'start': {'line': i, 'character': 79}, 'end': {'line': i, 'character': 120}},
+                'message': 'E501 line too long (120 > 79 characters)',
+                'code': 'E501',
+                'severity': 2,
+            } for i in range(count)],
+        },
+    }
+
+
+def make_completion(count: int) -> dict:
+    return {
+        'jsonrpc': '2.0',
+        'id': 42,
+        'result': {
+            'isIncomplete': False,
+            'items': [{
+                'label': f'symbol_{i}(arg0, arg1)',
+                'kind': 3,
+                'detail': f'module.symbol_{i}',
+                'documentation': 'Return the thing.\n\n' + 'Long description. ' * 20,
+                'sortText': f'a{i:06d}',
+                'insertText': f'symbol_{i}',
+            } for i in range(count)],
+        },
+    }
+
+
+def load_capture(path: pathlib.Path) -> List[Tuple[str, bytes]]:
+    from vicode.lsp import jsonrpc_2_0
+    framer = jsonrpc_2_0.MessageFramer()
+    bodies = framer.feed(path.read_bytes())
+    return [(f'{path.name}#{i}', body) for i, body in enumerate(bodies)]
+
+
+def measure(func, arg, min_time=0.2) -> float:
+    count = 0
+    start = time.perf_counter()
+    while True:
+        func(arg)
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed > min_time:
+            return elapsed / count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--capture', type=pathlib.Path, nargs='*', default=[])
+    parser.add_argument('--session', type=pathlib.Path, nargs='*', default=[])
+    args = parser.parse_args()
+
+    from vicode.lsp import codec
+    from vicode.lsp import session
+
+    payloads: List[Tuple[str, bytes]] = []
+    for path in args.capture:
+        payloads += load_capture(path)
+    for path in args.session:
+        payloads += [(f'{path.name}#{i} {m.direction}', m.body)
+                     for i, m in enumerate(session.load_session(path))]
+    if not payloads:
+        for count in (100, 10000):
+            payloads.append((f'diagnostics x{count}', json.dumps(
+                make_diagnostics(count)).encode('utf-8')))
+        for count in (1000, 5000):
+            payloads.append((f'completion x{count}', json.dumps(
+                make_completion(count)).encode('utf-8')))
+
+    codecs = codec.available_codecs()
+    for name, body in payloads:
+        print(f'{name} ({len(body) / 1024 / 1024:.2f} MiB)')
+        message = json.loads(body)
+        for c in codecs.values():
+            decode = measure(c.loads, body)
+            encode = measure(c.dumps, message)
+            print(f'  {c.name:8} decode {decode * 1000:9.3f} ms  encode {encode * 1000:9.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+'''
+event loop stall while RpcDispatcher decodes large responses.
+
+python benchmarks/bench_frame_latency.py [--items N] [--count N] [--codec NAME]
+
+A ticker task stands in for prompt_toolkit rendering at 60 fps and records
+how late each tick wakes up. Large completion responses arrive meanwhile and
+are decoded inline, in a thread, or in a process.
+'''
+import sys
+import os
+import json
+import time
+import pathlib
+import argparse
+import asyncio
+import threading
+import concurrent.futures
+
+HERE = pathlib.Path(__file__).absolute().parent
+sys.path.append(str(HERE.parent / 'src'))
+sys.path.append(str(HERE))
+
+# seconds
+FRAME = 1 / 60
+
+
+def write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view[:1024 * 1024])
+        view = view[written:]
+    os.close(fd)
+
+
+async def ticker(lags: list, stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(FRAME)
+        lags.append(loop.time() - start - FRAME)
+
+
+async def run(mode: str, data: bytes, count: int, codec_name: str):
+    from vicode.lsp import jsonrpc_2_0, codec
+
+    received = 0
+
+    async def on_notification(method, params):
+        pass
+
+    # before the pipes, or the forked worker holds their write ends open
+    executor = None
+    threshold = jsonrpc_2_0.OFFLOAD_THRESHOLD
+    match mode:
+        case 'inline':
+            threshold = None
+        case 'process':
+            executor = concurrent.futures.ProcessPoolExecutor(1)
+            # spawn the worker before measuring
+            executor.submit(int).result()
+
+    r, w = os.pipe()
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=2**26)
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(r, 'rb'))
+
+    # outbound side is unused
+    _, unused = os.pipe()
+    transport, protocol = await loop.connect_write_pipe(
+        asyncio.streams.FlowControlMixin, os.fdopen(unused, 'wb'))
+    writer = jsonrpc_2_0.MessageWriter(
+        asyncio.StreamWriter(transport, protocol, None, loop), codec.get_codec(codec_name))
+
+    dispatcher = jsonrpc_2_0.RpcDispatcher(on_notification, writer,
+                                           offload_threshold=threshold, executor=executor)
+
+    async def process_response_async(message_id, result):
+        nonlocal received
+        received += 1
+    dispatcher.process_response_async = process_response_async
+
+    lags = []
+    stop = asyncio.Event()
+    tick = loop.create_task(ticker(lags, stop))
+    await asyncio.sleep(FRAME * 3)
+    lags.clear()
+
+    thread = threading.Thread(target=write_all, args=(w, data * count))
+    start = time.perf_counter()
+    thread.start()
+    while await dispatcher.read_rpc_message_async(reader):
+        pass
+    elapsed = time.perf_counter() - start
+    thread.join()
+    stop.set()
+    await tick
+    if executor:
+        executor.shutdown()
+
+    assert received == count, received
+    lags.sort()
+    p50 = lags[len(lags) // 2] * 1000
+    p99 = lags[min(len(lags) - 1, len(lags) * 99 // 100)] * 1000
+    print(f'{mode:8} total {elapsed * 1000:8.1f} ms  frames {len(lags):4}  '
+          f'lag p50 {p50:7.1f} p99 {p99:7.1f} max {lags[-1] * 1000:7.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=40000,
+                        help='completion items per response')
+    parser.add_argument('--count', type=int, default=4)
+    parser.add_argument('--codec', default=None)
+    args = parser.parse_args()
+
+    from bench_codec import make_completion
+    body = json.dumps(make_completion(args.items)).encode('utf-8')
+    data = f'Content-Length: {len(body)}\r\n\r\n'.encode('ascii') + body
+    print(f'{args.count} x {len(body) / 1024 / 1024:.1f} MiB completion response')
+    for mode in ('inline', 'thread', 'process'):
+        asyncio.run(run(mode, data, args.count, args.codec))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+'''
+messages per second through RpcDispatcher on a local pipe.
+
+python benchmarks/bench_framer.py [--count N] [--size BYTES]
+'''
+import sys
+import os
+import json
+import time
+import pathlib
+import argparse
+import asyncio
+import threading
+
+HERE = pathlib.Path(__file__).absolute().parent
+sys.path.append(str(HERE.parent / 'src'))
+
+
+def make_frames(count: int, size: int) -> bytes:
+    body = json.dumps({
+        'jsonrpc': '2.0',
+        'method': 'textDocument/publishDiagnostics',
+        'params': {'uri': 'file:///bench.py', 'diagnostics': [], 'pad': 'x' * size},
+    }).encode('utf-8')
+    return (f'Content-Length: {len(body)}\r\n\r\n'.encode('ascii') + body) * count
+
+
+def write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view[:1024 * 1024])
+        view = view[written:]
+    os.close(fd)
+
+
+async def run(count: int, size: int):
+    from vicode.lsp import jsonrpc_2_0
+    data = make_frames(count, size)
+
+    received = 0
+
+    async def on_notification(method, params):
+        nonlocal received
+        received += 1
+
+    r, w = os.pipe()
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=2**26)
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(r, 'rb'))
+
+    # outbound side is unused
+    _, unused = os.pipe()
+    transport, protocol = await loop.connect_write_pipe(
+        asyncio.streams.FlowControlMixin, os.fdopen(unused, 'wb'))
+    dispatcher = jsonrpc_2_0.RpcDispatcher(on_notification, jsonrpc_2_0.MessageWriter(
+        asyncio.StreamWriter(transport, protocol, None, loop)))
+    writer = threading.Thread(target=write_all, args=(w, data))
+
+    start = time.perf_counter()
+    writer.start()
+    while await dispatcher.read_rpc_message_async(reader):
+        pass
+    elapsed = time.perf_counter() - start
+    writer.join()
+
+    assert received == count, received
+    print(f'size={size:>8} count={count:>7} {count / elapsed:12.0f} msg/s '
+          f'{len(data) / elapsed / 1024 / 1024:8.1f} MiB/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=0)
+    parser.add_argument('--size', type=int, nargs='*',
+                        default=[64, 1024, 64 * 1024, 4 * 1024 * 1024])
+    args = parser.parse_args()
+    for size in args.size:
+        count = args.count or max(8, min(200000, 64 * 1024 * 1024 // (size + 128)))
+        asyncio.run(run(count, size))
+
+
+if __name__ == '__main__':
+    main()
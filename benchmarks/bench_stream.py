@@ -0,0 +1,112 @@
+'''
+time to first item and peak memory of a large completion response,
+decoded as a whole or parsed while it arrives.
+
+python benchmarks/bench_stream.py [--items N]
+'''
+import sys
+import os
+import json
+import time
+import pathlib
+import argparse
+import asyncio
+import threading
+import tracemalloc
+
+HERE = pathlib.Path(__file__).absolute().parent
+sys.path.append(str(HERE.parent / 'src'))
+sys.path.append(str(HERE))
+
+
+def write_all(fd: int, data: bytes):
+    view = memoryview(data)
+    while view:
+        # pace like a pipe from a busy server
+        written = os.write(fd, view[:64 * 1024])
+        view = view[written:]
+        time.sleep(0.0005)
+    os.close(fd)
+
+
+async def run(mode: str, data: bytes, memory: bool):
+    from vicode.lsp import jsonrpc_2_0
+
+    async def on_notification(method, params):
+        pass
+
+    r, w = os.pipe()
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=2**26)
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(r, 'rb'))
+
+    # outbound side is unused
+    _, unused = os.pipe()
+    transport, protocol = await loop.connect_write_pipe(
+        asyncio.streams.FlowControlMixin, os.fdopen(unused, 'wb'))
+    dispatcher = jsonrpc_2_0.RpcDispatcher(on_notification, jsonrpc_2_0.MessageWriter(
+        asyncio.StreamWriter(transport, protocol, None, loop)), offload_threshold=None)
+    if mode == 'whole':
+        dispatcher.stream_threshold = len(data)
+
+    first = None
+    count = 0
+    labels = set()
+
+    def on_item(item):
+        nonlocal first, count
+        if first is None:
+            first = time.perf_counter()
+        count += 1
+        # keep a little of each item, as a completion menu would
+        labels.add(item['label'])
+
+    async def read():
+        while await dispatcher.read_rpc_message_async(reader):
+            pass
+
+    if memory:
+        tracemalloc.start()
+    request = loop.create_task(dispatcher.request_stream_async(
+        'textDocument/completion', None, on_item, timeout=None))
+    await asyncio.sleep(0)
+    thread = threading.Thread(target=write_all, args=(w, data))
+    start = time.perf_counter()
+    thread.start()
+    read_task = loop.create_task(read())
+    await request
+    elapsed = time.perf_counter() - start
+    thread.join()
+    await read_task
+    assert count == len(labels)
+
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f'{mode:8} peak {peak / 1024 / 1024:6.1f} MiB')
+    else:
+        print(f'{mode:8} items {count}  first item {(first - start) * 1000:8.1f} ms  '
+              f'total {elapsed * 1000:8.1f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=20000)
+    args = parser.parse_args()
+
+    from bench_codec import make_completion
+    message = make_completion(args.items)
+    # id of the first request
+    message['id'] = 1
+    body = json.dumps(message).encode('utf-8')
+    data = f'Content-Length: {len(body)}\r\n\r\n'.encode('ascii') + body
+    print(f'{len(body) / 1024 / 1024:.1f} MiB completion response')
+    # tracemalloc slows allocation, so memory is measured in a separate pass
+    for memory in (False, True):
+        for mode in ('whole', 'stream'):
+            asyncio.run(run(mode, data, memory))
+
+
+if __name__ == '__main__':
+    main()
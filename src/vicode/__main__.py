@@ -1,3 +1,5 @@
+from typing import Optional
+import sys
 import asyncio
 import logging
 import pathlib
@@ -12,7 +14,15 @@ import prompt_toolkit.enums
 
 
 class App:
-    def __init__(self) -> None:
+    def __init__(self, shared_lsp: bool = False, lsp_idle_timeout: Optional[float] = None,
+                 lsp_warm_up: bool = True) -> None:
+        '''
+        lsp_warm_up: launch the language servers of the workspace while the UI starts
+        '''
+        self.lsp_warm_up = lsp_warm_up
+        self._warm_up: Optional[asyncio.Task] = None
+        # WorkSpace.shutdown_async report of the exit
+        self.teardown: Optional[dict] = None
         self.kb = prompt_toolkit.key_binding.KeyBindings()
         from .layout.root import RootLayout
         from .layout.style import STYLE
@@ -48,7 +58,23 @@ class App:
         DISPATCHER.register(EventType.BufferFocusCommand, on_focus)
 
         from .workspace import WorkSpace
-        self.workspace = WorkSpace(pathlib.Path('.'))
+        self.workspace = WorkSpace(pathlib.Path('.'), shared_lsp=shared_lsp,
+                                   idle_timeout=lsp_idle_timeout)
+
+        self._input_mode = None
+        self.application.before_render += self._on_before_render
+        self.application.after_render += self._on_after_render
+
+    def _on_before_render(self, application: prompt_toolkit.Application):
+        # edits are sent when leaving insert mode
+        input_mode = application.vi_state.input_mode
+        if input_mode != self._input_mode:
+            self._input_mode = input_mode
+            self.root.editor.flush_changes()
+
+    def _on_after_render(self, application: prompt_toolkit.Application):
+        # scrolled or resized
+        self.root.editor.on_render()
 
     def _bind(self, callback, *args):
         from prompt_toolkit.filters import vi_navigation_mode
@@ -75,8 +101,20 @@ class App:
             self.application.vi_state.input_mode = prompt_toolkit.key_binding.vi_state.InputMode.NAVIGATION
 
             self.workspace.loop = self.application.loop
+            if self.lsp_warm_up:
+                self._warm_up = self.application.loop.create_task(
+                    self.workspace.warm_up_async())
 
-        await self.application.run_async(pre_run=pre_run)
+        try:
+            await self.application.run_async(pre_run=pre_run)
+        finally:
+            # no server outlives the editor
+            self.teardown = await self.shutdown_async()
+
+    async def shutdown_async(self) -> dict:
+        if self._warm_up:
+            self._warm_up.cancel()
+        return await self.workspace.shutdown_async()
 
 
 async def main():
@@ -84,15 +122,34 @@ async def main():
 
     parser = argparse.ArgumentParser()
     parser.add_argument("location", nargs="*")
+    parser.add_argument("--lsp-stats", type=pathlib.Path,
+                        help="dump lsp latency and size stats as json at exit")
+    parser.add_argument("--shared-lsp", action="store_true",
+                        help="share language servers with other vicode processes")
+    parser.add_argument("--lsp-idle-timeout", type=float, default=30 * 60,
+                        help="seconds without use to stop a language server. 0: never")
+    parser.add_argument("--no-lsp-warm-up", action="store_true",
+                        help="launch a language server when its first document opens")
     args = parser.parse_args()
 
-    app = App()
+    app = App(shared_lsp=args.shared_lsp,
+              lsp_idle_timeout=args.lsp_idle_timeout or None,
+              lsp_warm_up=not args.no_lsp_warm_up)
     from .event import EventType, DISPATCHER
     for location in args.location:
         DISPATCHER.enqueue(EventType.OpenCommand,
                            pathlib.Path(location).absolute())
     await app.run_async()
 
+    if app.teardown and app.teardown['servers']:
+        print(f'language servers stopped in {app.teardown["seconds"]:.2f}s: {app.teardown["servers"]}',
+              file=sys.stderr)
+
+    if args.lsp_stats:
+        import json
+        args.lsp_stats.write_text(json.dumps(
+            app.workspace.get_lsp_stats(), indent=2))
+
 
 if __name__ == '__main__':
     asyncio.run(main())
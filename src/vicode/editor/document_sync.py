@@ -0,0 +1,97 @@
+'''
+textDocument/didChange from EditorDocument.buffer edits.
+
+The text last sent to the server is kept. A change is the span between
+the common prefix and the common suffix of that text and the buffer,
+so its size follows the edit, not the file. Positions are UTF-16 code
+units as LSP requires.
+'''
+from typing import List, Tuple
+from ..lsp import protocol
+
+
+def common_prefix_length(a: str, b: str) -> int:
+    '''
+    binary search with C level compares. O(n) chars copied in total
+    '''
+    lo = 0
+    hi = min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a.startswith(b[lo:mid], lo):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def common_suffix_length(a: str, b: str, limit: int) -> int:
+    lo = 0
+    hi = min(len(a), len(b), limit)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a.endswith(b[len(b) - mid:len(b) - lo], 0, len(a) - lo):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def utf16_length(text: str) -> int:
+    if text.isascii():
+        return len(text)
+    return len(text.encode('utf-16-le')) // 2
+
+
+def to_position(text: str, index: int) -> protocol.Position:
+    line_start = text.rfind('\n', 0, index) + 1
+    return protocol.Position(
+        line=text.count('\n', 0, line_start),
+        character=utf16_length(text[line_start:index]))
+
+
+def diff_range(old: str, new: str) -> Tuple[int, int, int]:
+    '''
+    return (start, old_end, new_end). old[start:old_end] became new[start:new_end]
+    '''
+    start = common_prefix_length(old, new)
+    suffix = common_suffix_length(old, new, min(len(old), len(new)) - start)
+    return start, len(old) - suffix, len(new) - suffix
+
+
+class DocumentSync:
+    '''
+    version and text of one document as the server knows it.
+    '''
+
+    def __init__(self) -> None:
+        self.version = 0
+        self._text = ''
+
+    def open(self, text: str) -> int:
+        '''
+        text is sent with didOpen. return its version
+        '''
+        self.version += 1
+        self._text = text
+        return self.version
+
+    def changes(self, text: str, full: bool = False) -> List[protocol.TextDocumentContentChangeEvent]:
+        '''
+        changes from the last synced text to text, and version is increased.
+        empty if nothing changed.
+        '''
+        old = self._text
+        if text == old:
+            return []
+        self.version += 1
+        self._text = text
+        if full:
+            return [protocol.TextDocumentContentChangeEvent(text=text)]
+
+        start, old_end, new_end = diff_range(old, text)
+        return [protocol.TextDocumentContentChangeEvent(
+            range=protocol.Range(
+                start=to_position(old, start),
+                end=to_position(old, old_end)),
+            text=text[start:new_end])]
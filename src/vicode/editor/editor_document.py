@@ -1,6 +1,7 @@
-from typing import Optional
+from typing import Optional, Callable
 import logging
 import re
+import asyncio
 import pathlib
 import nerdfonts
 from prompt_toolkit.application.current import get_app
@@ -29,15 +30,22 @@ FILE_TYPE_MAP = {
     '.py': 'python',
 }
 
+# seconds. edits within this are sent to the language server as one change
+CHANGE_DELAY = 0.3
+
 
 class DocumentWordsCompleter(prompt_toolkit.completion.Completer):
     """
     Completer that completes on words that appear already in the open document.
-
-    TODO: LSP
+    The fallback of lsp_completer.LspCompleter.
     """
 
+    def __init__(self, on_trigger: Optional[Callable[[], None]] = None) -> None:
+        self.on_trigger = on_trigger
+
     def get_completions(self, document, complete_event):
+        if self.on_trigger:
+            self.on_trigger()
         word_before_cursor = document.get_word_before_cursor()
 
         # Create a set of words that could be a possible completion.
@@ -56,16 +64,36 @@ class DocumentWordsCompleter(prompt_toolkit.completion.Completer):
 class EditorDocument:
     def __init__(self, location: pathlib.Path, kb: prompt_toolkit.key_binding.KeyBindings) -> None:
         self.location = location
+        # workspace.ClientHandler. set when activated
+        self.lsp = None
+        from .lsp_completer import LspCompleter
+        self.completer = LspCompleter(
+            self, DocumentWordsCompleter(on_trigger=self.flush_changes))
         self.buffer = prompt_toolkit.buffer.Buffer(
-            completer=DocumentWordsCompleter()
+            completer=self.completer,
+            # keep filtering while typing once the menu was opened
+            complete_while_typing=prompt_toolkit.filters.Condition(
+                lambda: self.completer.in_session(self.buffer.document)),
         )
         self.has_focus = prompt_toolkit.filters.has_focus(self.buffer)
+        from .semantic_tokens import SemanticTokens, SemanticTokensLexer
+        self.semantic_tokens = SemanticTokens()
+        from .viewport import Viewport, RangeData, RangeDataProcessor
+        self.viewport = Viewport(self._on_viewport_changed)
+        self.range_data = RangeData()
         self.control = prompt_toolkit.layout.BufferControl(
-            self.buffer, lexer=create_lexer(location))
+            self.buffer, lexer=SemanticTokensLexer(self.semantic_tokens, create_lexer(location)),
+            input_processors=[RangeDataProcessor(self.range_data)])
         self.container = prompt_toolkit.layout.Window(self.control, left_margins=[
             prompt_toolkit.layout.NumberedMargin(),
         ])
         self.buffer.text = location.read_text()
+        from .document_sync import DocumentSync
+        self.sync = DocumentSync()
+        self.change_delay = CHANGE_DELAY
+        self._change_handle: Optional[asyncio.TimerHandle] = None
+        self.buffer.on_text_changed += self._on_text_changed
+        self.completer.attach(self.buffer)
 
         self.ft = FILE_TYPE_MAP[location.suffix.lower()]
 
@@ -88,6 +116,41 @@ class EditorDocument:
         self.kb = kb
         self._bind(self.apply_formatter, "escape", "F")
 
+    def _on_text_changed(self, _):
+        # restart the idle timer
+        if self._change_handle:
+            self._change_handle.cancel()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_changes()
+            return
+        self._change_handle = loop.call_later(
+            self.change_delay, self.flush_changes)
+
+    def flush_changes(self):
+        '''
+        send the edits since the last flush as one didChange now.
+        on idle, save, completion and mode switch.
+        '''
+        if self._change_handle:
+            self._change_handle.cancel()
+            self._change_handle = None
+        from ..event import EventType, DISPATCHER
+        DISPATCHER.dispatch(EventType.DocumentChanged, self)
+
+    def on_render(self):
+        self.viewport.on_render(self.container.render_info)
+
+    def _on_viewport_changed(self):
+        from ..event import EventType, DISPATCHER
+        DISPATCHER.dispatch(EventType.ViewportChanged, self)
+
+    def save(self):
+        self.location.write_text(self.buffer.text)
+        logger.info(f'save: {self.location}')
+        self.flush_changes()
+
     def _bind(self, callback, *args):
         from prompt_toolkit.filters import vi_navigation_mode
         self.kb.add(
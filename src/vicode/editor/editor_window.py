@@ -20,6 +20,7 @@ class EditorWindow(TabWindow):
 
         from ..event import EventType, DISPATCHER
         DISPATCHER.register(EventType.OpenCommand, self.open_location)
+        DISPATCHER.register(EventType.SaveCommand, self.save)
 
     def open_location(self, item):
         if isinstance(item, pathlib.Path):
@@ -42,6 +43,22 @@ class EditorWindow(TabWindow):
 
         self.add(tab)
 
+    def save(self, _=None):
+        from .editor_document import EditorDocument
+        if isinstance(self._active, EditorDocument):
+            self._active.save()
+
+    def flush_changes(self):
+        from .editor_document import EditorDocument
+        for tab in self._tabs:
+            if isinstance(tab, EditorDocument):
+                tab.flush_changes()
+
+    def on_render(self):
+        from .editor_document import EditorDocument
+        if isinstance(self._active, EditorDocument):
+            self._active.on_render()
+
     def on_activated(self):
         if self._active is None:
             return
@@ -0,0 +1,272 @@
+'''
+textDocument/completion with a client side filter.
+
+The server is asked once per completion session, that is per word start.
+While the word grows, the cached items are filtered and ranked here, each
+new prefix narrowing the previous matches. The server is asked again only
+if it answered isIncomplete, or the cursor left the word.
+
+detail and documentation are resolved (completionItem/resolve) only for
+the focused item. Moving the focus supersedes the resolve in flight, and
+resolved items are kept for the session.
+'''
+from typing import Optional, List, Tuple, Dict, Any
+import re
+import asyncio
+import logging
+from prompt_toolkit.application.current import get_app
+import prompt_toolkit.buffer
+import prompt_toolkit.completion
+import prompt_toolkit.document
+from ..lsp import protocol
+from .document_sync import utf16_length
+
+logger = logging.getLogger(__name__)
+
+# identifier before the cursor
+WORD = re.compile(r'\w*$')
+
+
+def get_word_before_cursor(document: prompt_toolkit.document.Document) -> str:
+    match = WORD.search(document.current_line_before_cursor)
+    assert(match)
+    return match.group()
+
+
+def rank(prefix: str, lower_prefix: str, text: str, lower: str) -> Optional[int]:
+    '''
+    0: prefix, 1: prefix ignoring case, 2: subsequence ignoring case. None if no match
+    '''
+    if text.startswith(prefix):
+        return 0
+    if lower.startswith(lower_prefix):
+        return 1
+    it = iter(lower)
+    if all(c in it for c in lower_prefix):
+        return 2
+    return None
+
+
+class CompletionSession:
+    '''
+    one completion response for the word starting at (line, start)
+    '''
+
+    def __init__(self, line: int, start: int, result: Any) -> None:
+        self.line = line
+        self.start = start
+        if isinstance(result, dict):
+            items = result.get('items') or []
+            self.is_incomplete = bool(result.get('isIncomplete'))
+        else:
+            items = result or []
+            self.is_incomplete = False
+        # (filter text, lowered, sort text, item)
+        self._entries: List[Tuple[str, str, str, dict]] = []
+        for item in items:
+            text = item.get('filterText') or item['label']
+            self._entries.append(
+                (text, text.lower(), item.get('sortText') or item['label'], item))
+        self._prefix: Optional[str] = None
+        self._matches = self._entries
+        # id(item) => completionItem/resolve result
+        self.resolved: Dict[int, dict] = {}
+
+    def covers(self, line: int, start: int) -> bool:
+        return line == self.line and start == self.start
+
+    def filter(self, prefix: str) -> List[dict]:
+        '''
+        items matching prefix, best first
+        '''
+        if self._prefix is None or not prefix.startswith(self._prefix):
+            # a longer prefix matches a subset. otherwise start over
+            self._matches = self._entries
+        lower_prefix = prefix.lower()
+        ranked = []
+        matches = []
+        for entry in self._matches:
+            r = rank(prefix, lower_prefix, entry[0], entry[1])
+            if r is not None:
+                ranked.append((r, entry[2], entry[3]))
+                matches.append(entry)
+        self._prefix = prefix
+        self._matches = matches
+        ranked.sort(key=lambda x: (x[0], x[1]))
+        return [item for _, _, item in ranked]
+
+
+class LspCompletion(prompt_toolkit.completion.Completion):
+    def __init__(self, item: dict, text: str, start_position: int, display_meta: str,
+                 resolved: bool = False) -> None:
+        super().__init__(text, start_position=start_position,
+                         display=item['label'], display_meta=display_meta)
+        # as listed in the session
+        self.item = item
+        self.resolved = resolved
+
+
+def get_meta(item: dict) -> str:
+    '''
+    detail and the first line of documentation
+    '''
+    documentation = item.get('documentation')
+    if isinstance(documentation, dict):
+        documentation = documentation.get('value')
+    meta = [item.get('detail') or '']
+    if documentation:
+        meta.append(documentation.strip().split('\n', 1)[0])
+    return ' '.join(m for m in meta if m)
+
+
+def to_completion(item: dict, prefix: str) -> LspCompletion:
+    text_edit = item.get('textEdit')
+    if text_edit:
+        text = text_edit['newText']
+    else:
+        text = item.get('insertText') or item['label']
+    return LspCompletion(item, text, -len(prefix), get_meta(item))
+
+
+class LspCompleter(prompt_toolkit.completion.Completer):
+    '''
+    completion of an EditorDocument by its language server.
+    falls back to the words in the document if there is no server.
+    '''
+
+    def __init__(self, editor_document, fallback: prompt_toolkit.completion.Completer) -> None:
+        self.editor_document = editor_document
+        self.fallback = fallback
+        self.session: Optional[CompletionSession] = None
+        self.request_count = 0
+        self.resolve_count = 0
+
+    def _get_handler(self):
+        handler = self.editor_document.lsp
+        if not handler:
+            return
+        # typing relaunches an idle server
+        handler.on_used()
+        if handler.ready and handler.client.server_capabilities.get('completionProvider'):
+            return handler
+
+    def attach(self, buffer: prompt_toolkit.buffer.Buffer):
+        '''
+        follow the focused completion of buffer
+        '''
+        buffer.on_completions_changed += self._on_focus_changed
+        # moving the focus replaces the text
+        buffer.on_text_changed += self._on_focus_changed
+
+    def _on_focus_changed(self, buffer: prompt_toolkit.buffer.Buffer):
+        # complete_state is set after the events
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        loop.call_soon(self.resolve_focused, buffer)
+
+    def resolve_focused(self, buffer: prompt_toolkit.buffer.Buffer):
+        state = buffer.complete_state
+        completion = state.current_completion if state else None
+        if not isinstance(completion, LspCompletion) or completion.resolved:
+            return
+        handler = self._get_handler()
+        session = self.session
+        if not handler or not session:
+            return
+        if not handler.client.server_capabilities['completionProvider'].get('resolveProvider'):
+            return
+        item = completion.item
+        resolved = session.resolved.get(id(item))
+        if resolved:
+            self._apply(buffer, item, resolved)
+            return
+        self.resolve_count += 1
+        future = handler.resolve_completion(item)
+
+        def on_done(future: asyncio.Future):
+            if future.cancelled():
+                # focus moved on
+                return
+            try:
+                resolved = future.result()
+            except Exception as e:
+                logger.warning(f'completionItem/resolve: {e}')
+                return
+            if resolved:
+                session.resolved[id(item)] = resolved
+                self._apply(buffer, item, resolved)
+        future.add_done_callback(on_done)
+
+    def _apply(self, buffer: prompt_toolkit.buffer.Buffer, item: dict, resolved: dict):
+        state = buffer.complete_state
+        completion = state.current_completion if state else None
+        if not isinstance(completion, LspCompletion) or completion.item is not item:
+            return
+        assert(state and state.complete_index is not None)
+        state.completions[state.complete_index] = LspCompletion(
+            item, completion.text, completion.start_position, get_meta(resolved), resolved=True)
+        get_app().invalidate()
+
+    def in_session(self, document: prompt_toolkit.document.Document) -> bool:
+        '''
+        the cursor is still in the word of the last completion
+        '''
+        session = self.session
+        if not session or not self._get_handler():
+            return False
+        start = document.cursor_position_col - \
+            len(get_word_before_cursor(document))
+        return session.covers(document.cursor_position_row, start)
+
+    def get_completions(self, document, complete_event):
+        # synchronous path. the cache only
+        if not self._get_handler():
+            yield from self.fallback.get_completions(document, complete_event)
+            return
+        prefix = get_word_before_cursor(document)
+        if self.in_session(document):
+            assert(self.session)
+            for item in self.session.filter(prefix):
+                yield to_completion(item, prefix)
+
+    async def get_completions_async(self, document, complete_event):
+        handler = self._get_handler()
+        if not handler:
+            for completion in self.fallback.get_completions(document, complete_event):
+                yield completion
+            return
+
+        line = document.cursor_position_row
+        prefix = get_word_before_cursor(document)
+        start = document.cursor_position_col - len(prefix)
+        session = self.session
+        if not session or not session.covers(line, start) or session.is_incomplete:
+            trigger_kind = 3 if session and session.covers(line, start) else 1
+            # the server sees the text the position refers to
+            self.editor_document.flush_changes()
+            future = handler.request_completion(
+                self.editor_document.location,
+                protocol.Position(line=line, character=utf16_length(
+                    document.current_line_before_cursor)),
+                trigger_kind)
+            self.request_count += 1
+            try:
+                await asyncio.wait([future])
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            if future.cancelled():
+                # superseded by a newer completion
+                return
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.warning(f'completion: {e}')
+                return
+            session = CompletionSession(line, start, result)
+            self.session = session
+
+        for item in session.filter(prefix):
+            yield to_completion(item, prefix)
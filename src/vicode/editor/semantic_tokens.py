@@ -0,0 +1,205 @@
+'''
+semantic tokens of a document, for highlighting.
+
+The tokens are kept as the server encodes them, five unsigned ints each
+(deltaLine, deltaStart, length, tokenType, tokenModifiers) in one
+array('I'). semanticTokens/full/delta edits are applied to it in place.
+After an update the index of the first token of each line is rebuilt, so
+a rendered line finds its tokens in O(1).
+'''
+from typing import Optional, List, Tuple, Callable
+from array import array
+import itertools
+import prompt_toolkit.document
+import prompt_toolkit.lexers
+import prompt_toolkit.formatted_text
+
+TOKEN_SIZE = 5
+
+# SemanticTokenTypes of the specification
+TOKEN_TYPES = [
+    'namespace', 'type', 'class', 'enum', 'interface', 'struct', 'typeParameter',
+    'parameter', 'variable', 'property', 'enumMember', 'event', 'function',
+    'method', 'macro', 'keyword', 'modifier', 'comment', 'string', 'number',
+    'regexp', 'operator', 'decorator',
+]
+
+# (start, end, style) in str indices of the line
+Span = Tuple[int, int, str]
+
+
+def utf16_offsets(line: str) -> List[int]:
+    '''
+    str index of each UTF-16 offset, and of the end
+    '''
+    offsets = []
+    for i, c in enumerate(line):
+        offsets.append(i)
+        if ord(c) > 0xFFFF:
+            # surrogate pair
+            offsets.append(i)
+    offsets.append(len(line))
+    return offsets
+
+
+def overlay(fragments: prompt_toolkit.formatted_text.StyleAndTextTuples,
+            spans: List[Span]) -> prompt_toolkit.formatted_text.StyleAndTextTuples:
+    '''
+    add the span styles to the fragments of a line. spans are sorted
+    '''
+    result: prompt_toolkit.formatted_text.StyleAndTextTuples = []
+    pos = 0
+    i = 0
+    for fragment in fragments:
+        style, text = fragment[0], fragment[1]
+        end = pos + len(text)
+        while text:
+            while i < len(spans) and spans[i][1] <= pos:
+                i += 1
+            if i == len(spans) or spans[i][0] >= end:
+                result.append((style, text))
+                break
+            start, span_end, span_style = spans[i]
+            if start > pos:
+                # before the span
+                cut = start - pos
+                result.append((style, text[:cut]))
+            else:
+                cut = min(span_end, end) - pos
+                result.append((f'{style} {span_style}', text[:cut]))
+            text = text[cut:]
+            pos += cut
+        pos = end
+    return result
+
+
+class SemanticTokens:
+    def __init__(self) -> None:
+        self.data = array('I')
+        # of the last full or delta result
+        self.result_id: Optional[str] = None
+        # class per legend.tokenTypes index
+        self._styles: List[str] = []
+        self.legend: Optional[dict] = None
+        # line => its first token. tokens of a line are index[line]:index[line + 1]
+        self._index = array('I')
+        # changes on each update, for the lexer cache
+        self.generation = 0
+
+    def set_legend(self, legend: dict):
+        if legend is self.legend:
+            return
+        self.legend = legend
+        self._styles = [f'class:semantic.{token_type}'
+                        for token_type in legend.get('tokenTypes', [])]
+        self.generation += 1
+
+    def clear(self):
+        self.data = array('I')
+        self.result_id = None
+        self._index = array('I')
+        self.generation += 1
+
+    def update(self, result: Optional[dict]):
+        '''
+        SemanticTokens or SemanticTokensDelta result
+        '''
+        if not result:
+            return
+        edits = result.get('edits')
+        if edits is not None:
+            # starts refer to the data before the edits
+            for edit in sorted(edits, key=lambda edit: edit['start'], reverse=True):
+                start = edit['start']
+                self.data[start:start + edit['deleteCount']
+                          ] = array('I', edit.get('data') or [])
+        else:
+            self.data = array('I', result['data'])
+        self.result_id = result.get('resultId')
+        self._build_index()
+        self.generation += 1
+
+    def _build_index(self):
+        delta_lines = self.data[0::TOKEN_SIZE]
+        index = array('I')
+        if delta_lines:
+            index.append(0)
+        # only the first token of each line is visited
+        for token in itertools.compress(itertools.count(), delta_lines):
+            delta_line = delta_lines[token]
+            if delta_line == 1:
+                index.append(token)
+            else:
+                # the skipped lines have no tokens
+                index.extend([token] * delta_line)
+        if index:
+            index.append(len(delta_lines))
+        self._index = index
+
+    @property
+    def token_count(self) -> int:
+        return len(self.data) // TOKEN_SIZE
+
+    def get_line_tokens(self, line: int) -> List[Tuple[int, int, int, int]]:
+        '''
+        (start, length, type, modifiers) in UTF-16 units
+        '''
+        index = self._index
+        if line + 1 >= len(index):
+            return []
+        data = self.data
+        tokens = []
+        start = 0
+        for token in range(index[line], index[line + 1]):
+            i = token * TOKEN_SIZE
+            # the first of a line is from the line start
+            start = data[i + 1] if token == index[line] else start + data[i + 1]
+            tokens.append((start, data[i + 2], data[i + 3], data[i + 4]))
+        return tokens
+
+    def get_line_spans(self, line: int, text: str) -> List[Span]:
+        tokens = self.get_line_tokens(line)
+        if not tokens:
+            return []
+        offsets = None if text.isascii() else utf16_offsets(text)
+        spans = []
+        for start, length, token_type, _ in tokens:
+            if token_type >= len(self._styles):
+                continue
+            end = start + length
+            if offsets:
+                if end >= len(offsets):
+                    continue
+                start, end = offsets[start], offsets[end]
+            elif end > len(text):
+                # stale tokens of an edited line
+                continue
+            spans.append((start, end, self._styles[token_type]))
+        return spans
+
+
+class SemanticTokensLexer(prompt_toolkit.lexers.Lexer):
+    '''
+    fallback lexer with the semantic token classes on top
+    '''
+
+    def __init__(self, tokens: SemanticTokens, fallback: prompt_toolkit.lexers.Lexer) -> None:
+        self.tokens = tokens
+        self.fallback = fallback
+
+    def lex_document(self, document: prompt_toolkit.document.Document) -> Callable[[int], prompt_toolkit.formatted_text.StyleAndTextTuples]:
+        get_fallback_line = self.fallback.lex_document(document)
+        lines = document.lines
+
+        def get_line(lineno: int) -> prompt_toolkit.formatted_text.StyleAndTextTuples:
+            fragments = get_fallback_line(lineno)
+            if lineno >= len(lines):
+                return fragments
+            spans = self.tokens.get_line_spans(lineno, lines[lineno])
+            if not spans:
+                return fragments
+            return overlay(fragments, spans)
+        return get_line
+
+    def invalidation_hash(self):
+        return (self.fallback.invalidation_hash(), self.tokens.generation)
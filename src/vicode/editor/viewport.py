@@ -0,0 +1,147 @@
+'''
+LSP data of the lines on screen.
+
+Viewport follows the visible lines of an EditorDocument window from its
+render_info. When a scroll or resize leaves the requested range, the new
+range is requested after VIEWPORT_DELAY of quiet: the visible lines and a
+page of margin on each side. semanticTokens/range, inlayHint and codeLens
+results then replace the previous ones, so data outside the range is
+dropped. A large file costs what is on screen.
+'''
+from typing import Optional, Callable, Tuple, Dict, List
+import asyncio
+import prompt_toolkit.layout
+import prompt_toolkit.layout.processors
+import prompt_toolkit.layout.utils
+from .semantic_tokens import utf16_offsets
+
+# seconds
+VIEWPORT_DELAY = 0.1
+
+
+class Viewport:
+    def __init__(self, on_changed: Callable[[], None], delay: float = VIEWPORT_DELAY) -> None:
+        self.on_changed = on_changed
+        self.delay = delay
+        # (first, last) line on screen
+        self.visible: Optional[Tuple[int, int]] = None
+        # (first, last) line of the range data
+        self.requested: Optional[Tuple[int, int]] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+
+    def on_render(self, render_info: Optional[prompt_toolkit.layout.WindowRenderInfo]):
+        if render_info:
+            self.update(render_info.first_visible_line(),
+                        render_info.last_visible_line())
+
+    def update(self, first: int, last: int):
+        if (first, last) == self.visible:
+            return
+        self.visible = (first, last)
+        if self.requested and self.requested[0] <= first and last <= self.requested[1]:
+            return
+        # wait for the scroll to settle
+        if self._handle:
+            self._handle.cancel()
+        self._handle = asyncio.get_running_loop().call_later(self.delay, self.flush)
+
+    def flush(self):
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+        if not self.visible:
+            return
+        first, last = self.visible
+        margin = last - first + 1
+        self.requested = (max(0, first - margin), last + margin)
+        self.on_changed()
+
+
+class RangeData:
+    '''
+    inlay hints and code lenses of Viewport.requested
+    '''
+
+    def __init__(self) -> None:
+        # line => [(character, label)]. UTF-16 characters
+        self.inlay_hints: Dict[int, List[Tuple[int, str]]] = {}
+        # line => titles
+        self.code_lenses: Dict[int, List[str]] = {}
+
+    def set_inlay_hints(self, hints: Optional[list], first: int, last: int):
+        inlay_hints: Dict[int, List[Tuple[int, str]]] = {}
+        for hint in hints or []:
+            position = hint['position']
+            if not first <= position['line'] <= last:
+                continue
+            label = hint['label']
+            if isinstance(label, list):
+                label = ''.join(part['value'] for part in label)
+            if hint.get('paddingLeft'):
+                label = ' ' + label
+            if hint.get('paddingRight'):
+                label = label + ' '
+            inlay_hints.setdefault(position['line'], []).append(
+                (position['character'], label))
+        for line_hints in inlay_hints.values():
+            line_hints.sort()
+        self.inlay_hints = inlay_hints
+
+    def set_code_lenses(self, lenses: Optional[list], first: int, last: int):
+        code_lenses: Dict[int, List[str]] = {}
+        for lens in lenses or []:
+            line = lens['range']['start']['line']
+            command = lens.get('command')
+            if command and first <= line <= last:
+                code_lenses.setdefault(line, []).append(command['title'])
+        self.code_lenses = code_lenses
+
+
+class RangeDataProcessor(prompt_toolkit.layout.processors.Processor):
+    '''
+    inlay hints before their character, code lenses after the line
+    '''
+
+    def __init__(self, data: RangeData) -> None:
+        self.data = data
+
+    def apply_transformation(self, ti: prompt_toolkit.layout.processors.TransformationInput) -> prompt_toolkit.layout.processors.Transformation:
+        hints = self.data.inlay_hints.get(ti.lineno)
+        lenses = self.data.code_lenses.get(ti.lineno)
+        if not hints and not lenses:
+            return prompt_toolkit.layout.processors.Transformation(ti.fragments)
+
+        fragments = prompt_toolkit.layout.utils.explode_text_fragments(
+            ti.fragments)
+        # (index in fragments, label). ascending
+        inserts: List[Tuple[int, str]] = []
+        if hints:
+            line = ti.document.lines[ti.lineno]
+            offsets = None if line.isascii() else utf16_offsets(line)
+            for character, label in hints:
+                if offsets:
+                    character = offsets[min(character, len(offsets) - 1)]
+                inserts.append(
+                    (ti.source_to_display(min(character, len(line))), label))
+            # from the end, so the indices before stay valid
+            for index, label in reversed(inserts):
+                fragments[index:index] = [('class:inlay-hint', label)]
+        if lenses:
+            fragments.append(('class:code-lens', '  ' + ' | '.join(lenses)))
+
+        def source_to_display(i: int) -> int:
+            return i + sum(len(label) for index, label in inserts if index <= i)
+
+        def display_to_source(i: int) -> int:
+            shift = 0
+            for index, label in inserts:
+                if i < index + shift:
+                    break
+                if i < index + shift + len(label):
+                    # on the hint
+                    return index
+                shift += len(label)
+            return i - shift
+
+        return prompt_toolkit.layout.processors.Transformation(
+            fragments, source_to_display=source_to_display, display_to_source=display_to_source)
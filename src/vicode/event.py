@@ -11,10 +11,13 @@ class EventType(Enum):
     # acitive
     OpenCommand = auto()
     BufferFocusCommand = auto()
+    SaveCommand = auto()
     # passive
     Invalidated = auto()
     BufferCreated = auto()
     DocumentActivated = auto()
+    DocumentChanged = auto()
+    ViewportChanged = auto()
     LspLaunched = auto()
 
 
@@ -41,6 +44,9 @@ class EventDispatcher:
         assert(event_type not in self._handlers)
         self._handlers[event_type] = handler
 
+    def unregister(self, event_type: EventType):
+        self._handlers.pop(event_type, None)
+
     def _handle(self, event_type: EventType, palyload: Any) -> bool:
         handler = self._handlers.get(event_type)
         if not handler:
@@ -70,5 +76,11 @@ class EventDispatcher:
     def enqueue(self, event_type: EventType, payload: Any):
         self._queue.put_nowait(EventValue(event_type, payload))
 
+    def dispatch(self, event_type: EventType, payload: Any) -> bool:
+        '''
+        handle now, not after the queued events.
+        '''
+        return self._handle(event_type, payload)
+
 
 DISPATCHER = EventDispatcher()
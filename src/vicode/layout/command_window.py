@@ -23,6 +23,9 @@ class CommandWindow:
             # Execute command.
             if text in ('q', 'qa'):
                 get_app().exit()
+            elif text == 'w':
+                from ..event import EventType, DISPATCHER
+                DISPATCHER.enqueue(EventType.SaveCommand, None)
 
             # clear
             return False
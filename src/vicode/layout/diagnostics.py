@@ -13,7 +13,9 @@ class Diagnostics(JumpList):
 
     def on_diagnostics(self, data: lsp.protocol.PublishDiagnosticsParams):
         location = pathlib.Path(data['uri'])
+        items = []
         for d in data['diagnostics']:
             start = d['range']['start']
-            self.push_item(
+            items.append(
                 JumpItem(location, start['line'], start['character'], d['message']))
+        self.push_items(items)
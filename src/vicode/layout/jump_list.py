@@ -54,8 +54,16 @@ class JumpList:
             *args, filter=(self.has_focus & vi_navigation_mode))(callback)
 
     def push_item(self, item: JumpItem):
-        self._items.append(item)
-        self._text += (item.text.rstrip() + '\n')
+        self.push_items([item])
+
+    def push_items(self, items: List[JumpItem]):
+        '''
+        update the buffer once for all items
+        '''
+        if not items:
+            return
+        self._items.extend(items)
+        self._text += ''.join(item.text.rstrip() + '\n' for item in items)
         self._buffer.read_only = prompt_toolkit.filters.Condition(
             lambda: False)
         self._buffer.text = self._text
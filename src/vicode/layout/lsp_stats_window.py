@@ -0,0 +1,62 @@
+from typing import Dict, Callable
+import prompt_toolkit.layout
+import prompt_toolkit.formatted_text
+
+
+def format_bytes(size: float) -> str:
+    for unit in ('B', 'K', 'M'):
+        if size < 1024:
+            return f'{size:.0f}{unit}'
+        size /= 1024
+    return f'{size:.0f}G'
+
+
+class LspStatsWindow:
+    '''
+    latency and size per method of each language server
+    '''
+
+    def __init__(self) -> None:
+        # name => ClientHandler.get_stats. follows the client over restarts
+        self._clients: Dict[str, Callable[[], dict]] = {}
+        self._control = prompt_toolkit.layout.FormattedTextControl(
+            self.get_text, focusable=True)
+        self.container = prompt_toolkit.layout.Window(self._control)
+
+    def __pt_container__(self) -> prompt_toolkit.layout.Container:
+        return self.container
+
+    def __str__(self) -> str:
+        return 'lsp'
+
+    def add(self, name: str, get_stats: Callable[[], dict]):
+        self._clients[name] = get_stats
+
+    def get_text(self) -> prompt_toolkit.formatted_text.StyleAndTextTuples:
+        text: prompt_toolkit.formatted_text.StyleAndTextTuples = []
+        for name, get_stats in self._clients.items():
+            stats = get_stats()
+            writer = stats.get('writer', {})
+            state = stats.get('supervisor', {}).get('state', '')
+            text.append(('class:lsp.stats.title',
+                         f'[{name}] {state} pending: {stats.get("pending", 0)} '
+                         f'queue: {writer.get("queue_depth", 0)} (max {writer.get("max_queue_depth", 0)})\n'))
+
+            text.append(('class:lsp.stats.header',
+                         f'{"request":<40} {"count":>6} {"err":>4} {"p50":>6} {"p90":>6} {"max":>8} {"resp":>7}\n'))
+            for method, s in stats['requests'].items():
+                latency = s['latency_ms']
+                resp = s['response_bytes'] / latency['count'] if latency['count'] else 0
+                text.append(('', f'{method:<40} {s["count"]:>6} {s["errors"]:>4} '
+                             f'{latency["p50"]:>6.0f} {latency["p90"]:>6.0f} {latency["max"]:>8.1f} '
+                             f'{format_bytes(resp):>7}\n'))
+
+            text.append(('class:lsp.stats.header',
+                         f'{"notification":<40} {"count":>6} {"/s":>8} {"bytes":>8} {"max":>8}\n'))
+            for direction, key in (('<', 'notifications_in'), ('>', 'notifications_out')):
+                for method, s in stats[key].items():
+                    text.append(('', f'{direction} {method:<38} {s["count"]:>6} {s["per_sec"]:>8.2f} '
+                                 f'{format_bytes(s["bytes"]):>8} {format_bytes(s["max_bytes"]):>8}\n'))
+        if not text:
+            text.append(('', 'no language server'))
+        return text
@@ -12,6 +12,7 @@ class RootLayout:
         from .command_window import CommandWindow
         from .message_window import MessageWindow
         from .logger_window import LoggerWindow
+        from .lsp_stats_window import LspStatsWindow
         self.sidebar = TabWindow(kb, style='class:sidebar', width=24)
         self.panel = TabWindow(kb, style='class:panel', height=16)
         self.editor = EditorWindow(kb)
@@ -20,6 +21,8 @@ class RootLayout:
         self.message = MessageWindow()
         self.logger = LoggerWindow(kb)
         self.panel.add(self.logger)
+        self.lsp_stats = LspStatsWindow()
+        self.panel.add(self.lsp_stats, is_active=False)
 
         inner = prompt_toolkit.layout.HSplit([
             self.editor,
@@ -49,6 +52,7 @@ class RootLayout:
         from .diagnostics import Diagnostics
         diagnostics = Diagnostics(self.kb, handler.filetype)
         self.panel.add(diagnostics)
+        self.lsp_stats.add(handler.filetype, handler.get_stats)
 
         from .. import lsp
         handler.client.callbacks[lsp.client.NotificationTypes.diagnostics] = diagnostics.on_diagnostics
@@ -16,5 +16,18 @@ STYLE = prompt_toolkit.styles.Style.from_dict({
     'status.mode.nofocus': 'bg:#AAAAAA #444444',
     'status.location': 'bg:#dddddd #444444',
     'status.row': 'bg:#888888 #000000',
+    'lsp.stats.title': 'bold',
+    'lsp.stats.header': 'underline',
+    # lsp semanticTokens. see editor/semantic_tokens.py
+    'semantic.namespace': '#4ec9b0',
+    'semantic.class': '#4ec9b0',
+    'semantic.type': '#4ec9b0',
+    'semantic.parameter': '#9cdcfe italic',
+    'semantic.property': '#9cdcfe',
+    'semantic.function': '#dcdcaa',
+    'semantic.method': '#dcdcaa',
+    'semantic.decorator': '#dcdcaa',
+    'inlay-hint': '#808080 italic',
+    'code-lens': '#808080',
     # 'status.col': 'bg:#888888 #000000',
 })
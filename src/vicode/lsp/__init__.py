@@ -1,7 +1,9 @@
 from . import client
 from .import protocol
+from . import scheduler
 
 __all__ = [
     'client',
     'protocol',
+    'scheduler',
 ]
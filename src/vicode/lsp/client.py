@@ -1,13 +1,22 @@
 '''
 https://microsoft.github.io/language-server-protocol/specifications/specification-current/
 '''
-from typing import Optional, Dict, Callable, Any
+from typing import Optional, Dict, Callable, Any, List, Tuple
 from enum import Enum, auto
+import os
+import sys
 import pathlib
+import subprocess
 import platform
 import asyncio
 import logging
+import concurrent.futures
 from . import jsonrpc_2_0
+from .codec import Codec, DEFAULT_CODEC
+from .stats import RpcStats
+from .session import SessionRecorder, SEND, RECV
+from .transport import open_connection_async, default_daemon_address
+from .response_cache import ResponseCache
 from .import protocol
 logger = logging.getLogger(__name__)
 
@@ -21,31 +30,173 @@ else:
     }
 
 
+# seconds. server may index the workspace before responding
+INITIALIZE_TIMEOUT = 120.0
+# seconds
+DAEMON_START_TIMEOUT = 10.0
+DAEMON_IDLE_TIMEOUT = 300.0
+
+
+def stub_command(*args: str) -> List[str]:
+    return [sys.executable, '-m', 'vicode.lsp.stub_server', *args]
+
+
+def python_module_env() -> Dict[str, str]:
+    '''
+    environment for `python -m vicode...` subprocess
+    '''
+    src = str(pathlib.Path(__file__).absolute().parents[2])
+    python_path = os.environ.get('PYTHONPATH')
+    return dict(os.environ, PYTHONPATH=os.pathsep.join([src, python_path]) if python_path else src)
+
+
 class NotificationTypes(Enum):
     diagnostics = auto()
 
 
 class Client:
-    def __init__(self, *command: str, workspace_dir: Optional[pathlib.Path] = None) -> None:
+    def __init__(self, *command: str, workspace_dir: Optional[pathlib.Path] = None, codec: Optional[Codec] = None,
+                 env: Optional[Dict[str, str]] = None, record: Optional[pathlib.Path] = None,
+                 address: Optional[str] = None, daemon: bool = False, batch: bool = False,
+                 decode_executor: Optional[concurrent.futures.Executor] = None) -> None:
+        '''
+        record: write every framed message to this session file. see session.py
+        batch: the server accepts JSON-RPC batch arrays. see notify_batch
+        decode_executor: decodes bodies over jsonrpc_2_0.OFFLOAD_THRESHOLD. None: threads
+        address: connect to tcp://HOST:PORT or unix://PATH instead of spawning command
+        daemon: if nobody listens on address, spawn lsp.daemon that shares command there
+        '''
         self.command = command
         self.workspce_dir = workspace_dir
+        self.codec = codec
+        self.env = env
+        self.address = address
+        self.daemon = daemon
+        self.batch = batch
+        self.decode_executor = decode_executor
+        self.daemon_idle_timeout = DAEMON_IDLE_TIMEOUT
+        self._process: Optional[asyncio.subprocess.Process] = None
+        # InitializeResult.capabilities
+        self.server_capabilities: Dict[str, Any] = {}
+        self.recorder = SessionRecorder(record) if record else None
+        self.response_cache = ResponseCache((codec or DEFAULT_CODEC).dumps)
+        # set when the server's output ends. it exited or crashed
+        self.closed = asyncio.Event()
+        # the server was told to exit. closed is expected
+        self.exit_sent = False
+        self.stats = RpcStats()
         self.callbacks: Dict[NotificationTypes, Callable[[Any], None]] = {}
 
     @staticmethod
     def from_filetype(filetype: str) -> 'Client':
         return Client(*LSP_COMMAND_MAP[filetype])
 
+    @staticmethod
+    def replay(session: pathlib.Path, speed: float = 1.0) -> 'Client':
+        '''
+        serve a recorded session from a fake server process. see replay.py
+        '''
+        return Client(sys.executable, '-m', 'vicode.lsp.replay', str(session), '--speed', str(speed),
+                      env=python_module_env())
+
+    @staticmethod
+    def stub(*args: str) -> 'Client':
+        '''
+        scriptable fake server for load testing. see stub_server.py for args
+        '''
+        return Client(*stub_command(*args), env=python_module_env(), batch=True)
+
     async def launch(self, loop: asyncio.AbstractEventLoop):
+        if self.address:
+            if self.daemon:
+                await self._ensure_daemon_async()
+            reader, writer = await open_connection_async(self.address)
+            self._start(loop, reader, writer)
+            return
+
         self._process = await asyncio.subprocess.create_subprocess_exec(*self.command,
                                                                         stdin=asyncio.subprocess.PIPE,
                                                                         stdout=asyncio.subprocess.PIPE,
                                                                         stderr=asyncio.subprocess.PIPE,
+                                                                        env=self.env,
                                                                         )
+        assert(self._process.stdout)
+        assert(self._process.stdin)
+        self._start(loop, self._process.stdout, self._process.stdin)
+        loop.create_task(self._err_async())
 
+    async def _ensure_daemon_async(self):
+        assert(self.address)
+        from .daemon import is_listening_async
+        if await is_listening_async(self.address):
+            return
+        logger.info(f'spawn daemon: {self.address}')
+        self._daemon_process = subprocess.Popen([sys.executable, '-m', 'vicode.lsp.daemon',
+                                                 '--listen', self.address,
+                                                 '--idle-timeout', str(self.daemon_idle_timeout),
+                                                 '--', *self.command],
+                                                stdin=subprocess.DEVNULL,
+                                                stdout=subprocess.DEVNULL,
+                                                stderr=subprocess.DEVNULL,
+                                                env=python_module_env(),
+                                                start_new_session=True)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + DAEMON_START_TIMEOUT
+        while not await is_listening_async(self.address):
+            if loop.time() > deadline or self._daemon_process.poll() is not None:
+                raise TimeoutError(f'daemon not listening: {self.address}')
+            await asyncio.sleep(0.05)
+
+    def _start(self, loop: asyncio.AbstractEventLoop, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._reader = reader
+        self.writer = jsonrpc_2_0.MessageWriter(
+            writer, self.codec or DEFAULT_CODEC)
+        self.writer.start(loop)
         self.rpcDispatcher = jsonrpc_2_0.RpcDispatcher(
-            self.process_notification_async)
+            self.process_notification_async, self.writer, stats=self.stats, executor=self.decode_executor)
+        if self.recorder:
+            self.writer.on_body = self.on_send
+            self.rpcDispatcher.on_body = self.on_recv
+        self.rpcDispatcher.register_request_handler(
+            'workspace/configuration', self.process_workspace_configuration_async)
+        self.rpcDispatcher.register_request_handler(
+            'window/workDoneProgress/create', self.process_window_workDoneProgress_create_async)
+        self.rpcDispatcher.register_request_handler(
+            'window/showMessageRequest', self.process_window_showMessageRequest_async)
+        self.rpcDispatcher.register_request_handler(
+            'client/registerCapability', self.process_client_registerCapability_async)
+        self.rpcDispatcher.register_request_handler(
+            'client/unregisterCapability', self.process_client_registerCapability_async)
         loop.create_task(self._out_async())
-        loop.create_task(self._err_async())
+
+    def on_send(self, body: bytes):
+        assert(self.recorder)
+        self.recorder.record(SEND, body)
+
+    def on_recv(self, body: bytes):
+        assert(self.recorder)
+        self.recorder.record(RECV, body)
+
+    def get_stats(self) -> dict:
+        '''
+        RpcStats.snapshot() with the transport state
+        '''
+        stats = self.stats.snapshot()
+        if hasattr(self, 'rpcDispatcher'):
+            stats['pending'] = self.rpcDispatcher.pending_count
+            stats['errors'] = dict(self.rpcDispatcher.error_counts)
+            stats['offloaded'] = self.rpcDispatcher.offload_count
+            stats['streamed'] = self.rpcDispatcher.stream_count
+            stats['response_cache'] = self.response_cache.get_stats()
+            stats['writer'] = {
+                'queue_depth': self.writer.queue_depth,
+                'max_queue_depth': self.writer.max_queue_depth,
+                'queued_bytes': self.writer.queued_bytes,
+                'transport_buffer_size': self.writer.transport_buffer_size,
+                'frame_count': self.writer.frame_count,
+                'write_count': self.writer.write_count,
+            }
+        return stats
 
     async def process_notification_async(self, method: str, data):
         match method:
@@ -56,23 +207,47 @@ class Client:
             case _:
                 logger.warning(f'unknown notification: {method} => {data}')
 
+    async def process_workspace_configuration_async(self, params):
+        '''
+        https://microsoft.github.io/language-server-protocol/specifications/specification-current/#workspace_configuration
+        '''
+        # no settings. server uses its defaults
+        return [None for _ in params['items']]
+
+    async def process_window_workDoneProgress_create_async(self, params):
+        '''
+        https://microsoft.github.io/language-server-protocol/specifications/specification-current/#window_workDoneProgress_create
+        '''
+        return None
+
+    async def process_window_showMessageRequest_async(self, params):
+        '''
+        https://microsoft.github.io/language-server-protocol/specifications/specification-current/#window_showMessageRequest
+        '''
+        logger.info(params['message'])
+        # no action selected
+        return None
+
+    async def process_client_registerCapability_async(self, params):
+        '''
+        https://microsoft.github.io/language-server-protocol/specifications/specification-current/#client_registerCapability
+        '''
+        return None
+
     # def __del__(self):
     #     if isinstance(self._process.returncode, int):
     #         return
     #     self.notify_exit()
 
     async def _out_async(self):
-        if not self._process:
-            return
-        if not self._process.stdout:
-            return
         logger.debug('read stdout')
-        while True:
-            if self._process.stdout.at_eof():
-                logger.error('end stdout')
-                break
-
-            await self.rpcDispatcher.read_rpc_message_async(self._process.stdout)
+        while await self.rpcDispatcher.read_rpc_message_async(self._reader):
+            pass
+        logger.error('end stdout')
+        if self.recorder:
+            self.recorder.close()
+        self.rpcDispatcher.fail_pending(ConnectionError('language server closed'))
+        self.closed.set()
 
     async def _err_async(self):
         if not self._process:
@@ -91,49 +266,141 @@ class Client:
         '''
         https://microsoft.github.io/language-server-protocol/specifications/specification-current/#initialize
         '''
-        assert(self._process.stdin)
-        future = self.rpcDispatcher.request(
-            self._process.stdin, 'initialize', params)
-        return await future
+        result = await self.rpcDispatcher.request_async('initialize', params, timeout=INITIALIZE_TIMEOUT)
+        self.server_capabilities = result.get('capabilities') or {}
+        return result
+
+    @property
+    def text_document_sync_kind(self) -> protocol.TextDocumentSyncKind:
+        sync = self.server_capabilities.get('textDocumentSync')
+        if isinstance(sync, dict):
+            sync = sync.get('change')
+        if sync is None:
+            return protocol.TextDocumentSyncKind.NONE
+        return protocol.TextDocumentSyncKind(sync)
 
     async def request_shutdown(self):
         '''
         https://microsoft.github.io/language-server-protocol/specifications/specification-current/#shutdown
         '''
-        assert(self._process.stdin)
-        future = self.rpcDispatcher.request(
-            self._process.stdin, 'shutdown', None)
-        return await future
+        return await self.rpcDispatcher.request_async('shutdown', None)
+
+    async def request_async(self, method: str, params):
+        '''
+        hover, definition, ... of an unchanged document are answered from response_cache
+        '''
+        key = self.response_cache.make_key(method, params)
+        generation = self.response_cache.generation
+        if key:
+            found, result = self.response_cache.get(key)
+            if found:
+                return result
+        result = await self.rpcDispatcher.request_async(method, params)
+        if key:
+            self.response_cache.put(key, result, generation)
+        return result
+
+    async def _request_items_async(self, method: str, params, on_item: Optional[Callable[[Any], None]]):
+        if on_item:
+            return await self.rpcDispatcher.request_stream_async(method, params, on_item)
+        return await self.rpcDispatcher.request_async(method, params)
+
+    async def request_textDocument_completion(self, params: protocol.CompletionParams,
+                                              on_item: Optional[Callable[[protocol.CompletionItem], None]] = None):
+        '''
+        https://microsoft.github.io/language-server-protocol/specifications/specification-current/#textDocument_completion
+
+        on_item: receive the items while a large response arrives. see RpcDispatcher.request_stream_async
+        '''
+        return await self._request_items_async('textDocument/completion', params, on_item)
+
+    async def request_textDocument_references(self, params: protocol.ReferenceParams,
+                                              on_item: Optional[Callable[[protocol.Location], None]] = None):
+        '''
+        https://microsoft.github.io/language-server-protocol/specifications/specification-current/#textDocument_references
+        '''
+        return await self._request_items_async('textDocument/references', params, on_item)
+
+    async def request_workspace_symbol(self, params: protocol.WorkspaceSymbolParams,
+                                       on_item: Optional[Callable[[Any], None]] = None):
+        '''
+        https://microsoft.github.io/language-server-protocol/specifications/specification-current/#workspace_symbol
+        '''
+        return await self._request_items_async('workspace/symbol', params, on_item)
 
     def notify_exit(self):
         '''
         https://microsoft.github.io/language-server-protocol/specifications/specification-current/#exit
         '''
-        assert(self._process.stdin)
-        self.rpcDispatcher.notify(self._process.stdin, 'exit', None)
+        self.exit_sent = True
+        self.rpcDispatcher.notify('exit', None)
+
+    @property
+    def launched(self) -> bool:
+        return self._process is not None or hasattr(self, 'writer')
+
+    def terminate(self):
+        '''
+        without shutdown. a daemon connection is closed, the daemon's server keeps running
+        '''
+        if self._process:
+            if self._process.returncode is None:
+                self._process.terminate()
+        elif hasattr(self, 'writer'):
+            # launched
+            self.writer.close()
+
+    def kill(self):
+        if self._process and self._process.returncode is None:
+            self._process.kill()
+
+    async def wait_exited_async(self):
+        '''
+        the process ended, or the daemon connection closed
+        '''
+        if self._process:
+            await self._process.wait()
+        else:
+            await self.closed.wait()
+
+    def notify_batch(self, notifications: List[Tuple[str, Any]]):
+        '''
+        (method, params) pairs. one frame if the server accepts batches.
+        '''
+        for method, params in notifications:
+            self.response_cache.on_notification(method, params)
+        if self.batch:
+            self.rpcDispatcher.notify_batch(notifications)
+        else:
+            for method, params in notifications:
+                self.rpcDispatcher.notify(method, params)
 
     def notify_initialized(self, params: protocol.InitializedParams):
         '''
         https://microsoft.github.io/language-server-protocol/specifications/specification-current/#initialized
         '''
-        assert(self._process.stdin)
-        self.rpcDispatcher.notify(self._process.stdin, 'initialized', params)
+        self.rpcDispatcher.notify('initialized', params)
 
     def notify_textDocument_didOpen(self, params: protocol.DidOpenTextDocumentParams):
         '''
         https://microsoft.github.io/language-server-protocol/specifications/specification-current/#textDocument_didOpen
         '''
-        assert(self._process.stdin)
-        self.rpcDispatcher.notify(
-            self._process.stdin, 'textDocument/didOpen', params)
+        self.response_cache.on_notification('textDocument/didOpen', params)
+        self.rpcDispatcher.notify('textDocument/didOpen', params)
+
+    def notify_textDocument_didChange(self, params: protocol.DidChangeTextDocumentParams):
+        '''
+        https://microsoft.github.io/language-server-protocol/specifications/specification-current/#textDocument_didChange
+        '''
+        self.response_cache.on_notification('textDocument/didChange', params)
+        self.rpcDispatcher.notify('textDocument/didChange', params)
 
     def notify_textDocument_didClose(self, params: protocol.DidCloseTextDocumentParams):
         '''
         https://microsoft.github.io/language-server-protocol/specifications/specification-current/#textDocument_didClose
         '''
-        assert(self._process.stdin)
-        self.rpcDispatcher.notify(
-            self._process.stdin, 'textDocument/didClose', params)
+        self.response_cache.on_notification('textDocument/didClose', params)
+        self.rpcDispatcher.notify('textDocument/didClose', params)
 
 
 async def popen_pyls(loop: asyncio.events.AbstractEventLoop) -> Client:
@@ -147,11 +414,19 @@ async def popen(loop: asyncio.events.AbstractEventLoop, *command: str) -> Client
     return client
 
 
-def create_client(workspace_dir: pathlib.Path, filetype: str) -> Optional[Client]:
-    command = LSP_COMMAND_MAP.get(filetype)
+def create_client(workspace_dir: pathlib.Path, filetype: str,
+                  command_map: Optional[Dict[str, List[str]]] = None, shared: bool = False) -> Optional[Client]:
+    '''
+    shared: connect to a daemon that shares one server between vicode processes
+    '''
+    command = (command_map or LSP_COMMAND_MAP).get(filetype)
     if not command:
         return
 
-    client = Client(*command, workspace_dir=workspace_dir)
+    if shared:
+        client = Client(*command, workspace_dir=workspace_dir,
+                        address=default_daemon_address(workspace_dir, command), daemon=True)
+    else:
+        client = Client(*command, workspace_dir=workspace_dir)
 
     return client
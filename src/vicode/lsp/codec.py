@@ -0,0 +1,86 @@
+'''
+JSON codec for the message body.
+
+orjson or msgspec are used when installed, json otherwise.
+'''
+from typing import Any, Dict, Callable, Optional
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Codec:
+    name = ''
+
+    def dumps(self, message: Any) -> bytes:
+        raise NotImplementedError()
+
+    def loads(self, body: bytes) -> Any:
+        raise NotImplementedError()
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class StdJsonCodec(Codec):
+    name = 'json'
+
+    def dumps(self, message: Any) -> bytes:
+        return json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, body: bytes) -> Any:
+        return json.loads(body)
+
+
+class OrjsonCodec(Codec):
+    name = 'orjson'
+
+    def __init__(self) -> None:
+        import orjson
+        self.dumps = orjson.dumps
+        self.loads = orjson.loads
+
+
+class MsgspecCodec(Codec):
+    name = 'msgspec'
+
+    def __init__(self) -> None:
+        import msgspec.json
+        self.dumps = msgspec.json.Encoder().encode
+        self.loads = msgspec.json.Decoder().decode
+
+
+CODEC_MAP: Dict[str, Callable[[], Codec]] = {
+    'orjson': OrjsonCodec,
+    'msgspec': MsgspecCodec,
+    'json': StdJsonCodec,
+}
+
+
+def available_codecs() -> Dict[str, Codec]:
+    codecs = {}
+    for name, factory in CODEC_MAP.items():
+        try:
+            codecs[name] = factory()
+        except ImportError:
+            pass
+    return codecs
+
+
+def get_codec(name: Optional[str] = None) -> Codec:
+    '''
+    name: one of CODEC_MAP. None selects the fastest installed.
+    '''
+    if name:
+        return CODEC_MAP[name]()
+    for name, factory in CODEC_MAP.items():
+        try:
+            return factory()
+        except ImportError:
+            pass
+    raise RuntimeError('no json codec')
+
+
+DEFAULT_CODEC = get_codec()
+logger.debug(f'json codec: {DEFAULT_CODEC}')
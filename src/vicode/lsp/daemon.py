@@ -0,0 +1,468 @@
+'''
+share one language server between several vicode processes.
+
+python -m vicode.lsp.daemon --listen ADDRESS [--idle-timeout SEC] -- COMMAND...
+
+The daemon runs COMMAND over stdio and accepts clients on ADDRESS
+(see transport.py). Request ids are rewritten per connection, server
+notifications are broadcast, and server requests go to the oldest
+connection. initialize is sent to the server once and its result is
+replayed to later clients. shutdown and exit only detach the client.
+didOpen/didClose are reference counted per uri. Batches are split into
+single messages in both directions.
+
+A document open in several clients has one text on the server. The
+daemon keeps each client's text and its own version per uri. A change
+goes out as is if the server has the sender's text, otherwise as the
+sender's full text. Versions are rewritten to the daemon's.
+
+The daemon exits when the server exits, or when no client is connected
+for SEC seconds.
+'''
+from typing import Dict, Tuple, Any, Optional, List
+import os
+import asyncio
+import argparse
+import logging
+import collections
+from . import jsonrpc_2_0
+from .codec import Codec, DEFAULT_CODEC
+from .transport import start_server_async, open_connection_async, parse_address
+
+logger = logging.getLogger(__name__)
+
+# seconds
+IDLE_TIMEOUT = 300.0
+SHUTDOWN_TIMEOUT = 5.0
+
+
+def to_offset(text: str, position: dict) -> int:
+    '''
+    str index of an LSP position. UTF-16 characters
+    '''
+    line_start = 0
+    for _ in range(position['line']):
+        i = text.find('\n', line_start)
+        if i < 0:
+            return len(text)
+        line_start = i + 1
+    line_end = text.find('\n', line_start)
+    if line_end < 0:
+        line_end = len(text)
+    character = position['character']
+    line = text[line_start:line_end]
+    if line.isascii():
+        return line_start + min(character, len(line))
+    units = 0
+    for i, c in enumerate(line):
+        if units >= character:
+            return line_start + i
+        units += 2 if ord(c) > 0xFFFF else 1
+    return line_end
+
+
+def apply_changes(text: str, changes: List[dict]) -> str:
+    '''
+    TextDocumentContentChangeEvents in order
+    '''
+    for change in changes:
+        change_range = change.get('range')
+        if change_range is None:
+            text = change['text']
+        else:
+            start = to_offset(text, change_range['start'])
+            end = to_offset(text, change_range['end'])
+            text = text[:start] + change['text'] + text[end:]
+    return text
+
+
+class Connection:
+    def __init__(self, index: int, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, codec: Codec) -> None:
+        self.index = index
+        self.reader = reader
+        self.stream = writer
+        self.writer = jsonrpc_2_0.MessageWriter(writer, codec)
+        # uri => text as this client has it
+        self.texts: Dict[str, str] = {}
+        # client request id => daemon request id
+        self.pending: Dict[Any, int] = {}
+        # daemon request id => server request id
+        self.server_requests: Dict[int, Any] = {}
+
+    def __str__(self) -> str:
+        return f'connection#{self.index}'
+
+
+class LanguageServerDaemon:
+    def __init__(self, command: List[str], address: str, *,
+                 idle_timeout: float = IDLE_TIMEOUT, codec: Codec = DEFAULT_CODEC) -> None:
+        self.command = command
+        self.address = address
+        self.idle_timeout = idle_timeout
+        self.codec = codec
+        self._connections: List[Connection] = []
+        self._connection_count = 0
+        self._next_id = 1
+        # daemon request id => (connection, client request id)
+        self._forwarded: Dict[int, Tuple[Connection, Any]] = {}
+        # daemon request id => future. requests issued by the daemon itself
+        self._internal: Dict[int, asyncio.Future] = {}
+        self._initialize: Optional[asyncio.Future] = None
+        self._initialized_sent = False
+        self._open_count: Dict[str, int] = collections.Counter()
+        # uri => version sent to the server
+        self._versions: Dict[str, int] = {}
+        # uri => connection whose text the server has
+        self._synced: Dict[str, Connection] = {}
+        self._idle_handle: Optional[asyncio.TimerHandle] = None
+        self._done = asyncio.Event()
+
+    def _new_id(self) -> int:
+        request_id = self._next_id
+        self._next_id += 1
+        return request_id
+
+    async def run_async(self):
+        loop = asyncio.get_running_loop()
+        self._process = await asyncio.subprocess.create_subprocess_exec(*self.command,
+                                                                        stdin=asyncio.subprocess.PIPE,
+                                                                        stdout=asyncio.subprocess.PIPE,
+                                                                        )
+        assert(self._process.stdin)
+        self._server_writer = jsonrpc_2_0.MessageWriter(
+            self._process.stdin, self.codec)
+        self._server_writer.start(loop)
+        loop.create_task(self._read_server_async())
+
+        server = await start_server_async(self.address, self._on_connected)
+        logger.info(f'listen {self.address}: {self.command}')
+        self._start_idle_timer()
+        try:
+            await self._done.wait()
+        finally:
+            server.close()
+            for connection in list(self._connections):
+                connection.stream.close()
+            await self._stop_server_async()
+            scheme, path, _ = parse_address(self.address)
+            if scheme == 'unix':
+                if os.path.exists(path):
+                    os.unlink(path)
+
+    async def _stop_server_async(self):
+        if self._process.returncode is not None:
+            return
+        try:
+            if self._initialize:
+                await asyncio.wait_for(self._request_async('shutdown', None), SHUTDOWN_TIMEOUT)
+            self._server_writer.put(
+                jsonrpc_2_0.make_notification('exit', None))
+            await asyncio.wait_for(self._server_writer.flush_async(), SHUTDOWN_TIMEOUT)
+            await asyncio.wait_for(self._process.wait(), SHUTDOWN_TIMEOUT)
+        except (asyncio.TimeoutError, jsonrpc_2_0.RpcError, ConnectionError) as e:
+            logger.warning(f'stop server: {e!r}')
+            self._process.kill()
+            await self._process.wait()
+
+    def _start_idle_timer(self):
+        if self._idle_handle:
+            self._idle_handle.cancel()
+        self._idle_handle = asyncio.get_running_loop().call_later(
+            self.idle_timeout, self._on_idle)
+
+    def _on_idle(self):
+        if not self._connections:
+            logger.info('idle timeout')
+            self._done.set()
+
+    def _request_async(self, method: str, params) -> asyncio.Future:
+        request_id = self._new_id()
+        future = asyncio.get_running_loop().create_future()
+        self._internal[request_id] = future
+        self._server_writer.put(
+            jsonrpc_2_0.make_request(request_id, method, params))
+        return future
+
+    #
+    # server => clients
+    #
+    async def _read_server_async(self):
+        assert(self._process.stdout)
+        framer = jsonrpc_2_0.MessageFramer()
+        while True:
+            data = await self._process.stdout.read(jsonrpc_2_0.READ_CHUNK_SIZE)
+            if not data:
+                break
+            for body in framer.feed(data):
+                try:
+                    self._on_server_message(body)
+                except Exception as e:
+                    logger.exception(e)
+        logger.info('server exited')
+        self._done.set()
+
+    def _on_server_message(self, body: bytes):
+        message = self.codec.loads(body)
+        if isinstance(message, list):
+            for m in message:
+                self._on_server_object(m, None)
+        else:
+            self._on_server_object(message, body)
+
+    def _on_server_object(self, message, body: Optional[bytes]):
+        '''
+        body: encoded message if it can be forwarded as is
+        '''
+        message_id = message.get('id')
+        method = message.get('method')
+        if method is None:
+            # response
+            future = self._internal.pop(message_id, None)
+            if future:
+                if future.done():
+                    return
+                error = message.get('error')
+                if error:
+                    future.set_exception(
+                        jsonrpc_2_0.make_rpc_error('', error))
+                else:
+                    future.set_result(message.get('result'))
+                return
+            forwarded = self._forwarded.pop(message_id, None)
+            if not forwarded:
+                return
+            connection, client_id = forwarded
+            connection.pending.pop(client_id, None)
+            message['id'] = client_id
+            connection.writer.put(message)
+        elif message_id is not None:
+            # server request. the oldest connection answers
+            if not self._connections:
+                self._server_writer.put(jsonrpc_2_0.make_error_response(
+                    message_id, jsonrpc_2_0.ErrorCodes.InternalError, 'no client'))
+                return
+            connection = self._connections[0]
+            request_id = self._new_id()
+            connection.server_requests[request_id] = message_id
+            message['id'] = request_id
+            connection.writer.put(message)
+        elif method == '$/cancelRequest':
+            server_id = message['params']['id']
+            for connection in self._connections:
+                for request_id, value in connection.server_requests.items():
+                    if value == server_id:
+                        connection.writer.put(jsonrpc_2_0.make_notification(
+                            '$/cancelRequest', {'id': request_id}))
+                        return
+        else:
+            # notification. broadcast without encoding again
+            if body is None:
+                body = self.codec.dumps(message)
+            for connection in self._connections:
+                if not connection.writer.closed:
+                    connection.writer.put_body(body)
+
+    #
+    # client => server
+    #
+    async def _on_connected(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connection_count += 1
+        connection = Connection(self._connection_count,
+                                reader, writer, self.codec)
+        connection.writer.start(asyncio.get_running_loop())
+        self._connections.append(connection)
+        logger.info(f'{connection}: connected')
+        if self._idle_handle:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+
+        framer = jsonrpc_2_0.MessageFramer()
+        try:
+            while not connection.stream.is_closing():
+                # a busy server slows the clients down instead of the queue growing
+                await self._server_writer.wait_writable_async()
+                data = await reader.read(jsonrpc_2_0.READ_CHUNK_SIZE)
+                if not data:
+                    break
+                for body in framer.feed(data):
+                    try:
+                        self._on_client_message(connection, body)
+                    except Exception as e:
+                        logger.exception(e)
+        except ConnectionError as e:
+            logger.warning(f'{connection}: {e}')
+        finally:
+            self._on_disconnected(connection)
+
+    def _on_disconnected(self, connection: Connection):
+        logger.info(f'{connection}: disconnected')
+        self._connections.remove(connection)
+        for uri in list(connection.texts):
+            self._close_document(connection, uri)
+        for client_id, request_id in connection.pending.items():
+            if self._forwarded.pop(request_id, None):
+                self._server_writer.put(jsonrpc_2_0.make_notification(
+                    '$/cancelRequest', {'id': request_id}))
+        for server_id in connection.server_requests.values():
+            self._server_writer.put(jsonrpc_2_0.make_error_response(
+                server_id, jsonrpc_2_0.ErrorCodes.InternalError, 'client disconnected'))
+        connection.writer.stop()
+        connection.stream.close()
+        if not self._connections:
+            self._start_idle_timer()
+
+    def _close_document(self, connection: Connection, uri: str):
+        connection.texts.pop(uri, None)
+        self._open_count[uri] -= 1
+        if self._open_count[uri] <= 0:
+            del self._open_count[uri]
+            del self._versions[uri]
+            del self._synced[uri]
+            self._server_writer.put(jsonrpc_2_0.make_notification(
+                'textDocument/didClose', {'textDocument': {'uri': uri}}))
+        elif self._synced[uri] is connection:
+            # the server has the text of a client gone
+            other = next(c for c in self._connections if uri in c.texts)
+            self._sync_full(other, uri)
+
+    def _sync_full(self, connection: Connection, uri: str):
+        self._versions[uri] += 1
+        self._synced[uri] = connection
+        self._server_writer.put(jsonrpc_2_0.make_notification('textDocument/didChange', {
+            'textDocument': {'uri': uri, 'version': self._versions[uri]},
+            'contentChanges': [{'text': connection.texts[uri]}],
+        }))
+
+    def _on_client_message(self, connection: Connection, body: bytes):
+        message = self.codec.loads(body)
+        if isinstance(message, list):
+            for m in message:
+                self._on_client_object(connection, m, None)
+        else:
+            self._on_client_object(connection, message, body)
+
+    def _forward(self, message, body: Optional[bytes]):
+        if body is None:
+            self._server_writer.put(message)
+        else:
+            self._server_writer.put_body(body)
+
+    def _on_client_object(self, connection: Connection, message, body: Optional[bytes]):
+        message_id = message.get('id')
+        method = message.get('method')
+        params = message.get('params')
+        if method is None:
+            # response to a server request
+            server_id = connection.server_requests.pop(message_id, None)
+            if server_id is not None:
+                message['id'] = server_id
+                self._server_writer.put(message)
+            return
+
+        if message_id is not None:
+            match method:
+                case 'initialize':
+                    asyncio.get_running_loop().create_task(
+                        self._initialize_async(connection, message_id, params))
+                case 'shutdown':
+                    # detach only
+                    connection.writer.put(
+                        jsonrpc_2_0.make_response(message_id, None))
+                case _:
+                    request_id = self._new_id()
+                    self._forwarded[request_id] = (connection, message_id)
+                    connection.pending[message_id] = request_id
+                    message['id'] = request_id
+                    self._server_writer.put(message)
+            return
+
+        match method:
+            case 'initialized':
+                if not self._initialized_sent:
+                    self._initialized_sent = True
+                    self._forward(message, body)
+            case 'exit':
+                connection.stream.close()
+            case '$/cancelRequest':
+                request_id = connection.pending.get(params['id'])
+                if request_id is not None:
+                    self._server_writer.put(jsonrpc_2_0.make_notification(
+                        '$/cancelRequest', {'id': request_id}))
+            case 'textDocument/didOpen':
+                document = params['textDocument']
+                uri = document['uri']
+                if uri in connection.texts:
+                    self._open_count[uri] -= 1
+                connection.texts[uri] = document['text']
+                self._open_count[uri] += 1
+                if self._open_count[uri] == 1:
+                    self._versions[uri] = 1
+                    self._synced[uri] = connection
+                    document['version'] = 1
+                    self._server_writer.put(message)
+                else:
+                    # already open by another client
+                    self._sync_full(connection, uri)
+            case 'textDocument/didChange':
+                uri = params['textDocument']['uri']
+                text = connection.texts.get(uri)
+                if text is None:
+                    return
+                connection.texts[uri] = apply_changes(
+                    text, params['contentChanges'])
+                if self._synced[uri] is not connection:
+                    # the changes are to the text of this client, not to the server's
+                    self._sync_full(connection, uri)
+                    return
+                self._versions[uri] += 1
+                params['textDocument']['version'] = self._versions[uri]
+                self._server_writer.put(message)
+            case 'textDocument/didClose':
+                uri = params['textDocument']['uri']
+                if uri in connection.texts:
+                    self._close_document(connection, uri)
+            case _:
+                self._forward(message, body)
+
+    async def _initialize_async(self, connection: Connection, message_id, params):
+        if not self._initialize:
+            self._initialize = self._request_async('initialize', params)
+        try:
+            result = await asyncio.shield(self._initialize)
+            connection.writer.put(jsonrpc_2_0.make_response(message_id, result))
+        except jsonrpc_2_0.RpcError as e:
+            connection.writer.put(jsonrpc_2_0.make_error_response(
+                message_id, e.code, e.message))
+
+
+async def is_listening_async(address: str) -> bool:
+    try:
+        _, writer = await open_connection_async(address)
+        writer.close()
+        return True
+    except (ConnectionError, FileNotFoundError, OSError):
+        return False
+
+
+async def main_async(args: argparse.Namespace):
+    if await is_listening_async(args.listen):
+        logger.info(f'already running: {args.listen}')
+        return
+    daemon = LanguageServerDaemon(
+        args.command, args.listen, idle_timeout=args.idle_timeout)
+    await daemon.run_async()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--listen', required=True,
+                        help='tcp://HOST:PORT or unix://PATH')
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT)
+    parser.add_argument('command', nargs='+')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,13 @@
-from typing import TypedDict, Dict, Any, Optional
+from typing import TypedDict, Dict, Any, Optional, List, Tuple, Union, Callable, Awaitable, TypeAlias, NamedTuple, Type, Sequence, Set
+from enum import IntEnum
+import collections
+import concurrent.futures
 import asyncio
-import json
 import logging
+import time
+from .codec import Codec, DEFAULT_CODEC
+from .stats import RpcStats
+from .result_stream import ResultStream
 
 logger = logging.getLogger(__name__)
 
@@ -56,51 +62,513 @@ def make_notification(method: str, params) -> Notification:
         )
 
 
-def send_message(stdin: asyncio.StreamWriter, message):
-    bin = json.dumps(message).encode('utf-8')
+class ErrorCodes(IntEnum):
+    '''
+    https://microsoft.github.io/language-server-protocol/specifications/specification-current/#responseMessage
+    '''
+    ParseError = -32700
+    InvalidRequest = -32600
+    MethodNotFound = -32601
+    InvalidParams = -32602
+    InternalError = -32603
+    ServerNotInitialized = -32002
+    UnknownErrorCode = -32001
+    RequestFailed = -32803
+    ServerCancelled = -32802
+    ContentModified = -32801
+    RequestCancelled = -32800
 
-    # write
-    header = f'Content-Length: {len(bin)}\r\n'
-    stdin.write(header.encode('ascii'))
-    stdin.write(b'\r\n')
-    stdin.write(bin)
+
+class ResponseErrorOptional(TypedDict, total=False):
+    data: Any
+
+
+class ResponseError(ResponseErrorOptional):
+    code: int
+    message: str
+
+
+class ResponseOptional(TypedDict, total=False):
+    result: Any
+    error: ResponseError
+
+
+class Response(Message, ResponseOptional):
+    id: Union[int, str, None]
+
+
+def make_response(message_id: Union[int, str], result) -> Response:
+    return Response(
+        jsonrpc="2.0",
+        id=message_id,
+        result=result
+    )
+
+
+def make_error_response(message_id: Union[int, str, None], code: int, message: str) -> Response:
+    return Response(
+        jsonrpc="2.0",
+        id=message_id,
+        error=ResponseError(code=code, message=message)
+    )
+
+
+class RpcError(Exception):
+    '''
+    error response for a request
+    '''
+
+    def __init__(self, method: str, error: ResponseError) -> None:
+        super().__init__(method, error)
+        self.method = method
+        self.code: int = error['code']
+        self.message: str = error['message']
+        self.data = error.get('data')
+
+    def __str__(self) -> str:
+        return f'{self.method}: [{self.code}] {self.message}'
+
+
+class MethodNotFoundError(RpcError):
+    pass
+
+
+class InvalidParamsError(RpcError):
+    pass
+
+
+class ServerNotInitializedError(RpcError):
+    pass
+
+
+class RequestFailedError(RpcError):
+    pass
+
+
+class RequestCancelledError(RpcError):
+    '''
+    RequestCancelled, ServerCancelled
+    '''
+    pass
+
+
+class ContentModifiedError(RpcError):
+    pass
+
+
+ERROR_TYPE_MAP: Dict[int, Type[RpcError]] = {
+    ErrorCodes.MethodNotFound: MethodNotFoundError,
+    ErrorCodes.InvalidParams: InvalidParamsError,
+    ErrorCodes.ServerNotInitialized: ServerNotInitializedError,
+    ErrorCodes.RequestFailed: RequestFailedError,
+    ErrorCodes.ServerCancelled: RequestCancelledError,
+    ErrorCodes.RequestCancelled: RequestCancelledError,
+    ErrorCodes.ContentModified: ContentModifiedError,
+}
+
+
+def make_rpc_error(method: str, error: ResponseError) -> RpcError:
+    return ERROR_TYPE_MAP.get(error.get('code'), RpcError)(method, error)
+
+
+RequestHandler: TypeAlias = Callable[[Any], Awaitable[Any]]
+
+
+class PendingRequest(NamedTuple):
+    method: str
+    future: asyncio.Future
+    # time.monotonic()
+    start: float
+
+
+def encode_frame(body: bytes) -> bytes:
+    return b'Content-Length: %d\r\n\r\n' % len(body) + body
+
+
+class MessageWriter:
+    '''
+    Outbound frames go through a single writer task.
+
+    put() only appends the encoded frame. The task wakes once per loop tick,
+    joins everything queued so far into one write() and awaits drain(), so
+    the transport buffer stays under high_water while the server is busy.
+    Producers that can wait await wait_writable_async() to keep the queue
+    under queue_high_water.
+
+    Once a write fails the writer is closed and put() raises ConnectionError.
+    '''
+
+    def __init__(self, stdin: asyncio.StreamWriter, codec: Codec = DEFAULT_CODEC, *,
+                 high_water: int = 256 * 1024, queue_high_water: int = 16 * 1024 * 1024) -> None:
+        self._stdin = stdin
+        self.codec = codec
+        self._frames: List[bytes] = []
+        self._queued_bytes = 0
+        self._queue_high_water = queue_high_water
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self.closed = False
+        self._task: Optional[asyncio.Task] = None
+        self.max_queue_depth = 0
+        self.frame_count = 0
+        self.write_count = 0
+        # tap for SessionRecorder
+        self.on_body: Optional[Callable[[bytes], None]] = None
+        stdin.transport.set_write_buffer_limits(high=high_water)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._frames)
+
+    @property
+    def queued_bytes(self) -> int:
+        return self._queued_bytes
+
+    @property
+    def transport_buffer_size(self) -> int:
+        return self._stdin.transport.get_write_buffer_size()
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        self._task = loop.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def close(self):
+        self.stop()
+        self._set_closed()
+        self._stdin.close()
+
+    def _set_closed(self):
+        self.closed = True
+        self._frames = []
+        self._queued_bytes = 0
+        # nothing more will be written. do not keep waiters
+        self._idle.set()
+        self._writable.set()
+
+    def put(self, message) -> int:
+        '''
+        return frame size
+        '''
+        return self.put_body(self.codec.dumps(message))
+
+    def put_batch(self, messages: Sequence[Any]) -> int:
+        '''
+        JSON-RPC batch. all messages in one array and one frame.
+        '''
+        assert(messages)
+        return self.put_body(self.codec.dumps(list(messages)))
+
+    def put_body(self, body: bytes) -> int:
+        '''
+        already encoded message
+        '''
+        if self.closed:
+            raise ConnectionError('writer closed')
+        if self.on_body:
+            self.on_body(body)
+        frame = encode_frame(body)
+        if self._queued_bytes < self._queue_high_water <= self._queued_bytes + len(frame):
+            logger.warning(
+                f'outbound queue over {self._queue_high_water} bytes')
+            self._writable.clear()
+        self._frames.append(frame)
+        self._queued_bytes += len(frame)
+        if len(self._frames) > self.max_queue_depth:
+            self.max_queue_depth = len(self._frames)
+        self._idle.clear()
+        self._wakeup.set()
+        return len(frame)
+
+    async def flush_async(self):
+        '''
+        wait until all queued frames are handed to the transport.
+        '''
+        await self._idle.wait()
+
+    async def wait_writable_async(self):
+        '''
+        wait until the queue is under queue_high_water.
+        '''
+        await self._writable.wait()
+
+    async def _run(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                if not self._frames:
+                    continue
+
+                frames = self._frames
+                self._frames = []
+                self._queued_bytes = 0
+                self._stdin.write(b''.join(frames))
+                self.frame_count += len(frames)
+                self.write_count += 1
+                await self._stdin.drain()
+                if self._queued_bytes < self._queue_high_water:
+                    self._writable.set()
+                if not self._frames:
+                    self._idle.set()
+        except (ConnectionResetError, BrokenPipeError) as e:
+            logger.error(f'write: {e}')
+            self._set_closed()
+
+
+HEADER_END = b'\r\n\r\n'
+READ_CHUNK_SIZE = 64 * 1024
+# bytes. larger bodies are decoded in an executor, not on the event loop
+OFFLOAD_THRESHOLD = 1024 * 1024
+# bytes. larger responses to request_stream_async are parsed while they arrive
+STREAM_THRESHOLD = 256 * 1024
+# seconds
+DEFAULT_TIMEOUT = 30.0
+
+
+def parse_header(header: bytes) -> int:
+    '''
+    return Content-Length. header is the bytes before the empty line.
+    '''
+    length = -1
+    for line in header.split(b'\r\n'):
+        key, sep, value = line.partition(b':')
+        if not sep:
+            raise ValueError(f'invalid header: {line!r}')
+        match key.strip().lower():
+            case b'content-length':
+                length = int(value)
+            case b'content-type':
+                pass
+            case _:
+                # unknown
+                logger.warning(f'unknown header: {line!r}')
+    if length < 0:
+        raise ValueError(f'no Content-Length: {header!r}')
+    return length
+
+
+class MessageFramer:
+    '''
+    Content-Length framing as a state machine.
+
+    feed() takes bytes in whatever chunks the pipe delivers and returns every
+    body that became complete. A body is returned only when exactly
+    Content-Length bytes have arrived.
+    '''
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        # -1: reading header, otherwise: waiting body of this length
+        self._length = -1
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def body_length(self) -> int:
+        '''
+        Content-Length of the incomplete body, -1 while reading a header.
+        '''
+        return self._length
+
+    def take_partial(self) -> bytes:
+        '''
+        remove and return the incomplete body received so far.
+        feed() returns only the rest of that body.
+        '''
+        assert(self._length >= 0)
+        data = bytes(self._buffer)
+        self._length -= len(data)
+        self._buffer.clear()
+        return data
+
+    def feed(self, data: bytes) -> List[bytes]:
+        buffer = self._buffer
+        buffer += data
+        bodies: List[bytes] = []
+        pos = 0
+        while True:
+            if self._length < 0:
+                end = buffer.find(HEADER_END, pos)
+                if end < 0:
+                    break
+                self._length = parse_header(bytes(buffer[pos:end]))
+                pos = end + len(HEADER_END)
+            if len(buffer) - pos < self._length:
+                break
+            bodies.append(bytes(buffer[pos:pos+self._length]))
+            pos += self._length
+            self._length = -1
+        if pos:
+            del buffer[:pos]
+        return bodies
 
 
 class RpcDispatcher:
-    def __init__(self, on_notification) -> None:
+    def __init__(self, on_notification, writer: MessageWriter, *,
+                 max_concurrent_requests: int = 4, stats: Optional[RpcStats] = None,
+                 offload_threshold: Optional[int] = OFFLOAD_THRESHOLD,
+                 executor: Optional[concurrent.futures.Executor] = None) -> None:
+        '''
+        offload_threshold: bodies of this size or more are decoded by executor. None: never
+        executor: None is the loop default (threads). a ProcessPoolExecutor also works
+        '''
         self._request_id = 1
-        self._request_map: Dict[int, asyncio.Future] = {}
+        self._request_map: Dict[int, PendingRequest] = {}
+        # method => count
+        self.error_counts: Dict[str, int] = collections.Counter()
+        self.stats = stats or RpcStats()
         self._on_notification = on_notification
+        self.writer = writer
+        self.codec = writer.codec
+        self._framer = MessageFramer()
+        # tap for SessionRecorder
+        self.on_body: Optional[Callable[[bytes], None]] = None
+        # server to client request
+        self._request_handlers: Dict[str, RequestHandler] = {}
+        self._handler_semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self._handler_tasks: Dict[Union[int, str], asyncio.Task] = {}
+        self.offload_threshold = offload_threshold
+        self.executor = executor
+        self.offload_count = 0
+        # request id => item callback. see request_stream_async
+        self._stream_consumers: Dict[int, Callable[[Any], None]] = {}
+        self._streamed_ids: Set[int] = set()
+        self._stream: Optional[ResultStream] = None
+        # taken body chunks kept for fallback or on_body
+        self._stream_chunks: List[bytes] = []
+        self.stream_threshold = STREAM_THRESHOLD
+        self.stream_count = 0
 
-    async def read_rpc_message_async(self, stdout: asyncio.StreamReader):
-        length = 0
-        while True:
-            l = await stdout.readline()
-            if l == b'\r\n':
-                break
+    def register_request_handler(self, method: str, handler: RequestHandler):
+        assert(method not in self._request_handlers)
+        self._request_handlers[method] = handler
 
-            header = l.decode('ascii').rstrip()
-            key, value = header.split(':', 1)
-            match key:
-                case 'Content-Length':
-                    length = int(value)
-                case 'Content-Type':
-                    pass
-                case _:
-                    # unknown
-                    raise NotImplementedError(header)
-        # body
-        body = await stdout.read(length)
-        message = json.loads(body)
+    async def read_rpc_message_async(self, stdout: asyncio.StreamReader) -> bool:
+        '''
+        read one chunk and dispatch all messages completed by it.
+        return False on EOF.
+        '''
+        data = await stdout.read(READ_CHUNK_SIZE)
+        if not data:
+            if self._framer.buffered:
+                logger.error(
+                    f'EOF with {self._framer.buffered} bytes incomplete message')
+            return False
+        stream = self._stream
+        for body in self._framer.feed(data):
+            try:
+                if stream:
+                    # the rest of the streamed body is the first one completed
+                    self._stream = None
+                    await self._finish_stream_async(stream, body)
+                    stream = None
+                    continue
+                if self.on_body:
+                    self.on_body(body)
+                await self.dispatch_async(body)
+            except Exception as e:
+                # keep reading
+                logger.exception(e)
+        if self._stream_consumers and self._framer.body_length >= self.stream_threshold:
+            if not self._stream:
+                self._stream = ResultStream(self._stream_consumers.get)
+            chunk = self._framer.take_partial()
+            self._stream.feed(chunk)
+            if self.on_body or not self._stream.committed:
+                self._stream_chunks.append(chunk)
+            else:
+                # items are consumed. the body is not needed any more
+                self._stream_chunks.clear()
+        return True
+
+    async def _finish_stream_async(self, stream: ResultStream, tail: bytes):
+        chunks = self._stream_chunks
+        self._stream_chunks = []
+        size = stream.fed + len(tail)
+        if self.on_body:
+            self.on_body(b''.join(chunks) + tail)
+        message = stream.finish(tail)
+        if message:
+            if message.get('id') in self._stream_consumers:
+                self._streamed_ids.add(message['id'])
+            self.stream_count += 1
+            return await self.dispatch_message_async(message, size)
+        if not stream.committed:
+            # not streamed. decode as usual
+            return await self.dispatch_async(b''.join(chunks) + tail)
+        # items were consumed and then the body broke
+        await self.process_error_async(stream.message_id, ResponseError(
+            code=ErrorCodes.ParseError, message='invalid streamed response'))
+
+    async def decode_async(self, body: bytes):
+        '''
+        the read loop waits here, so messages are still dispatched in order.
+        '''
+        if self.offload_threshold is not None and len(body) >= self.offload_threshold:
+            self.offload_count += 1
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self.codec.loads, body)
+        return self.codec.loads(body)
+
+    async def dispatch_async(self, body: bytes):
+        message = await self.decode_async(body)
+        if isinstance(message, list):
+            return await self.dispatch_batch_async(message, len(body))
+        await self.dispatch_message_async(message, len(body))
+
+    async def dispatch_batch_async(self, messages: List[Any], size: int):
+        '''
+        JSON-RPC batch. each element is dispatched in order. responses to the
+        requests in it are sent back as one array when all handlers finished.
+        '''
+        if not messages:
+            self.writer.put(make_error_response(
+                None, ErrorCodes.InvalidRequest, 'empty batch'))
+            return
+        # no per element size in a batch
+        size = size // len(messages)
+        tasks: List[asyncio.Task] = []
+        for message in messages:
+            try:
+                if isinstance(message, dict) and message.get('id') is not None and message.get('method'):
+                    tasks.append(self._start_request(
+                        message['id'], message['method'], message.get('params'), size))
+                else:
+                    await self.dispatch_message_async(message, size)
+            except Exception as e:
+                # keep the rest of the batch
+                logger.exception(e)
+        if tasks:
+            asyncio.get_running_loop().create_task(self._reply_batch_async(tasks))
 
+    async def _reply_batch_async(self, tasks: List[asyncio.Task]):
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        responses = [r for r in results if isinstance(r, dict)]
+        if responses and not self.writer.closed:
+            self.writer.put_batch(responses)
+
+    async def dispatch_message_async(self, message, size: int):
         message_id = message.get('id')
-        if isinstance(message_id, int):
-            method = message.get('method')
+        method = message.get('method')
+        error = message.get('error')
+        if message_id is not None:
             if method:
                 # request
-                return await self.process_request_async(message_id, method, message.get('params'))
+                return await self.process_request_async(message_id, method, message.get('params'), size)
+
+            pending = self._request_map.get(message_id)
+            if pending:
+                self.stats.on_response(pending.method, time.monotonic() - pending.start,
+                                       size, bool(error))
 
-            error = message.get('error')
             if error:
                 # error response
                 return await self.process_error_async(message_id, error)
@@ -108,35 +576,177 @@ class RpcDispatcher:
             # success response
             await self.process_response_async(message_id, message.get('result'))
         else:
-            method = message.get('method')
             if method:
-                # notification
-                await self._on_notification(method, message.get('params'))
-            else:
-                raise RuntimeError(message)
+                self.stats.on_notification_in(method, size)
+            match method:
+                case '$/cancelRequest':
+                    self.cancel_handler(message['params']['id'])
+                case str():
+                    # notification
+                    await self._on_notification(method, message.get('params'))
+                case None if error:
+                    # error that could not be bound to a request. ex. ParseError
+                    self.error_counts[''] += 1
+                    logger.error(f'error response without id: {error}')
+                case _:
+                    raise RuntimeError(message)
+
+    async def process_request_async(self, message_id: Union[int, str], method: str, params, size: int = 0):
+        '''
+        the handler runs as a task, so the read loop does not wait for it.
+        '''
+        task = self._start_request(message_id, method, params, size)
+        task.add_done_callback(self._on_request_done)
+
+    def _on_request_done(self, task: asyncio.Task):
+        # the peer is gone if the writer is closed
+        if not task.cancelled() and not self.writer.closed:
+            self.writer.put(task.result())
 
-    async def process_request_async(self, message_id: int, method: str, params):
-        raise NotImplementedError()
+    def _start_request(self, message_id: Union[int, str], method: str, params, size: int) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(
+            self._handle_request_async(message_id, method, params, size))
+        self._handler_tasks[message_id] = task
+        task.add_done_callback(
+            lambda _: self._handler_tasks.pop(message_id, None))
+        return task
+
+    async def _handle_request_async(self, message_id: Union[int, str], method: str, params, size: int) -> Response:
+        start = time.monotonic()
+        handler = self._request_handlers.get(method)
+        if not handler:
+            logger.warning(f'unknown request: {method} => {params}')
+            response = make_error_response(
+                message_id, ErrorCodes.MethodNotFound, f'method not found: {method}')
+        else:
+            try:
+                async with self._handler_semaphore:
+                    response = make_response(message_id, await handler(params))
+            except asyncio.CancelledError:
+                response = make_error_response(
+                    message_id, ErrorCodes.RequestCancelled, 'cancelled')
+            except Exception as e:
+                logger.exception(e)
+                response = make_error_response(
+                    message_id, ErrorCodes.InternalError, str(e))
+        self.stats.on_server_request(method, time.monotonic() - start, size,
+                                     'error' in response)
+        return response
+
+    def cancel_handler(self, message_id: Union[int, str]):
+        task = self._handler_tasks.get(message_id)
+        if task:
+            task.cancel()
 
     async def process_response_async(self, message_id: int, result):
-        future = self._request_map[message_id]
-        future.set_result(result)
+        pending = self._request_map.pop(message_id, None)
+        if not pending or pending.future.done():
+            # timeout or cancelled
+            logger.debug(f'drop response: {message_id}')
+            return
+        pending.future.set_result(result)
 
-    async def process_error_async(self, message_id: int, error):
-        raise NotImplementedError()
+    async def process_error_async(self, message_id: int, error: ResponseError):
+        pending = self._request_map.pop(message_id, None)
+        if not pending:
+            logger.debug(f'drop error response: {message_id}: {error}')
+            return
+        self.error_counts[pending.method] += 1
+        if pending.future.done():
+            return
+        pending.future.set_exception(make_rpc_error(pending.method, error))
 
-    def request(self, stdin: asyncio.StreamWriter, method: str, params) -> asyncio.Future:
+    @property
+    def pending_count(self) -> int:
+        return len(self._request_map)
+
+    def fail_pending(self, e: Exception):
+        '''
+        no response will come. ex. the connection is lost
+        '''
+        request_map, self._request_map = self._request_map, {}
+        for pending in request_map.values():
+            if not pending.future.done():
+                pending.future.set_exception(e)
+
+    def request(self, method: str, params) -> Tuple[int, asyncio.Future]:
         request_id = self._request_id
         self._request_id += 1
+        # raises before the request is pending if the writer is closed
+        message = make_request(request_id, method, params)
+        self.stats.on_request(method, self.writer.put(message))
+
         future = asyncio.Future()
         assert(request_id not in self._request_map)
-        self._request_map[request_id] = future
+        self._request_map[request_id] = PendingRequest(
+            method, future, time.monotonic())
+        return request_id, future
 
-        message = make_request(request_id, method, params)
-        send_message(stdin, message)
+    async def request_async(self, method: str, params, timeout: Optional[float] = DEFAULT_TIMEOUT):
+        '''
+        timeout: seconds, None waits forever.
+
+        If the deadline passes or the caller is cancelled, $/cancelRequest is
+        sent and asyncio.TimeoutError / CancelledError propagates.
+        An error response raises RpcError.
+        '''
+        request_id, future = self.request(method, params)
+        return await self._wait_response_async(request_id, future, timeout)
 
-        return future
+    async def request_stream_async(self, method: str, params, on_item: Callable[[Any], None],
+                                   timeout: Optional[float] = DEFAULT_TIMEOUT):
+        '''
+        on_item is called with each element of the result array, or of
+        result.items, in order. A response over stream_threshold is parsed
+        while it arrives. Return the result with that array emptied.
+        '''
+        request_id, future = self.request(method, params)
+        self._stream_consumers[request_id] = on_item
+        try:
+            result = await self._wait_response_async(request_id, future, timeout)
+        finally:
+            self._stream_consumers.pop(request_id, None)
+            streamed = request_id in self._streamed_ids
+            self._streamed_ids.discard(request_id)
+        if streamed:
+            return result
 
-    def notify(self, stdin: asyncio.StreamWriter, method: str, params):
+        # decoded as a whole
+        items = result
+        if isinstance(result, dict):
+            items = result.get('items')
+            if isinstance(items, list):
+                result = {**result, 'items': []}
+        if isinstance(items, list):
+            for item in items:
+                on_item(item)
+            if items is result:
+                result = []
+        return result
+
+    async def _wait_response_async(self, request_id: int, future: asyncio.Future, timeout: Optional[float]):
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            if request_id in self._request_map and not self.writer.closed:
+                # not answered yet
+                self.notify('$/cancelRequest', {'id': request_id})
+            raise
+        finally:
+            self._request_map.pop(request_id, None)
+
+    def notify(self, method: str, params):
         message = make_notification(method, params)
-        send_message(stdin, message)
+        self.stats.on_notification_out(method, self.writer.put(message))
+
+    def notify_batch(self, notifications: Sequence[Tuple[str, Any]]):
+        '''
+        (method, params) pairs as one JSON-RPC batch frame.
+        '''
+        if not notifications:
+            return
+        size = self.writer.put_batch(
+            [make_notification(method, params) for method, params in notifications])
+        for method, _ in notifications:
+            self.stats.on_notification_out(
+                method, size // len(notifications))
@@ -1490,3 +1490,109 @@ class PublishDiagnosticsParams(PublishDiagnosticsParamsRequired, PublishDiagnost
     '''
     https://microsoft.github.io/language-server-protocol/specifications/specification-current/#textDocument_publishDiagnostics    
     '''
+
+
+class CompletionContextOptional(TypedDict, total=False):
+    '''
+    The trigger character (a single character) that has trigger code
+    complete. Is undefined if `triggerKind !== CompletionTriggerKind.TriggerCharacter`
+    '''
+    triggerCharacter: str
+
+
+class CompletionContext(CompletionContextOptional):
+    '''
+    How the completion was triggered.
+    1: Invoked, 2: TriggerCharacter, 3: TriggerForIncompleteCompletions
+    '''
+    triggerKind: int
+
+
+class CompletionParams(TextDocumentPositionParams, total=False):
+    '''
+    https://microsoft.github.io/language-server-protocol/specifications/specification-current/#textDocument_completion
+    '''
+    context: CompletionContext
+
+
+class ReferenceContext(TypedDict):
+    '''
+    Include the declaration of the current symbol.
+    '''
+    includeDeclaration: bool
+
+
+class ReferenceParams(TextDocumentPositionParams):
+    '''
+    https://microsoft.github.io/language-server-protocol/specifications/specification-current/#textDocument_references
+    '''
+    context: ReferenceContext
+
+
+class WorkspaceSymbolParams(TypedDict):
+    '''
+    A query string to filter symbols by. Clients may send an empty
+    string here to request all symbols.
+    '''
+    query: str
+
+
+class TextDocumentSyncKind(IntEnum):
+    '''
+    Defines how the host (editor) should sync document changes to the language
+    server.
+    '''
+    # Documents should not be synced at all.
+    NONE = 0
+    # Documents are synced by always sending the full content of the document.
+    Full = 1
+    # Documents are synced by sending the full content on open. After that
+    # only incremental updates to the document are send.
+    Incremental = 2
+
+
+class TextDocumentContentChangeEventOptional(TypedDict, total=False):
+    '''
+    The range of the document that changed. Omitted: text is the full content.
+    '''
+    range: Range
+
+
+class TextDocumentContentChangeEvent(TextDocumentContentChangeEventOptional):
+    '''
+    The new text for the provided range.
+    '''
+    text: str
+
+
+class DidChangeTextDocumentParams(TypedDict):
+    '''
+    https://microsoft.github.io/language-server-protocol/specifications/specification-current/#textDocument_didChange
+    '''
+    textDocument: VersionedTextDocumentIdentifier
+
+    '''
+    The actual content changes. The content changes describe single state
+    changes to the document. So if there are two content changes c1 (at
+    array index 0) and c2 (at array index 1) for a document in state S then
+    c1 moves the document from S to S' and c2 from S' to S''.
+    '''
+    contentChanges: List[TextDocumentContentChangeEvent]
+
+
+class SemanticTokensParams(TypedDict):
+    '''
+    https://microsoft.github.io/language-server-protocol/specifications/specification-current/#semanticTokens_fullRequest
+    '''
+    textDocument: TextDocumentIdentifier
+
+
+class SemanticTokensDeltaParams(TypedDict):
+    '''
+    https://microsoft.github.io/language-server-protocol/specifications/specification-current/#semanticTokens_deltaRequest
+
+    The result id of a previous response. The result Id can either point to
+    a full response or a delta response depending on what was received last.
+    '''
+    textDocument: TextDocumentIdentifier
+    previousResultId: str
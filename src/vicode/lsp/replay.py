@@ -0,0 +1,148 @@
+'''
+fake language server process that serves a recorded session.
+
+python -m vicode.lsp.replay SESSION [--speed 1.0]
+
+Server messages are written in recorded order. A response waits for the
+live request of the same method and ordinal and takes over its id. Other
+server messages wait until the client has sent as many messages as it had
+at that point of the recording. The recorded gap to the previous message
+is kept, divided by speed (0: no delay). A batch counts as its elements;
+server batches are written as recorded.
+'''
+from typing import Dict, Tuple, Any, List, Callable, BinaryIO
+import sys
+import json
+import asyncio
+import argparse
+import collections
+import pathlib
+from .jsonrpc_2_0 import MessageFramer, encode_frame, READ_CHUNK_SIZE
+from .session import RecordedMessage, load_session, SEND
+
+# seconds. give up waiting the client and go on
+WAIT_TIMEOUT = 5.0
+
+
+class ReplayServer:
+    def __init__(self, messages: List[RecordedMessage], out: BinaryIO, *,
+                 speed: float = 1.0, wait_timeout: float = WAIT_TIMEOUT) -> None:
+        self._messages = messages
+        self._out = out
+        self._speed = speed
+        self._wait_timeout = wait_timeout
+        self._received = 0
+        self._changed = asyncio.Event()
+        self.exited = asyncio.Event()
+        # (method, ordinal) => live request id
+        self._live_ids: Dict[Tuple[str, int], Any] = {}
+        self._live_counts: Dict[str, int] = collections.Counter()
+
+    def on_client_message(self, body: bytes):
+        message = json.loads(body)
+        for m in (message if isinstance(message, list) else [message]):
+            self._on_client_object(m)
+        self._changed.set()
+
+    def _on_client_object(self, message):
+        self._received += 1
+        method = message.get('method')
+        message_id = message.get('id')
+        if method and message_id is not None:
+            self._live_ids[(method, self._live_counts[method])] = message_id
+            self._live_counts[method] += 1
+        if method == 'exit':
+            self.exited.set()
+
+    async def _wait_until(self, predicate: Callable[[], bool]) -> bool:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._wait_timeout
+        while not predicate():
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), deadline - loop.time())
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    async def serve_async(self):
+        # recorded request id => (method, ordinal)
+        recorded: Dict[Any, Tuple[str, int]] = {}
+        counts: Dict[str, int] = collections.Counter()
+        sent = 0
+        prev_t = 0.0
+        for m in self._messages:
+            message = json.loads(m.body)
+            if m.direction == SEND:
+                for sent_message in (message if isinstance(message, list) else [message]):
+                    sent += 1
+                    method = sent_message.get('method')
+                    message_id = sent_message.get('id')
+                    if method and message_id is not None:
+                        recorded[message_id] = (method, counts[method])
+                        counts[method] += 1
+                prev_t = m.t
+                continue
+
+            body = m.body
+            if isinstance(message, list):
+                method = None
+                message_id = None
+            else:
+                method = message.get('method')
+                message_id = message.get('id')
+            if not method and message_id in recorded:
+                # response
+                key = recorded[message_id]
+                await self._wait_until(lambda: key in self._live_ids)
+                live_id = self._live_ids.get(key, message_id)
+                if live_id != message_id:
+                    message['id'] = live_id
+                    body = json.dumps(message).encode('utf-8')
+            else:
+                count = sent
+                await self._wait_until(lambda: self._received >= count)
+
+            if self._speed > 0 and m.t > prev_t:
+                await asyncio.sleep((m.t - prev_t) / self._speed)
+            prev_t = m.t
+
+            self._out.write(encode_frame(body))
+            self._out.flush()
+
+
+async def read_async(reader: asyncio.StreamReader, server: ReplayServer):
+    framer = MessageFramer()
+    while True:
+        data = await reader.read(READ_CHUNK_SIZE)
+        if not data:
+            break
+        for body in framer.feed(data):
+            server.on_client_message(body)
+    server.exited.set()
+
+
+async def main_async(session: pathlib.Path, speed: float, wait_timeout: float):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    server = ReplayServer(load_session(session), sys.stdout.buffer,
+                          speed=speed, wait_timeout=wait_timeout)
+    loop.create_task(read_async(reader, server))
+    await server.serve_async()
+    await server.exited.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('session', type=pathlib.Path)
+    parser.add_argument('--speed', type=float, default=1.0)
+    parser.add_argument('--wait-timeout', type=float, default=WAIT_TIMEOUT)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.session, args.speed, args.wait_timeout))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+'''
+results of read only requests while the document is unchanged.
+
+The key is (method, uri, document version, params). The client tells the
+versions from didOpen/didChange/didClose. A change drops the entries of
+the document, and the entries that may point into it (definition,
+references, ...). Least recently used entries go over max_bytes.
+
+A result is put only if nothing was invalidated while it was requested:
+take generation with make_key and pass it to put.
+
+A cached result is shared by the callers. Do not modify it.
+'''
+from typing import Dict, Tuple, Any, Optional, Callable
+import collections
+
+CACHED_METHODS = frozenset([
+    'textDocument/hover',
+    'textDocument/documentHighlight',
+    'textDocument/definition',
+    'textDocument/typeDefinition',
+    'textDocument/references',
+])
+# results have locations in other documents
+CROSS_DOCUMENT_METHODS = frozenset([
+    'textDocument/definition',
+    'textDocument/typeDefinition',
+    'textDocument/references',
+])
+# encoded result bytes
+MAX_BYTES = 4 * 1024 * 1024
+
+Key = Tuple[str, str, int, bytes]
+
+
+class ResponseCache:
+    def __init__(self, dumps: Callable[[Any], bytes], max_bytes: int = MAX_BYTES) -> None:
+        self.dumps = dumps
+        self.max_bytes = max_bytes
+        # key => (bytes, result). least recently used first
+        self._entries: collections.OrderedDict[Key, Tuple[int, Any]] = collections.OrderedDict()
+        # uri => version
+        self._versions: Dict[str, int] = {}
+        # counts the invalidations
+        self.generation = 0
+        self.bytes = 0
+        self.hit_count = 0
+        self.miss_count = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def on_notification(self, method: str, params):
+        match method:
+            case 'textDocument/didOpen' | 'textDocument/didChange':
+                text_document = params['textDocument']
+                self._versions[text_document['uri']] = text_document['version']
+                self.invalidate(text_document['uri'])
+            case 'textDocument/didClose':
+                uri = params['textDocument']['uri']
+                self._versions.pop(uri, None)
+                self.invalidate(uri)
+
+    def make_key(self, method: str, params) -> Optional[Key]:
+        '''
+        None if not cached
+        '''
+        if method not in CACHED_METHODS:
+            return None
+        uri = params['textDocument']['uri']
+        version = self._versions.get(uri)
+        if version is None:
+            # the document is not synced
+            return None
+        return (method, uri, version, self.dumps(params))
+
+    def get(self, key: Key) -> Tuple[bool, Any]:
+        '''
+        (found, result)
+        '''
+        entry = self._entries.get(key)
+        if entry is None:
+            self.miss_count += 1
+            return False, None
+        self._entries.move_to_end(key)
+        self.hit_count += 1
+        return True, entry[1]
+
+    def put(self, key: Key, result: Any, generation: int):
+        '''
+        generation: self.generation when the request was sent
+        '''
+        if generation != self.generation or self._versions.get(key[1]) != key[2]:
+            # changed while requesting
+            return
+        size = len(self.dumps(result))
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old:
+            self.bytes -= old[0]
+        self._entries[key] = (size, result)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+
+    def invalidate(self, uri: str):
+        self.generation += 1
+        for key in [key for key in self._entries
+                    if key[1] == uri or key[0] in CROSS_DOCUMENT_METHODS]:
+            self.bytes -= self._entries.pop(key)[0]
+
+    def get_stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'hits': self.hit_count,
+            'misses': self.miss_count,
+        }
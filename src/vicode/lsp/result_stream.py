@@ -0,0 +1,187 @@
+'''
+incremental parser for a large response body.
+
+The body is fed in chunks as it arrives. Once the response id is known,
+each element of the result array (Location[], SymbolInformation[], ...) or
+of result.items (CompletionList) is decoded and handed to the consumer as
+soon as its closing bracket arrives, instead of decoding the whole body.
+The returned message has that array emptied.
+
+If the result comes before the id, or the id is not a streaming request,
+the stream fails and the body is decoded as a whole.
+'''
+from typing import Optional, Callable, Any, Iterator
+import re
+import json
+import codecs
+
+# whitespace between tokens
+WS = re.compile(r'[ \t\n\r]*')
+# CompletionList
+STREAM_KEYS = ('items',)
+
+
+class StreamFailed(Exception):
+    pass
+
+
+class ResultStream:
+    def __init__(self, get_consumer: Callable[[Any], Optional[Callable[[Any], None]]]) -> None:
+        '''
+        get_consumer: request id => item callback, None if not streamed
+        '''
+        self._get_consumer = get_consumer
+        self._on_item: Optional[Callable[[Any], None]] = None
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._text = ''
+        self._pos = 0
+        self._final = False
+        # retry a value only after this much text arrived
+        self._wait_len = 0
+        self._parser = self._parse()
+        self.fed = 0
+        self.item_count = 0
+        self.failed = False
+        # the consumer is found. from here the items are handed out
+        self.committed = False
+        self.message_id = None
+        self.message: Optional[dict] = None
+
+    def feed(self, data: bytes):
+        if self.failed:
+            return
+        self.fed += len(data)
+        self._text += self._utf8.decode(data)
+        self._run()
+
+    def finish(self, data: bytes) -> Optional[dict]:
+        '''
+        the rest of the body. return the message, None if failed.
+        '''
+        self.feed(data)
+        if not self.failed and self.message is None:
+            self._text += self._utf8.decode(b'', final=True)
+            self._final = True
+            self._wait_len = 0
+            self._run()
+        if self.message is None:
+            self.failed = True
+        return self.message
+
+    def _run(self):
+        if len(self._text) < self._wait_len:
+            return
+        try:
+            next(self._parser)
+        except StopIteration:
+            pass
+        except (StreamFailed, ValueError):
+            self.failed = True
+        # drop consumed text
+        if self._pos > 64 * 1024 and self._pos * 2 > len(self._text):
+            self._text = self._text[self._pos:]
+            self._wait_len -= self._pos
+            self._pos = 0
+
+    #
+    # generators yield when they need more text
+    #
+    def _peek(self) -> Iterator[None]:
+        while True:
+            self._pos = WS.match(self._text, self._pos).end()
+            if self._pos < len(self._text):
+                return self._text[self._pos]
+            if self._final:
+                raise StreamFailed('unexpected end')
+            yield
+
+    def _expect(self, c: str) -> Iterator[None]:
+        if (yield from self._peek()) != c:
+            raise StreamFailed(f'expected {c}')
+        self._pos += 1
+
+    def _value(self) -> Iterator[None]:
+        start = yield from self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._text, self._pos)
+                # a number or literal may continue in the next chunk
+                if end < len(self._text) or self._final:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._final:
+                    raise
+            # incomplete. retry after the text after pos doubled
+            self._wait_len = len(self._text) * 2 - self._pos
+            yield
+
+    def _array(self) -> Iterator[None]:
+        assert(self._on_item)
+        yield from self._expect('[')
+        while True:
+            c = yield from self._peek()
+            if c == ']':
+                self._pos += 1
+                return
+            if c == ',':
+                self._pos += 1
+                continue
+            item = yield from self._value()
+            self.item_count += 1
+            self._on_item(item)
+
+    def _result(self) -> Iterator[None]:
+        c = yield from self._peek()
+        if c == '[':
+            yield from self._array()
+            return []
+        if c != '{':
+            return (yield from self._value())
+
+        result = {}
+        self._pos += 1
+        while True:
+            c = yield from self._peek()
+            if c == '}':
+                self._pos += 1
+                return result
+            if c == ',':
+                self._pos += 1
+                continue
+            key = yield from self._value()
+            yield from self._expect(':')
+            if key in STREAM_KEYS and (yield from self._peek()) == '[':
+                yield from self._array()
+                result[key] = []
+            else:
+                result[key] = yield from self._value()
+
+    def _parse(self) -> Iterator[None]:
+        message = {}
+        yield from self._expect('{')
+        while True:
+            c = yield from self._peek()
+            if c == '}':
+                break
+            if c == ',':
+                self._pos += 1
+                continue
+            key = yield from self._value()
+            yield from self._expect(':')
+            if key == 'method':
+                # a notification or a server request
+                raise StreamFailed('not a response')
+            if key == 'result':
+                if 'id' not in message:
+                    raise StreamFailed('result before id')
+                self._on_item = self._get_consumer(message['id'])
+                if not self._on_item:
+                    raise StreamFailed('not streamed')
+                self.committed = True
+                self.message_id = message['id']
+                message[key] = yield from self._result()
+            else:
+                message[key] = yield from self._value()
+        self.message = message
@@ -0,0 +1,174 @@
+'''
+outbound LSP traffic of one client.
+
+* SYNC: document sync notifications. sent first, in order, as one batch.
+* INTERACTIVE: hover, completion, ... someone is waiting for it.
+* BULK: references, symbols, ... at most max_bulk in flight.
+
+A request put with a key supersedes the older one with the same key,
+ex. ('textDocument/hover', uri). A queued one is dropped, an in-flight one
+is cancelled ($/cancelRequest), and its future is cancelled.
+'''
+from typing import Dict, List, Tuple, Set, Any, Optional, Hashable
+from enum import IntEnum
+import heapq
+import asyncio
+import logging
+from .client import Client
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    SYNC = 0
+    INTERACTIVE = 1
+    BULK = 2
+
+
+class Job:
+    def __init__(self, priority: Priority, method: str, params, key: Optional[Hashable]) -> None:
+        self.priority = priority
+        self.method = method
+        self.params = params
+        self.key = key
+        self.future: Optional[asyncio.Future] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def on_done(self, future: asyncio.Future):
+        if future.cancelled() and self.task:
+            # superseded or abandoned by the caller
+            self.task.cancel()
+
+
+class RequestScheduler:
+    def __init__(self, client: Client, *, max_bulk: int = 1) -> None:
+        self.client = client
+        self.max_bulk = max_bulk
+        self._heap: List[Tuple[int, int, Job]] = []
+        self._seq = 0
+        # key => latest job
+        self._keys: Dict[Hashable, Job] = {}
+        self._bulk_running = 0
+        self._running: Set[Job] = set()
+        self._wakeup = asyncio.Event()
+        self.superseded_count = 0
+        # the client is gone. see close
+        self.closed = False
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._heap)
+
+    @property
+    def in_flight_count(self) -> int:
+        return len(self._running)
+
+    def _push(self, job: Job):
+        heapq.heappush(self._heap, (job.priority, self._seq, job))
+        self._seq += 1
+        self._wakeup.set()
+
+    def notify(self, method: str, params):
+        if self.closed:
+            return
+        self._push(Job(Priority.SYNC, method, params, None))
+
+    def request(self, method: str, params, *,
+                priority: Priority = Priority.INTERACTIVE, key: Optional[Hashable] = None) -> asyncio.Future:
+        '''
+        the future is cancelled if a newer request with the same key is put.
+        '''
+        assert(priority != Priority.SYNC)
+        job = Job(priority, method, params, key)
+        job.future = asyncio.get_running_loop().create_future()
+        if self.closed:
+            job.future.set_exception(ConnectionError('language server closed'))
+            return job.future
+        job.future.add_done_callback(job.on_done)
+        if key is not None:
+            old = self._keys.get(key)
+            if old and old.future:
+                self.superseded_count += 1
+                old.future.cancel()
+            self._keys[key] = job
+        self._push(job)
+        return job.future
+
+    async def run_async(self):
+        '''
+        start after initialize.
+        '''
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self._schedule()
+            except ConnectionError as e:
+                logger.warning(f'{e}')
+                self.close()
+                return
+
+    def _schedule(self):
+        notifications: List[Tuple[str, Any]] = []
+        deferred: List[Job] = []
+        while self._heap:
+            _, _, job = heapq.heappop(self._heap)
+            if job.priority == Priority.SYNC:
+                notifications.append((job.method, job.params))
+                continue
+            if notifications:
+                # sync goes out before the requests that follow
+                self.client.notify_batch(notifications)
+                notifications = []
+            assert(job.future)
+            if job.future.done():
+                # superseded or abandoned
+                continue
+            if job.priority == Priority.BULK and self._bulk_running >= self.max_bulk:
+                deferred.append(job)
+                continue
+            self._start(job)
+        if notifications:
+            self.client.notify_batch(notifications)
+        for job in deferred:
+            heapq.heappush(self._heap, (job.priority, self._seq, job))
+            self._seq += 1
+
+    def close(self):
+        '''
+        the client is gone. queued and in-flight requests are cancelled, later ones fail
+        '''
+        self.closed = True
+        for _, _, job in self._heap:
+            if job.future:
+                job.future.cancel()
+        self._heap.clear()
+        for job in list(self._running):
+            assert(job.future)
+            job.future.cancel()
+
+    def _start(self, job: Job):
+        if job.priority == Priority.BULK:
+            self._bulk_running += 1
+        self._running.add(job)
+        job.task = asyncio.get_running_loop().create_task(self._run_async(job))
+
+    async def _run_async(self, job: Job):
+        assert(job.future)
+        try:
+            result = await self.client.request_async(job.method, job.params)
+            if not job.future.done():
+                job.future.set_result(result)
+        except asyncio.CancelledError:
+            job.future.cancel()
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            self._running.discard(job)
+            if job.key is not None and self._keys.get(job.key) is job:
+                del self._keys[job.key]
+            if job.priority == Priority.BULK:
+                self._bulk_running -= 1
+                # a deferred bulk job may start
+                self._wakeup.set()
@@ -0,0 +1,51 @@
+'''
+record framed messages of a language server session.
+
+one json object per line:
+{"t": seconds from start, "dir": "send" | "recv", "body": message json text}
+
+send: client to server, recv: server to client
+'''
+from typing import NamedTuple, List, TextIO
+import json
+import pathlib
+import time
+
+SEND = 'send'
+RECV = 'recv'
+
+
+class RecordedMessage(NamedTuple):
+    t: float
+    direction: str
+    body: bytes
+
+
+class SessionRecorder:
+    def __init__(self, path: pathlib.Path) -> None:
+        self.path = path
+        self._file: TextIO = path.open('w', encoding='utf-8')
+        self._start = time.monotonic()
+
+    def record(self, direction: str, body: bytes):
+        self._file.write(json.dumps({
+            't': time.monotonic() - self._start,
+            'dir': direction,
+            'body': body.decode('utf-8'),
+        }, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def load_session(path: pathlib.Path) -> List[RecordedMessage]:
+    messages = []
+    with path.open(encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            messages.append(RecordedMessage(
+                record['t'], record['dir'], record['body'].encode('utf-8')))
+    return messages
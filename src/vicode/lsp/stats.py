@@ -0,0 +1,173 @@
+'''
+per method latency and size of the json-rpc traffic
+'''
+from typing import Dict, List, Optional
+import bisect
+import time
+
+# milliseconds
+LATENCY_BOUNDS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+
+class Histogram:
+    def __init__(self, bounds: List[float]) -> None:
+        self.bounds = bounds
+        # last bucket is overflow
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> float:
+        '''
+        upper bound of the bucket that contains p (0-100)
+        '''
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'bounds': self.bounds,
+            'buckets': self.buckets,
+        }
+
+
+class RequestStats:
+    def __init__(self) -> None:
+        # ms
+        self.latency = Histogram(LATENCY_BOUNDS)
+        self.count = 0
+        self.errors = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.max_response_bytes = 0
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'request_bytes': self.request_bytes,
+            'response_bytes': self.response_bytes,
+            'max_response_bytes': self.max_response_bytes,
+            'latency_ms': self.latency.snapshot(),
+        }
+
+
+class NotificationStats:
+    def __init__(self, now: float) -> None:
+        self.count = 0
+        self.bytes = 0
+        self.max_bytes = 0
+        self.first = now
+        self.last = now
+
+    def rate(self, now: float) -> float:
+        '''
+        per second since first
+        '''
+        elapsed = now - self.first
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def snapshot(self, now: float) -> dict:
+        return {
+            'count': self.count,
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'per_sec': self.rate(now),
+        }
+
+
+class RpcStats:
+    '''
+    out: client to server, in: server to client
+    '''
+
+    def __init__(self) -> None:
+        self.start = time.monotonic()
+        self.requests: Dict[str, RequestStats] = {}
+        self.server_requests: Dict[str, RequestStats] = {}
+        self.notifications_out: Dict[str, NotificationStats] = {}
+        self.notifications_in: Dict[str, NotificationStats] = {}
+
+    def on_request(self, method: str, size: int):
+        stats = self.requests.get(method)
+        if not stats:
+            stats = RequestStats()
+            self.requests[method] = stats
+        stats.count += 1
+        stats.request_bytes += size
+
+    def on_response(self, method: str, seconds: float, size: int, is_error: bool):
+        stats = self.requests.get(method)
+        if not stats:
+            return
+        stats.latency.add(seconds * 1000)
+        stats.response_bytes += size
+        if size > stats.max_response_bytes:
+            stats.max_response_bytes = size
+        if is_error:
+            stats.errors += 1
+
+    def on_server_request(self, method: str, seconds: float, size: int, is_error: bool):
+        stats = self.server_requests.get(method)
+        if not stats:
+            stats = RequestStats()
+            self.server_requests[method] = stats
+        stats.count += 1
+        stats.request_bytes += size
+        stats.latency.add(seconds * 1000)
+        if is_error:
+            stats.errors += 1
+
+    def _on_notification(self, stats_map: Dict[str, NotificationStats], method: str, size: int):
+        now = time.monotonic()
+        stats = stats_map.get(method)
+        if not stats:
+            stats = NotificationStats(now)
+            stats_map[method] = stats
+        stats.count += 1
+        stats.bytes += size
+        if size > stats.max_bytes:
+            stats.max_bytes = size
+        stats.last = now
+
+    def on_notification_out(self, method: str, size: int):
+        self._on_notification(self.notifications_out, method, size)
+
+    def on_notification_in(self, method: str, size: int):
+        self._on_notification(self.notifications_in, method, size)
+
+    def snapshot(self, now: Optional[float] = None) -> dict:
+        if now is None:
+            now = time.monotonic()
+        return {
+            'elapsed': now - self.start,
+            'requests': {k: v.snapshot() for k, v in self.requests.items()},
+            'server_requests': {k: v.snapshot() for k, v in self.server_requests.items()},
+            'notifications_out': {k: v.snapshot(now) for k, v in self.notifications_out.items()},
+            'notifications_in': {k: v.snapshot(now) for k, v in self.notifications_in.items()},
+        }
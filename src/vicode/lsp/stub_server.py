@@ -0,0 +1,213 @@
+'''
+scriptable fake language server for load testing.
+
+python -m vicode.lsp.stub_server [--diagnostics N] [--publishes K] [--rate R]
+                                 [--delay SEC] [--payload-size BYTES] [--incomplete]
+
+didOpen/didChange publish K publishDiagnostics of N items for the document,
+R publishes per second (0: no wait). Every request is answered after SEC.
+completion and hover results are padded to about BYTES.
+--incomplete answers completion with isIncomplete.
+completionItem/resolve adds documentation.
+semanticTokens/range and inlayHint give one per line, codeLens one per 10 lines.
+$/stub/document answers the text and version of a document as synced.
+A change with an old version is dropped.
+'''
+from typing import List, Dict, Tuple
+import sys
+import asyncio
+import argparse
+from . import jsonrpc_2_0
+from . import protocol
+from .daemon import apply_changes
+
+
+class StubServer:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.exited = asyncio.Event()
+        self.dispatcher: jsonrpc_2_0.RpcDispatcher
+        # uri => lines at didOpen
+        self.line_counts: Dict[str, int] = {}
+        # uri => (version, text)
+        self.documents: Dict[str, Tuple[int, str]] = {}
+
+    def start(self, dispatcher: jsonrpc_2_0.RpcDispatcher):
+        self.dispatcher = dispatcher
+        for method, handler in [
+            ('initialize', self.initialize_async),
+            ('shutdown', self.shutdown_async),
+            ('textDocument/completion', self.completion_async),
+            ('completionItem/resolve', self.resolve_async),
+            ('textDocument/hover', self.hover_async),
+            ('textDocument/semanticTokens/range', self.semantic_tokens_range_async),
+            ('textDocument/inlayHint', self.inlay_hint_async),
+            ('textDocument/codeLens', self.code_lens_async),
+            ('$/stub/document', self.document_async),
+        ]:
+            dispatcher.register_request_handler(method, handler)
+
+    async def _delay_async(self):
+        if self.args.delay > 0:
+            await asyncio.sleep(self.args.delay)
+
+    async def initialize_async(self, params):
+        await self._delay_async()
+        return {
+            'capabilities': {
+                # incremental
+                'textDocumentSync': {'openClose': True, 'change': 2},
+                'completionProvider': {'resolveProvider': True},
+                'hoverProvider': True,
+                'semanticTokensProvider': {
+                    'legend': {'tokenTypes': ['variable'], 'tokenModifiers': []},
+                    'range': True,
+                },
+                'inlayHintProvider': True,
+                'codeLensProvider': {},
+            },
+            'serverInfo': {'name': 'vicode-stub'},
+        }
+
+    async def shutdown_async(self, params):
+        return None
+
+    async def completion_async(self, params):
+        await self._delay_async()
+        items = []
+        size = 0
+        i = 0
+        while size < self.args.payload_size or not items:
+            label = f'stub_item_{i}'
+            items.append({'label': label, 'kind': 3,
+                         'detail': f'stub.{label}', 'sortText': f'{i:08d}'})
+            size += 80 + len(label) * 2
+            i += 1
+        return {'isIncomplete': self.args.incomplete, 'items': items}
+
+    async def resolve_async(self, params):
+        await self._delay_async()
+        return dict(params, documentation=f'doc of {params["label"]}')
+
+    async def hover_async(self, params):
+        await self._delay_async()
+        return {'contents': {'kind': 'plaintext', 'value': 'x' * self.args.payload_size}}
+
+    def _lines(self, params) -> range:
+        line_count = self.line_counts.get(params['textDocument']['uri'], 0)
+        return range(params['range']['start']['line'],
+                     min(params['range']['end']['line'], line_count))
+
+    async def semantic_tokens_range_async(self, params):
+        await self._delay_async()
+        data = []
+        prev = 0
+        for line in self._lines(params):
+            data.extend([line - prev, 0, 1, 0, 0])
+            prev = line
+        return {'data': data}
+
+    async def inlay_hint_async(self, params):
+        await self._delay_async()
+        return [{'position': {'line': line, 'character': 0}, 'label': ': stub'}
+                for line in self._lines(params)]
+
+    async def code_lens_async(self, params):
+        await self._delay_async()
+        line_count = self.line_counts.get(params['textDocument']['uri'], 0)
+        return [{'range': {'start': {'line': line, 'character': 0}, 'end': {'line': line, 'character': 0}},
+                 'command': {'title': f'stub lens {line}', 'command': ''}}
+                for line in range(0, line_count, 10)]
+
+    async def document_async(self, params):
+        version, text = self.documents[params['textDocument']['uri']]
+        return {'version': version, 'text': text}
+
+    async def on_notification_async(self, method: str, params):
+        match method:
+            case 'textDocument/didOpen':
+                text_document = params['textDocument']
+                self.line_counts[text_document['uri']] = text_document['text'].count(
+                    '\n') + 1
+                self.documents[text_document['uri']] = (
+                    text_document['version'], text_document['text'])
+                asyncio.get_running_loop().create_task(
+                    self.publish_async(text_document['uri']))
+            case 'textDocument/didChange':
+                uri = params['textDocument']['uri']
+                version, text = self.documents[uri]
+                if params['textDocument']['version'] <= version:
+                    # stale
+                    return
+                self.documents[uri] = (params['textDocument']['version'],
+                                       apply_changes(text, params['contentChanges']))
+                asyncio.get_running_loop().create_task(self.publish_async(uri))
+            case 'exit':
+                self.exited.set()
+
+    def make_diagnostics(self, uri: str, publish: int) -> protocol.PublishDiagnosticsParams:
+        diagnostics: List[protocol.Diagnostic] = []
+        for i in range(self.args.diagnostics):
+            diagnostics.append(protocol.Diagnostic(
+                range=protocol.Range(
+                    start=protocol.Position(line=i, character=0),
+                    end=protocol.Position(line=i, character=1)),
+                message=f'stub diagnostic {publish}:{i}',
+                severity=protocol.DiagnosticSeverity.Warning,
+                source='stub',
+            ))
+        return protocol.PublishDiagnosticsParams(uri=uri, diagnostics=diagnostics)
+
+    async def publish_async(self, uri: str):
+        for i in range(self.args.publishes):
+            if i and self.args.rate > 0:
+                await asyncio.sleep(1 / self.args.rate)
+            self.dispatcher.notify('textDocument/publishDiagnostics',
+                                   self.make_diagnostics(uri, i))
+
+
+async def main_async(args: argparse.Namespace):
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    transport, protocol = await loop.connect_write_pipe(
+        asyncio.streams.FlowControlMixin, sys.stdout)
+    writer = jsonrpc_2_0.MessageWriter(
+        asyncio.StreamWriter(transport, protocol, None, loop))
+    writer.start(loop)
+
+    server = StubServer(args)
+    dispatcher = jsonrpc_2_0.RpcDispatcher(
+        server.on_notification_async, writer, max_concurrent_requests=64)
+    server.start(dispatcher)
+
+    async def read_async():
+        while await dispatcher.read_rpc_message_async(reader):
+            pass
+        server.exited.set()
+    loop.create_task(read_async())
+
+    await server.exited.wait()
+    await writer.flush_async()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--diagnostics', type=int, default=1,
+                        help='diagnostics per publish')
+    parser.add_argument('--publishes', type=int, default=1,
+                        help='publishDiagnostics per didOpen/didChange')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='publishes per second. 0: no wait')
+    parser.add_argument('--delay', type=float, default=0,
+                        help='seconds before each response')
+    parser.add_argument('--payload-size', type=int, default=1024,
+                        help='approximate bytes of completion and hover results')
+    parser.add_argument('--incomplete', action='store_true',
+                        help='completion results are isIncomplete')
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
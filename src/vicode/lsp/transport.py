@@ -0,0 +1,73 @@
+'''
+socket transports.
+
+address:
+    tcp://HOST:PORT
+    unix://PATH
+'''
+from typing import Tuple, Callable, Awaitable, List
+import os
+import sys
+import hashlib
+import pathlib
+import tempfile
+import asyncio
+
+# StreamReader buffer. a single response may be several MB
+STREAM_LIMIT = 2 ** 26
+
+ConnectedCallback = Callable[[asyncio.StreamReader, asyncio.StreamWriter], Awaitable[None]]
+
+
+def parse_address(address: str) -> Tuple[str, str, int]:
+    '''
+    return (scheme, host or path, port)
+    '''
+    scheme, sep, rest = address.partition('://')
+    if not sep:
+        raise ValueError(f'invalid address: {address}')
+    match scheme:
+        case 'tcp':
+            host, _, port = rest.rpartition(':')
+            return scheme, host or '127.0.0.1', int(port)
+        case 'unix':
+            return scheme, rest, 0
+        case _:
+            raise ValueError(f'unknown scheme: {address}')
+
+
+async def open_connection_async(address: str) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    scheme, host, port = parse_address(address)
+    match scheme:
+        case 'tcp':
+            return await asyncio.open_connection(host, port, limit=STREAM_LIMIT)
+        case 'unix':
+            return await asyncio.open_unix_connection(host, limit=STREAM_LIMIT)
+        case _:
+            raise NotImplementedError(scheme)
+
+
+async def start_server_async(address: str, callback: ConnectedCallback) -> asyncio.AbstractServer:
+    scheme, host, port = parse_address(address)
+    match scheme:
+        case 'tcp':
+            return await asyncio.start_server(callback, host, port, limit=STREAM_LIMIT)
+        case 'unix':
+            # stale socket from a dead daemon
+            if os.path.exists(host):
+                os.unlink(host)
+            return await asyncio.start_unix_server(callback, host, limit=STREAM_LIMIT)
+        case _:
+            raise NotImplementedError(scheme)
+
+
+def default_daemon_address(workspace_dir: pathlib.Path, command: List[str]) -> str:
+    '''
+    one daemon per workspace and server command
+    '''
+    key = hashlib.sha1(
+        '\0'.join([str(workspace_dir.absolute()), *command]).encode('utf-8')).hexdigest()[:16]
+    if sys.platform == 'win32':
+        # no unix socket. derive a port
+        return f'tcp://127.0.0.1:{49152 + int(key, 16) % 16000}'
+    return f'unix://{tempfile.gettempdir()}/vicode-{os.getuid()}-{key}.sock'
@@ -1,9 +1,14 @@
-from typing import Dict, Optional, NamedTuple
+from typing import Dict, Optional, List, Callable, Any
+from enum import Enum, auto
 import os
+import time
+import functools
+import collections
 import asyncio
 import pathlib
 import logging
-from .editor.editor_document import EditorDocument
+from .editor.editor_document import EditorDocument, FILE_TYPE_MAP
+from .editor import semantic_tokens
 from . import lsp
 
 logger = logging.getLogger(__name__)
@@ -16,82 +21,506 @@ def get_workspace_dir(path: pathlib.Path) -> pathlib.Path:
     return path
 
 
-class DocumentActivate(NamedTuple):
-    close_path: Optional[pathlib.Path]
-    path: pathlib.Path
-    filetype: str
-    text: str
-    version: int
+# servers launching and initializing at once in warm_up_async
+WARM_UP_CONCURRENCY = 2
+# files looked at by scan_filetypes. a huge tree does not keep a disk busy
+SCAN_LIMIT = 20000
+# not scanned
+SKIP_DIRS = frozenset([
+    '.git', '.hg', '.svn', '.tox', '.venv', 'venv', 'node_modules', '__pycache__',
+])
 
 
-async def process_async(queue: asyncio.Queue, client: lsp.client.Client, loop: asyncio.AbstractEventLoop):
+def scan_filetypes(root: pathlib.Path, limit: int = SCAN_LIMIT) -> List[str]:
+    '''
+    filetypes of FILE_TYPE_MAP under root, in the order found
+    '''
+    found: List[str] = []
+    count = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+        for filename in filenames:
+            filetype = FILE_TYPE_MAP.get(os.path.splitext(filename)[1].lower())
+            if filetype and filetype not in found:
+                found.append(filetype)
+                if len(found) == len(set(FILE_TYPE_MAP.values())):
+                    return found
+            count += 1
+            if count >= limit:
+                return found
+    return found
+
+
+def make_client_capabilities() -> lsp.protocol.ClientCapabilities:
+    return lsp.protocol.ClientCapabilities(
+        textDocument=lsp.protocol.TextDocumentClientCapabilities(
+            completion=lsp.protocol.CompletionClientCapabilities(
+                completionItem=lsp.protocol.CompletionItem(
+                    documentationFormat=['plaintext', 'markdown'],
+                    # lean completion lists. see editor.lsp_completer
+                    resolveSupport=lsp.protocol.ResolveSupport(
+                        properties=['detail', 'documentation']),
+                ),
+                contextSupport=True,
+            ),
+            semanticTokens=lsp.protocol.SemanticTokensClientCapabilities(
+                requests=lsp.protocol.Requests(
+                    range=True, full=lsp.protocol.Full(delta=True)),
+                tokenTypes=semantic_tokens.TOKEN_TYPES,
+                tokenModifiers=[],
+                formats=['relative'],
+            ),
+            inlayHint=lsp.protocol.InlayHintClientCapabilities(),
+            codeLens=lsp.protocol.CodeLensClientCapabilities(),
+        ),
+    )
+
+
+async def process_async(scheduler: lsp.scheduler.RequestScheduler, client: lsp.client.Client, loop: asyncio.AbstractEventLoop,
+                        on_initialized: Optional[Callable[[], None]] = None):
     logger.debug(f'{client}: launch...')
     await client.launch(loop)
 
     # initialize
     response = await client.request_initialize(lsp.protocol.InitializeParams(
         processId=os.getpid(),
-        capabilities=lsp.protocol.ClientCapabilities(),
+        capabilities=make_client_capabilities(),
     ))
 
     # initialized
     client.notify_initialized(lsp.protocol.InitializedParams())
 
     logger.info(f'{client}: initialized')
+    if on_initialized:
+        on_initialized()
+
+    # traffic queued meanwhile goes out now
+    await scheduler.run_async()
+
+
+# documents kept open on one server. switching among them sends nothing
+MAX_OPEN_DOCUMENTS = 16
+
+# seconds. the delay before a restart doubles on each crash in a row
+RESTART_DELAY = 0.5
+MAX_RESTART_DELAY = 30.0
+# a server up this long is stable. its next crash starts from RESTART_DELAY
+STABLE_TIME = 60.0
+# crashes in a row before giving up
+MAX_RESTARTS = 5
+# no traffic this long stops the server. the next use relaunches it
+IDLE_TIMEOUT = 30 * 60.0
+# shutdown and exit, then the process end
+SHUTDOWN_TIMEOUT = 2.0
+# after terminate, then after kill
+KILL_TIMEOUT = 1.0
+
 
+class ServerState(Enum):
+    # launching, or waiting to restart
+    STARTING = auto()
+    READY = auto()
+    # stopped for idleness
+    IDLE = auto()
+    # crashed MAX_RESTARTS times in a row
+    FAILED = auto()
+    # told to exit
+    EXITED = auto()
+
+
+async def stop_client_async(client: lsp.client.Client, timeout: float = SHUTDOWN_TIMEOUT,
+                            kill_timeout: float = KILL_TIMEOUT) -> str:
+    '''
+    shutdown and exit. terminated, then killed, if the server does not follow in time.
+    return the last step: 'none' if not launched, 'exit', 'terminate' or 'kill'
+    '''
+    if not client.launched:
+        return 'none'
+
+    async def exit_async():
+        await client.request_shutdown()
+        client.notify_exit()
+        await client.writer.flush_async()
+        await client.wait_exited_async()
+    try:
+        await asyncio.wait_for(exit_async(), timeout)
+        return 'exit'
+    except Exception as e:
+        logger.warning(f'{client}: {e!r}. terminate')
+
+    client.terminate()
+    try:
+        await asyncio.wait_for(client.wait_exited_async(), kill_timeout)
+        return 'terminate'
+    except asyncio.TimeoutError:
+        logger.warning(f'{client}: kill')
+    client.kill()
+    try:
+        await asyncio.wait_for(client.wait_exited_async(), kill_timeout)
+    except asyncio.TimeoutError:
+        logger.error(f'{client}: not exited')
+    return 'kill'
+
+
+async def supervise_async(handler: 'ClientHandler', loop: asyncio.AbstractEventLoop):
+    '''
+    run the server of handler. relaunch it after a crash with backoff,
+    stop it after idle_timeout and relaunch it on the next use
+    '''
+    failures = 0
     while True:
-        lsp_command = await queue.get()
-        logger.debug(type(lsp_command))
-        match lsp_command:
-            case DocumentActivate(active, path, filetype, text, version):
-                if active:
-                    client.notify_textDocument_didClose(lsp.protocol.DidCloseTextDocumentParams(
-                        textDocument=lsp.protocol.TextDocumentIdentifier(
-                            uri=str(active)
-                        )
-                    ))
-
-                logger.info(f'notify_textDocument_didOpen')
-                client.notify_textDocument_didOpen(lsp.protocol.DidOpenTextDocumentParams(
-                    textDocument=lsp.protocol.TextDocumentItem(
-                        uri=str(path),
-                        languageId=filetype,
-                        version=version,
-                        text=text
-                    )
-                ))
+        client = handler.client
+        scheduler = handler.scheduler
+        task = loop.create_task(process_async(
+            scheduler, client, loop, handler.on_initialized))
+        started = loop.time()
+        try:
+            idle = await handler.watch_async(task)
+        except asyncio.CancelledError:
+            # see ClientHandler.close
+            task.cancel()
+            raise
+        error = task.exception() if task.done() else None
+        task.cancel()
+        scheduler.close()
+
+        if idle:
+            logger.info(f'{client}: idle. stop')
+            handler.replace_client(ServerState.IDLE)
+            handler.idle_stop_count += 1
+            # not cut short by close
+            await asyncio.shield(stop_client_async(client))
+            await handler.wakeup.wait()
+            failures = 0
+            continue
+
+        if client.exit_sent:
+            handler.state = ServerState.EXITED
+            return
+        # may be alive, ex. initialize timed out
+        client.terminate()
+        if not handler.factory:
+            handler.state = ServerState.FAILED
+            return
+        if loop.time() - started >= STABLE_TIME:
+            failures = 0
+        if failures >= MAX_RESTARTS:
+            logger.error(f'{client}: {error or "closed"}. give up after {failures} restarts')
+            handler.state = ServerState.FAILED
+            return
+        delay = min(MAX_RESTART_DELAY, RESTART_DELAY * 2 ** failures)
+        failures += 1
+        logger.warning(f'{client}: {error or "closed"}. restart in {delay}s')
+        handler.replace_client(ServerState.STARTING)
+        await asyncio.sleep(delay)
+        handler.restart_count += 1
+
+
+def on_response(future: asyncio.Future, on_result: Callable[[Any], None],
+                on_error: Optional[Callable[[], None]] = None):
+    '''
+    on_result and redraw. nothing if superseded
+    '''
+    def on_done(future: asyncio.Future):
+        if future.cancelled():
+            return
+        e = future.exception()
+        if e:
+            logger.warning(f'{e}')
+            if on_error:
+                on_error()
+            return
+        on_result(future.result())
+        from prompt_toolkit.application.current import get_app
+        get_app().invalidate()
+    future.add_done_callback(on_done)
 
 
 class ClientHandler:
-    def __init__(self, filetype: str, client: lsp.client.Client):
+    '''
+    one language server and the documents open on it. see supervise_async
+    '''
+
+    def __init__(self, filetype: str, client: lsp.client.Client, max_open: int = MAX_OPEN_DOCUMENTS, *,
+                 factory: Optional[Callable[[], Optional[lsp.client.Client]]] = None,
+                 idle_timeout: Optional[float] = IDLE_TIMEOUT,
+                 on_ready: Optional[Callable[['ClientHandler'], None]] = None):
+        '''
+        factory: a new client to restart. None: not restarted
+        idle_timeout: None: not stopped for idleness
+        on_ready: initialized, the first time or relaunched. send the open documents
+        '''
         self.filetype = filetype
         self.client = client
-        self._active: Optional[pathlib.Path] = None
-        self._version = 0
-        self.queue = asyncio.Queue()
+        self.max_open = max_open
+        self.factory = factory
+        self.idle_timeout = idle_timeout
+        self.on_ready = on_ready
+        # least recently activated first
+        self._open: collections.OrderedDict[pathlib.Path, None] = collections.OrderedDict()
+        self.scheduler = lsp.scheduler.RequestScheduler(client)
+        self._state_changed = asyncio.Event()
+        self.state = ServerState.STARTING
+        # time.monotonic() of the last use
+        self.last_active = time.monotonic()
+        # set on each use. relaunches an idle server
+        self.wakeup = asyncio.Event()
+        self.restart_count = 0
+        self.idle_stop_count = 0
+        # supervise_async
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def state(self) -> ServerState:
+        return self._state
+
+    @state.setter
+    def state(self, state: ServerState):
+        self._state = state
+        self._state_changed.set()
+
+    async def wait_ready_async(self) -> bool:
+        '''
+        until initialized or given up. True if ready
+        '''
+        while self.state == ServerState.STARTING:
+            self._state_changed.clear()
+            await self._state_changed.wait()
+        return self.ready
+
+    @property
+    def ready(self) -> bool:
+        '''
+        initialized. otherwise notifications are not sent, the open documents are sent on ready
+        '''
+        return self.state == ServerState.READY
+
+    @property
+    def open_paths(self) -> List[pathlib.Path]:
+        return list(self._open)
+
+    def on_initialized(self):
+        self.state = ServerState.READY
+        self.last_active = time.monotonic()
+        if self.on_ready:
+            self.on_ready(self)
+
+    def on_used(self):
+        self.last_active = time.monotonic()
+        self.wakeup.set()
+
+    def close(self):
+        '''
+        no more restarts or requests. the server is left to stop_client_async
+        '''
+        if self.task:
+            self.task.cancel()
+        self.scheduler.close()
+        self.state = ServerState.EXITED
+
+    def replace_client(self, state: ServerState):
+        '''
+        the server is gone. requests from now on wait for a new one
+        '''
+        assert(self.factory)
+        client = self.factory()
+        assert(client)
+        # diagnostics, ... go on to the new server
+        client.callbacks = self.client.callbacks
+        self.client = client
+        self.scheduler = lsp.scheduler.RequestScheduler(self.client)
+        self.state = state
+        self.wakeup.clear()
+
+    async def watch_async(self, task: asyncio.Task) -> bool:
+        '''
+        until the server is gone or idle. True if idle
+        '''
+        closed = asyncio.get_running_loop().create_task(self.client.closed.wait())
+        try:
+            while True:
+                timeout = None
+                if self.idle_timeout is not None and self.factory:
+                    timeout = self.last_active + self.idle_timeout - time.monotonic()
+                    if timeout <= 0:
+                        if self.ready and not self.scheduler.queue_depth and not self.scheduler.in_flight_count:
+                            return True
+                        # launching or a long request is use
+                        self.last_active = time.monotonic()
+                        continue
+                done, _ = await asyncio.wait([task, closed], timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if done:
+                    return False
+        finally:
+            closed.cancel()
 
     def on_error(self, message: str):
         logger.warn(f'{self}: {message}')
 
-    def activate(self, path: pathlib.Path, filetype: str, text: str):
-        if path == self._active:
+    def is_open(self, path: pathlib.Path) -> bool:
+        return path in self._open
+
+    def touch(self, path: pathlib.Path) -> bool:
+        '''
+        mark as most recently used. return False if not open
+        '''
+        if path not in self._open:
+            return False
+        self._open.move_to_end(path)
+        return True
+
+    def activate(self, path: pathlib.Path) -> bool:
+        '''
+        mark as open. return True if open should send didOpen now
+        '''
+        self.on_used()
+        if self.touch(path):
+            return False
+        while len(self._open) >= self.max_open:
+            evicted, _ = self._open.popitem(last=False)
+            if not self.ready:
+                continue
+            self.scheduler.notify('textDocument/didClose', lsp.protocol.DidCloseTextDocumentParams(
+                textDocument=lsp.protocol.TextDocumentIdentifier(
+                    uri=str(evicted)
+                )
+            ))
+        self._open[path] = None
+        return self.ready
+
+    def open(self, path: pathlib.Path, filetype: str, text: str, version: int = 1):
+        logger.info(f'notify_textDocument_didOpen')
+        self.scheduler.notify('textDocument/didOpen', lsp.protocol.DidOpenTextDocumentParams(
+            textDocument=lsp.protocol.TextDocumentItem(
+                uri=str(path),
+                languageId=filetype,
+                version=version,
+                text=text
+            )
+        ))
+
+    def change(self, path: pathlib.Path, version: int, changes: List[lsp.protocol.TextDocumentContentChangeEvent]):
+        if not self.ready or not self.is_open(path):
             return
-        self.queue.put_nowait(DocumentActivate(
-            self._active, path, filetype, text, 1))
-        self._version = 1
-        self._active = path
+        self.on_used()
+        self.scheduler.notify('textDocument/didChange', lsp.protocol.DidChangeTextDocumentParams(
+            textDocument=lsp.protocol.VersionedTextDocumentIdentifier(
+                uri=str(path),
+                version=version,
+            ),
+            contentChanges=changes,
+        ))
+
+    def request_completion(self, path: pathlib.Path, position: lsp.protocol.Position,
+                           trigger_kind: int = 1) -> asyncio.Future:
+        '''
+        a newer completion of the document supersedes this
+        '''
+        return self.request('textDocument/completion', lsp.protocol.CompletionParams(
+            textDocument=lsp.protocol.TextDocumentIdentifier(uri=str(path)),
+            position=position,
+            context=lsp.protocol.CompletionContext(triggerKind=trigger_kind),
+        ), key=('textDocument/completion', path))
+
+    def request_semantic_tokens(self, path: pathlib.Path, previous_result_id: Optional[str]) -> Optional[asyncio.Future]:
+        '''
+        full/delta if the server has it and previous_result_id. None if no semantic tokens
+        '''
+        provider = self.client.server_capabilities.get('semanticTokensProvider')
+        if not provider or not provider.get('full') or provider.get('range'):
+            # the viewport requests ranges
+            return None
+        text_document = lsp.protocol.TextDocumentIdentifier(uri=str(path))
+        full = provider['full']
+        if previous_result_id and isinstance(full, dict) and full.get('delta'):
+            method = 'textDocument/semanticTokens/full/delta'
+            params = lsp.protocol.SemanticTokensDeltaParams(
+                textDocument=text_document, previousResultId=previous_result_id)
+        else:
+            method = 'textDocument/semanticTokens/full'
+            params = lsp.protocol.SemanticTokensParams(
+                textDocument=text_document)
+        # the whole document. behind interactive requests
+        return self.request(method, params, priority=lsp.scheduler.Priority.BULK,
+                            key=('textDocument/semanticTokens', path))
+
+    def request_lines(self, method: str, path: pathlib.Path, first: int, last: int) -> asyncio.Future:
+        '''
+        semanticTokens/range, inlayHint, ... of the lines. a newer one supersedes this
+        '''
+        return self.request(method, {
+            'textDocument': lsp.protocol.TextDocumentIdentifier(uri=str(path)),
+            'range': lsp.protocol.Range(
+                start=lsp.protocol.Position(line=first, character=0),
+                end=lsp.protocol.Position(line=last + 1, character=0)),
+        }, key=(method, path))
+
+    def resolve_completion(self, item: dict) -> asyncio.Future:
+        '''
+        only the focused item is resolved. a newer one supersedes this
+        '''
+        return self.request('completionItem/resolve', item,
+                            key='completionItem/resolve')
+
+    def request(self, method: str, params, *,
+                priority: lsp.scheduler.Priority = lsp.scheduler.Priority.INTERACTIVE,
+                key=None) -> asyncio.Future:
+        '''
+        see lsp.scheduler.RequestScheduler.request
+        '''
+        self.on_used()
+        return self.scheduler.request(method, params, priority=priority, key=key)
+
+    def get_stats(self) -> dict:
+        stats = self.client.get_stats()
+        stats['scheduler'] = {
+            'queue_depth': self.scheduler.queue_depth,
+            'superseded': self.scheduler.superseded_count,
+        }
+        stats['open_documents'] = len(self._open)
+        stats['supervisor'] = {
+            'state': self.state.name,
+            'restarts': self.restart_count,
+            'idle_stops': self.idle_stop_count,
+        }
+        return stats
 
 
 class WorkSpace:
-    def __init__(self, path: pathlib.Path) -> None:
+    def __init__(self, path: pathlib.Path, lsp_command_map: Optional[Dict[str, List[str]]] = None,
+                 shared_lsp: bool = False, idle_timeout: Optional[float] = IDLE_TIMEOUT) -> None:
+        '''
+        lsp_command_map: filetype => command. default is lsp.client.LSP_COMMAND_MAP
+        shared_lsp: share language servers with other vicode processes through lsp.daemon
+        idle_timeout: seconds without use to stop a language server. None: never
+        '''
         self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.lsp_command_map = lsp_command_map
+        self.shared_lsp = shared_lsp
+        self.idle_timeout = idle_timeout
         self.workspace_dir = get_workspace_dir(path)
         logger.info(f'{self.workspace_dir}')
         from .event import EventType, DISPATCHER
-        DISPATCHER.register(EventType.DocumentActivated,
-                            self.on_document_activated)
+        self._event_handlers = {
+            EventType.DocumentActivated: self.on_document_activated,
+            EventType.DocumentChanged: self.on_document_changed,
+            EventType.ViewportChanged: self.on_viewport_changed,
+        }
+        for event_type, handler in self._event_handlers.items():
+            DISPATCHER.register(event_type, handler)
 
         self.lsp: Dict[str, ClientHandler] = {}
+        # activated documents. sent again to a relaunched server
+        self.documents: Dict[pathlib.Path, EditorDocument] = {}
+
+    def unregister(self):
+        '''
+        stop following the documents, so another WorkSpace can
+        '''
+        from .event import DISPATCHER
+        for event_type in self._event_handlers:
+            DISPATCHER.unregister(event_type)
 
     def on_document_activated(self, buffer):
         assert(isinstance(buffer, EditorDocument))
@@ -101,19 +530,166 @@ class WorkSpace:
 
         client = self.get_or_launch_lsp(filetype)
         if client:
-            client.activate(buffer.location, filetype, buffer.buffer.text)
+            buffer.lsp = client
+            self.documents[buffer.location] = buffer
+            if client.activate(buffer.location):
+                self.open_document(client, buffer)
+            # evicted ones are opened again on activation
+            for path in [path for path, document in self.documents.items()
+                         if document.lsp is client and not client.is_open(path)]:
+                del self.documents[path]
+
+    def open_document(self, handler: ClientHandler, buffer: EditorDocument):
+        text = buffer.buffer.text
+        handler.open(buffer.location, buffer.filetype or '',
+                     text, buffer.sync.open(text))
+        # result ids are of the previous didOpen
+        buffer.semantic_tokens.clear()
+        self.update_semantic_tokens(handler, buffer)
+        self.update_viewport(handler, buffer)
+
+    def on_lsp_ready(self, handler: ClientHandler):
+        '''
+        initialized, the first time or relaunched. the open documents are sent
+        '''
+        for path in handler.open_paths:
+            buffer = self.documents.get(path)
+            if buffer:
+                self.open_document(handler, buffer)
+
+    def on_document_changed(self, buffer):
+        assert(isinstance(buffer, EditorDocument))
+        handler = self.lsp.get(buffer.filetype or '')
+        if not handler or not handler.is_open(buffer.location):
+            return
+        # relaunches an idle server. the text is sent on ready
+        handler.on_used()
+        kind = handler.client.text_document_sync_kind
+        if kind == lsp.protocol.TextDocumentSyncKind.NONE:
+            # not initialized yet, or the server does not want changes.
+            # the next change is taken from the text sent last
+            return
+        changes = buffer.sync.changes(buffer.buffer.text,
+                                      full=kind == lsp.protocol.TextDocumentSyncKind.Full)
+        if changes:
+            handler.change(buffer.location, buffer.sync.version, changes)
+            self.update_semantic_tokens(handler, buffer)
+            self.update_viewport(handler, buffer)
+
+    def on_viewport_changed(self, buffer):
+        assert(isinstance(buffer, EditorDocument))
+        handler = self.lsp.get(buffer.filetype or '')
+        if not handler or not handler.is_open(buffer.location):
+            return
+        handler.on_used()
+        self.update_viewport(handler, buffer)
+
+    def update_semantic_tokens(self, handler: ClientHandler, buffer: EditorDocument):
+        tokens = buffer.semantic_tokens
+        future = handler.request_semantic_tokens(
+            buffer.location, tokens.result_id)
+        if not future:
+            return
+
+        def on_result(result):
+            tokens.set_legend(
+                handler.client.server_capabilities['semanticTokensProvider']['legend'])
+            tokens.update(result)
+
+        def on_error():
+            # full next time
+            tokens.result_id = None
+        on_response(future, on_result, on_error)
+
+    def update_viewport(self, handler: ClientHandler, buffer: EditorDocument):
+        '''
+        range data of the requested lines. the previous data is replaced
+        '''
+        if not buffer.viewport.requested:
+            # not rendered yet
+            return
+        first, last = buffer.viewport.requested
+        capabilities = handler.client.server_capabilities
+        path = buffer.location
+
+        provider = capabilities.get('semanticTokensProvider')
+        if provider and provider.get('range'):
+            tokens = buffer.semantic_tokens
+
+            def on_tokens(result):
+                tokens.set_legend(provider['legend'])
+                tokens.update(result)
+            on_response(handler.request_lines(
+                'textDocument/semanticTokens/range', path, first, last), on_tokens)
+
+        def provides(name: str) -> bool:
+            # true or options, which may be empty
+            return capabilities.get(name) not in (None, False)
+
+        if provides('inlayHintProvider'):
+            on_response(handler.request_lines('textDocument/inlayHint', path, first, last),
+                        lambda result: buffer.range_data.set_inlay_hints(result, first, last))
+
+        if provides('codeLensProvider'):
+            # of the whole document. kept for the lines only
+            on_response(handler.request('textDocument/codeLens', {
+                'textDocument': lsp.protocol.TextDocumentIdentifier(uri=str(path)),
+            }, key=('textDocument/codeLens', path)),
+                lambda result: buffer.range_data.set_code_lenses(result, first, last))
+
+    async def warm_up_async(self, concurrency: int = WARM_UP_CONCURRENCY):
+        '''
+        launch and initialize the servers of the filetypes in the workspace,
+        before their first document is activated
+        '''
+        assert(self.loop)
+        # a large tree is walked off the UI thread
+        filetypes = await self.loop.run_in_executor(None, scan_filetypes, self.workspace_dir)
+        logger.info(f'warm up: {filetypes}')
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def launch_async(filetype: str):
+            async with semaphore:
+                handler = self.get_or_launch_lsp(filetype)
+                if handler:
+                    await handler.wait_ready_async()
+        await asyncio.gather(*(launch_async(filetype) for filetype in filetypes))
+
+    async def shutdown_async(self, timeout: float = SHUTDOWN_TIMEOUT, kill_timeout: float = KILL_TIMEOUT) -> dict:
+        '''
+        stop all servers at once, each within timeout and the kill_timeout steps.
+        return the seconds taken and how each server ended
+        '''
+        start = time.perf_counter()
+        handlers = list(self.lsp.values())
+        for handler in handlers:
+            handler.close()
+        results = await asyncio.gather(*(stop_client_async(handler.client, timeout, kill_timeout)
+                                         for handler in handlers))
+        report = {
+            'seconds': time.perf_counter() - start,
+            'servers': {handler.filetype: result for handler, result in zip(handlers, results)},
+        }
+        logger.info(f'lsp teardown: {report["seconds"] * 1000:.0f} ms {report["servers"]}')
+        return report
+
+    def get_lsp_stats(self) -> dict:
+        return {filetype: handler.get_stats() for filetype, handler in self.lsp.items()}
 
     def get_or_launch_lsp(self, filetype: str) -> Optional[ClientHandler]:
         assert(isinstance(self.loop, asyncio.AbstractEventLoop))
         handler = self.lsp.get(filetype)
         if not handler:
-            client = lsp.client.create_client(self.workspace_dir, filetype)
+            factory = functools.partial(lsp.client.create_client,
+                                        self.workspace_dir, filetype, self.lsp_command_map, self.shared_lsp)
+            client = factory()
             if not client:
                 return
-            handler = ClientHandler(filetype, client)
+            handler = ClientHandler(filetype, client, factory=factory,
+                                    idle_timeout=self.idle_timeout, on_ready=self.on_lsp_ready)
             self.lsp[filetype] = handler
-            self.loop.create_task(process_async(
-                handler.queue, handler.client,  self.loop))
+            handler.task = self.loop.create_task(
+                supervise_async(handler, self.loop))
 
             from .event import EventType, DISPATCHER
             DISPATCHER.enqueue(EventType.LspLaunched, handler)
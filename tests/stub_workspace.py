@@ -0,0 +1,57 @@
+import sys
+import os
+import pathlib
+import unittest
+import unittest.mock
+import asyncio
+
+FILE = pathlib.Path(__file__).absolute()
+HERE = FILE.parent
+sys.path.append(str(HERE.parent / 'src'))
+
+
+class StubWorkSpaceTestCase(unittest.IsolatedAsyncioTestCase):
+    '''
+    a WorkSpace with lsp.stub_server as the python server.
+    create_workspace in asyncSetUp or the test
+    '''
+
+    # lsp.stub_server args
+    stub_args = ()
+
+    async def asyncSetUp(self):
+        from vicode.lsp import client
+        # the server is spawned after get_or_launch_lsp returns
+        self.env = unittest.mock.patch.dict(
+            os.environ, client.python_module_env())
+        self.env.start()
+        self.workspace = None
+
+    async def asyncTearDown(self):
+        if self.workspace:
+            self.workspace.unregister()
+            await self.workspace.shutdown_async()
+        self.env.stop()
+
+    def create_workspace(self, path: pathlib.Path = HERE, lsp_command_map=None, **kwargs):
+        '''
+        lsp_command_map: default is the stub with stub_args for python
+        '''
+        from vicode.lsp import client
+        from vicode.workspace import WorkSpace
+        self.workspace = WorkSpace(
+            path, lsp_command_map or {'python': client.stub_command(*self.stub_args)}, **kwargs)
+        self.workspace.loop = asyncio.get_running_loop()
+        return self.workspace
+
+    def open_document(self, path: pathlib.Path):
+        '''
+        an EditorDocument of path activated in the workspace
+        '''
+        from vicode.editor.editor_document import EditorDocument
+        import prompt_toolkit.key_binding
+        assert(self.workspace)
+        document = EditorDocument(
+            path, prompt_toolkit.key_binding.KeyBindings())
+        self.workspace.on_document_activated(document)
+        return document
@@ -0,0 +1,139 @@
+import sys
+import os
+import pathlib
+import tempfile
+import unittest
+import asyncio
+
+FILE = pathlib.Path(__file__).absolute()
+HERE = FILE.parent
+sys.path.append(str(HERE.parent / 'src'))
+
+
+class TestDaemon(unittest.IsolatedAsyncioTestCase):
+    '''
+    two Clients share one lsp.stub_server through lsp.daemon
+    '''
+
+    async def initialize(self, lsp):
+        from vicode.lsp import protocol
+        await lsp.launch(asyncio.get_running_loop())
+        result = await lsp.request_initialize(protocol.InitializeParams(
+            processId=os.getpid(),
+            capabilities=protocol.ClientCapabilities(),
+        ))
+        lsp.notify_initialized(protocol.InitializedParams())
+        return result
+
+    async def test_shared_server(self):
+        from vicode.lsp import client, protocol
+        with tempfile.TemporaryDirectory() as tmp:
+            socket_path = pathlib.Path(tmp) / 'stub.sock'
+            address = f'unix://{socket_path}'
+            clients = []
+            received = []
+            for i in range(2):
+                lsp = client.Client(*client.stub_command('--diagnostics', '3'),
+                                    address=address, daemon=True)
+                lsp.daemon_idle_timeout = 0.5
+                diagnostics = asyncio.Queue()
+                lsp.callbacks[client.NotificationTypes.diagnostics] = diagnostics.put_nowait
+                clients.append(lsp)
+                received.append(diagnostics)
+
+            for lsp in clients:
+                result = await self.initialize(lsp)
+                self.assertIn('capabilities', result)
+            daemon_process = clients[0]._daemon_process
+            self.assertFalse(hasattr(clients[1], '_daemon_process'))
+
+            for lsp in clients:
+                lsp.notify_textDocument_didOpen(protocol.DidOpenTextDocumentParams(
+                    textDocument=protocol.TextDocumentItem(
+                        uri=FILE.as_uri(), languageId='python', version=1, text='')))
+            # each didOpen reaches the server, each publish reaches both clients
+            for diagnostics in received:
+                for _ in range(2):
+                    params = await asyncio.wait_for(diagnostics.get(), 10)
+                    self.assertEqual(len(params['diagnostics']), 3)
+
+            for lsp in clients:
+                result = await lsp.rpcDispatcher.request_async('textDocument/completion', {
+                    'textDocument': {'uri': FILE.as_uri()},
+                    'position': {'line': 0, 'character': 0},
+                })
+                self.assertTrue(result['items'])
+
+            for lsp in clients:
+                await lsp.request_shutdown()
+                lsp.notify_exit()
+                await lsp.writer.flush_async()
+
+            # the daemon stops its server after the idle timeout
+            for _ in range(100):
+                if daemon_process.poll() is not None:
+                    break
+                await asyncio.sleep(0.1)
+            self.assertEqual(daemon_process.returncode, 0)
+            self.assertFalse(socket_path.exists())
+
+    async def test_shared_document(self):
+        from vicode.lsp import client, protocol
+        with tempfile.TemporaryDirectory() as tmp:
+            address = f'unix://{pathlib.Path(tmp) / "stub.sock"}'
+            a, b = [client.Client(*client.stub_command(), address=address, daemon=True)
+                    for _ in range(2)]
+            for lsp in (a, b):
+                lsp.daemon_idle_timeout = 0.5
+                await self.initialize(lsp)
+            daemon_process = a._daemon_process
+            uri = FILE.as_uri()
+
+            def insert(lsp, version, line, character, text):
+                lsp.notify_textDocument_didChange(protocol.DidChangeTextDocumentParams(
+                    textDocument=protocol.VersionedTextDocumentIdentifier(
+                        uri=uri, version=version),
+                    contentChanges=[protocol.TextDocumentContentChangeEvent(
+                        range=protocol.Range(
+                            start=protocol.Position(line=line, character=character),
+                            end=protocol.Position(line=line, character=character)),
+                        text=text)]))
+
+            async def synced(lsp):
+                # after the notifications of lsp
+                return await lsp.rpcDispatcher.request_async(
+                    '$/stub/document', {'textDocument': {'uri': uri}})
+
+            for lsp in (a, b):
+                lsp.notify_textDocument_didOpen(protocol.DidOpenTextDocumentParams(
+                    textDocument=protocol.TextDocumentItem(
+                        uri=uri, languageId='python', version=1, text='a\n')))
+            # each client edits its own text, with its own versions
+            insert(a, 2, 0, 1, 'b')
+            self.assertEqual(await synced(a), {'version': 3, 'text': 'ab\n'})
+            insert(b, 2, 0, 0, 'c')
+            self.assertEqual(await synced(b), {'version': 4, 'text': 'ca\n'})
+            insert(a, 3, 1, 0, 'x')
+            self.assertEqual(await synced(a), {'version': 5, 'text': 'ab\nx'})
+            insert(a, 4, 1, 1, 'y')
+            self.assertEqual(await synced(a), {'version': 6, 'text': 'ab\nxy'})
+
+            # the server gets the text of the one left
+            insert(b, 3, 0, 0, 'd')
+            b.notify_textDocument_didClose(protocol.DidCloseTextDocumentParams(
+                textDocument=protocol.TextDocumentIdentifier(uri=uri)))
+            self.assertEqual(await synced(b), {'version': 8, 'text': 'ab\nxy'})
+
+            for lsp in (a, b):
+                await lsp.request_shutdown()
+                lsp.notify_exit()
+                await lsp.writer.flush_async()
+            for _ in range(100):
+                if daemon_process.poll() is not None:
+                    break
+                await asyncio.sleep(0.1)
+            self.assertEqual(daemon_process.returncode, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import sys
+import json
+import time
+import random
+import pathlib
+import unittest
+import asyncio
+
+FILE = pathlib.Path(__file__).absolute()
+HERE = FILE.parent
+sys.path.append(str(HERE.parent / 'src'))
+
+
+def to_index(text: str, position) -> int:
+    lines = text.split('\n')
+    index = sum(len(l) + 1 for l in lines[:position['line']])
+    line = lines[position['line']]
+    units = 0
+    col = 0
+    while units < position['character']:
+        units += 2 if ord(line[col]) > 0xFFFF else 1
+        col += 1
+    return index + col
+
+
+def apply(text: str, change) -> str:
+    if 'range' not in change:
+        return change['text']
+    start = to_index(text, change['range']['start'])
+    end = to_index(text, change['range']['end'])
+    return text[:start] + change['text'] + text[end:]
+
+
+class TestDocumentSync(unittest.TestCase):
+
+    def test_random_edits(self):
+        from vicode.editor.document_sync import DocumentSync
+        rand = random.Random(0)
+        alphabet = 'ab \n\t😀あ'
+        text = ''.join(rand.choice(alphabet) for _ in range(500))
+        sync = DocumentSync()
+        self.assertEqual(sync.open(text), 1)
+        server_text = text
+        for i in range(300):
+            start = rand.randrange(len(text) + 1)
+            end = min(len(text), start + rand.randrange(5))
+            insert = ''.join(rand.choice(alphabet)
+                             for _ in range(rand.randrange(4)))
+            text = text[:start] + insert + text[end:]
+            for change in sync.changes(text):
+                server_text = apply(server_text, change)
+            self.assertEqual(server_text, text)
+        self.assertGreater(sync.version, 1)
+        self.assertEqual(sync.changes(text), [])
+
+    def test_full(self):
+        from vicode.editor.document_sync import DocumentSync
+        sync = DocumentSync()
+        sync.open('a')
+        self.assertEqual(sync.changes('ab', full=True), [{'text': 'ab'}])
+        self.assertEqual(sync.version, 2)
+
+    def test_large_file(self):
+        from vicode.editor.document_sync import DocumentSync
+        lines = [f'    value_{i} = compute(value_{i - 1}, {i})' for i in range(50000)]
+        text = '\n'.join(lines)
+        sync = DocumentSync()
+        sync.open(text)
+        # type one character at a time in the middle of the file
+        index = text.index('value_25000 =')
+        start = time.perf_counter()
+        sent = 0
+        for c in 'new_name_':
+            text = text[:index] + c + text[index:]
+            index += 1
+            changes = sync.changes(text)
+            sent += len(json.dumps(changes))
+            self.assertEqual(changes[0]['range']['start']['line'], 25000)
+            self.assertEqual(changes[0]['text'], c)
+        elapsed = time.perf_counter() - start
+        self.assertLess(sent, 1000)
+        print(f'\n50k lines: {elapsed / 9 * 1000:.2f} ms per change',
+              file=sys.stderr)
+
+
+class TestChangeDelay(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        from vicode.event import DISPATCHER, EventType
+        self.changed = []
+        DISPATCHER.register(EventType.DocumentChanged, self.changed.append)
+
+    async def asyncTearDown(self):
+        from vicode.event import DISPATCHER, EventType
+        DISPATCHER.unregister(EventType.DocumentChanged)
+
+    async def test_coalesce(self):
+        from vicode.editor.editor_document import EditorDocument
+        import prompt_toolkit.key_binding
+        document = EditorDocument(FILE, prompt_toolkit.key_binding.KeyBindings())
+        document.change_delay = 0.05
+
+        for c in 'hello':
+            document.buffer.insert_text(c)
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.changed, [])
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.changed, [document])
+
+        # flushed at once, and the timer is gone
+        document.buffer.insert_text('!')
+        document.flush_changes()
+        self.assertEqual(len(self.changed), 2)
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(self.changed), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
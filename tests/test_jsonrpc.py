@@ -0,0 +1,472 @@
+import sys
+import os
+import json
+import pathlib
+import unittest
+import asyncio
+
+FILE = pathlib.Path(__file__).absolute()
+HERE = FILE.parent
+sys.path.append(str(HERE.parent / 'src'))
+
+
+async def open_pipe():
+    '''
+    StreamReader, StreamWriter over os.pipe
+    '''
+    r, w = os.pipe()
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=2**26)
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(r, 'rb'))
+    transport, protocol = await loop.connect_write_pipe(
+        asyncio.streams.FlowControlMixin, os.fdopen(w, 'wb'))
+    writer = asyncio.StreamWriter(transport, protocol, None, loop)
+    return reader, writer
+
+
+class Peer:
+    '''
+    one end of two RpcDispatchers connected to each other
+    '''
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        from vicode.lsp import jsonrpc_2_0
+        self.notifications = []
+        self.requests = []
+        self.reader = reader
+        self.writer = jsonrpc_2_0.MessageWriter(writer)
+        self.dispatcher = jsonrpc_2_0.RpcDispatcher(
+            self.on_notification, self.writer)
+
+    async def on_notification(self, method, params):
+        self.notifications.append((method, params))
+
+    def handle(self, method, handler):
+        '''
+        register handler that records requests
+        '''
+        async def record(params):
+            self.requests.append((method, params))
+            return await handler(params)
+        self.dispatcher.register_request_handler(method, record)
+
+    async def wait_for(self, items: list, count: int):
+        while len(items) < count:
+            await asyncio.sleep(0.005)
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        self.writer.start(loop)
+        self.task = loop.create_task(self._read())
+
+    async def _read(self):
+        while await self.dispatcher.read_rpc_message_async(self.reader):
+            pass
+
+    def stop(self):
+        self.writer.stop()
+        self.task.cancel()
+
+
+async def connect_pair():
+    a_reader, b_writer = await open_pipe()
+    b_reader, a_writer = await open_pipe()
+    a = Peer(a_reader, a_writer)
+    b = Peer(b_reader, b_writer)
+    a.start()
+    b.start()
+    return a, b
+
+
+def frame(message) -> bytes:
+    body = json.dumps(message).encode('utf-8')
+    return f'Content-Length: {len(body)}\r\n\r\n'.encode('ascii') + body
+
+
+class TestMessageFramer(unittest.TestCase):
+
+    def test_split_and_merged_chunks(self):
+        from vicode.lsp import jsonrpc_2_0
+
+        messages = [{'jsonrpc': '2.0', 'method': f'm{i}', 'params': {'text': 'あ' * i}}
+                    for i in range(8)]
+        data = b''.join(frame(m) for m in messages)
+
+        # one byte at a time
+        framer = jsonrpc_2_0.MessageFramer()
+        bodies = []
+        for i in range(len(data)):
+            bodies += framer.feed(data[i:i+1])
+        self.assertEqual([json.loads(b) for b in bodies], messages)
+        self.assertEqual(framer.buffered, 0)
+
+        # all at once
+        framer = jsonrpc_2_0.MessageFramer()
+        bodies = framer.feed(data)
+        self.assertEqual([json.loads(b) for b in bodies], messages)
+
+    def test_content_type(self):
+        from vicode.lsp import jsonrpc_2_0
+
+        framer = jsonrpc_2_0.MessageFramer()
+        bodies = framer.feed(
+            b'Content-Type: application/vscode-jsonrpc; charset=utf-8\r\ncontent-length: 2\r\n\r\n{}')
+        self.assertEqual(bodies, [b'{}'])
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_round_trip(self):
+        from vicode.lsp import codec
+
+        message = {'jsonrpc': '2.0', 'id': 1, 'result': {
+            'contents': 'あいう', 'range': None, 'list': [1, 2.5, True]}}
+        codecs = codec.available_codecs()
+        self.assertIn('json', codecs)
+        for c in codecs.values():
+            body = c.dumps(message)
+            self.assertIsInstance(body, bytes)
+            self.assertEqual(json.loads(body), message)
+            self.assertEqual(c.loads(frame(message).split(b'\r\n\r\n')[1]), message)
+
+
+class TestResultStream(unittest.TestCase):
+
+    def parse(self, message, chunk_size: int, consumers):
+        from vicode.lsp import result_stream
+        data = json.dumps(message).encode('utf-8')
+        stream = result_stream.ResultStream(consumers.get)
+        for i in range(0, len(data) - chunk_size, chunk_size):
+            stream.feed(data[i:i+chunk_size])
+        return stream, stream.finish(data[stream.fed:])
+
+    def test_completion_list(self):
+        items = [{'label': f'item{i}', 'kind': 3, 'documentation': 'あ\n' * (i % 5)}
+                 for i in range(300)]
+        message = {'jsonrpc': '2.0', 'id': 7,
+                   'result': {'isIncomplete': True, 'items': items}}
+        for chunk_size in (7, 4096):
+            received = []
+            stream, parsed = self.parse(message, chunk_size, {7: received.append})
+            self.assertEqual(received, items)
+            self.assertEqual(parsed, {'jsonrpc': '2.0', 'id': 7,
+                                      'result': {'isIncomplete': True, 'items': []}})
+
+    def test_array_result(self):
+        locations = [{'uri': 'file:///a.py', 'range': {'start': {'line': i, 'character': 0},
+                                                       'end': {'line': i, 'character': 10}}}
+                     for i in range(100)]
+        received = []
+        stream, parsed = self.parse({'id': 1, 'jsonrpc': '2.0', 'result': locations},
+                                    100, {1: received.append})
+        self.assertEqual(received, locations)
+        self.assertEqual(parsed['result'], [])
+
+        # numbers split across chunks
+        received = []
+        stream, parsed = self.parse({'id': 1, 'result': list(range(1000))},
+                                    3, {1: received.append})
+        self.assertEqual(received, list(range(1000)))
+
+    def test_fallback(self):
+        # id after result, or not a streaming request
+        for message, consumers in (({'result': [1, 2], 'id': 1}, {1: print}),
+                                   ({'id': 2, 'result': [1, 2]}, {1: print}),
+                                   ({'jsonrpc': '2.0', 'method': 'm', 'params': [1, 2]}, {1: print})):
+            stream, parsed = self.parse(message, 4, consumers)
+            self.assertTrue(stream.failed)
+            self.assertFalse(stream.committed)
+            self.assertIsNone(parsed)
+
+
+class TestRpcDispatcher(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.client, self.server = await connect_pair()
+
+    async def asyncTearDown(self):
+        self.client.stop()
+        self.server.stop()
+
+    async def test_short_read(self):
+        from vicode.lsp import jsonrpc_2_0
+
+        reader = asyncio.StreamReader()
+
+        # larger than a single read chunk
+        params = {'diagnostics': ['x' * 100] * 2000}
+        data = frame({'jsonrpc': '2.0', 'method': 'textDocument/publishDiagnostics',
+                      'params': params})
+        self.assertGreater(len(data), jsonrpc_2_0.READ_CHUNK_SIZE)
+        reader.feed_data(data + data)
+        reader.feed_eof()
+
+        while await self.client.dispatcher.read_rpc_message_async(reader):
+            pass
+        self.assertEqual([params for _, params in self.client.notifications],
+                         [params, params])
+
+    async def test_coalesced_write(self):
+        writer = self.client.writer
+        for i in range(3):
+            self.client.dispatcher.notify('$/test', {'i': i})
+        self.assertEqual(writer.queue_depth, 3)
+        self.assertGreater(writer.queued_bytes, 0)
+        await writer.flush_async()
+        self.assertEqual(writer.queue_depth, 0)
+        self.assertEqual(writer.frame_count, 3)
+        self.assertEqual(writer.write_count, 1)
+        self.assertEqual(writer.max_queue_depth, 3)
+
+        await self.server.wait_for(self.server.notifications, 3)
+        self.assertEqual(self.server.notifications,
+                         [('$/test', {'i': i}) for i in range(3)])
+
+    async def test_backpressure(self):
+        from vicode.lsp import jsonrpc_2_0
+        reader, stream = await open_pipe()
+        writer = jsonrpc_2_0.MessageWriter(stream, queue_high_water=1024)
+        writer.put({'data': 'x' * 2048})
+        waiter = asyncio.get_running_loop().create_task(
+            writer.wait_writable_async())
+        await asyncio.sleep(0.05)
+        self.assertFalse(waiter.done())
+        writer.start(asyncio.get_running_loop())
+        await asyncio.wait_for(waiter, 1)
+        self.assertEqual(writer.queued_bytes, 0)
+        writer.close()
+
+    async def test_broken_pipe(self):
+        from vicode.lsp import jsonrpc_2_0
+        r, w = os.pipe()
+        loop = asyncio.get_running_loop()
+        transport, protocol = await loop.connect_write_pipe(
+            asyncio.streams.FlowControlMixin, os.fdopen(w, 'wb'))
+        writer = jsonrpc_2_0.MessageWriter(
+            asyncio.StreamWriter(transport, protocol, None, loop))
+        writer.start(loop)
+        os.close(r)
+        dispatcher = jsonrpc_2_0.RpcDispatcher(self.client.on_notification, writer)
+        dispatcher.notify('$/test', {})
+        # does not wait forever
+        await asyncio.wait_for(writer.flush_async(), 1)
+        self.assertTrue(writer.closed)
+        with self.assertRaises(ConnectionError):
+            dispatcher.notify('$/test', {})
+        with self.assertRaises(ConnectionError):
+            await dispatcher.request_async('$/test', {})
+        # not left pending
+        self.assertEqual(dispatcher.pending_count, 0)
+        writer.stop()
+
+    async def echo(self, params):
+        return params
+
+    async def never(self, params):
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            self.cancelled.append(params)
+            return 'late'
+
+    async def test_response(self):
+        self.server.handle('echo', self.echo)
+        dispatcher = self.client.dispatcher
+        results = await asyncio.gather(*[dispatcher.request_async('echo', i)
+                                         for i in range(100)])
+        self.assertEqual(results, list(range(100)))
+        self.assertEqual(dispatcher.pending_count, 0)
+
+    async def test_timeout(self):
+        self.cancelled = []
+        self.server.handle('lost', self.never)
+        self.server.handle('echo', self.echo)
+        dispatcher = self.client.dispatcher
+        with self.assertRaises(asyncio.TimeoutError):
+            await dispatcher.request_async('lost', 1, timeout=0.05)
+        self.assertEqual(dispatcher.pending_count, 0)
+
+        # server receives $/cancelRequest. late response is dropped
+        await self.server.wait_for(self.cancelled, 1)
+        self.assertEqual(self.cancelled, [1])
+        self.assertEqual(await dispatcher.request_async('echo', 'echo'), 'echo')
+
+    async def test_cancel(self):
+        self.cancelled = []
+        self.server.handle('slow', self.never)
+        dispatcher = self.client.dispatcher
+        task = asyncio.create_task(
+            dispatcher.request_async('slow', 1, timeout=None))
+        await self.server.wait_for(self.server.requests, 1)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(dispatcher.pending_count, 0)
+
+        await self.server.wait_for(self.cancelled, 1)
+        self.assertEqual(self.cancelled, [1])
+
+    async def test_server_request(self):
+        event = asyncio.Event()
+
+        async def slow(params):
+            await event.wait()
+            return params
+        self.client.handle('workspace/configuration', slow)
+
+        # handler does not block the read loop
+        task = asyncio.create_task(self.server.dispatcher.request_async(
+            'workspace/configuration', {'items': []}))
+        await self.client.wait_for(self.client.requests, 1)
+        self.server.dispatcher.notify('$/test', None)
+        await self.client.wait_for(self.client.notifications, 1)
+        self.assertFalse(task.done())
+
+        event.set()
+        self.assertEqual(await task, {'items': []})
+
+    async def test_server_request_concurrency(self):
+        running = 0
+        max_running = 0
+
+        async def work(params):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(running, max_running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return params
+        self.client.handle('work', work)
+
+        server = self.server.dispatcher
+        results = await asyncio.gather(*[server.request_async('work', i)
+                                         for i in range(20)])
+        self.assertEqual(results, list(range(20)))
+        self.assertGreater(max_running, 1)
+        self.assertLessEqual(max_running, 4)
+
+    async def test_error_response(self):
+        from vicode.lsp import jsonrpc_2_0
+
+        async def fail(params):
+            raise ValueError('fail')
+        self.server.handle('fail', fail)
+        self.server.handle('echo', self.echo)
+        dispatcher = self.client.dispatcher
+
+        with self.assertRaises(jsonrpc_2_0.MethodNotFoundError) as cm:
+            await dispatcher.request_async('unknown', None)
+        self.assertEqual(cm.exception.code, jsonrpc_2_0.ErrorCodes.MethodNotFound)
+        self.assertEqual(cm.exception.method, 'unknown')
+
+        for _ in range(3):
+            with self.assertRaises(jsonrpc_2_0.RpcError) as cm:
+                await dispatcher.request_async('fail', None)
+            self.assertEqual(cm.exception.code, jsonrpc_2_0.ErrorCodes.InternalError)
+
+        # reader is alive
+        self.assertEqual(await dispatcher.request_async('echo', 1), 1)
+        self.assertEqual(dispatcher.error_counts, {'unknown': 1, 'fail': 3})
+        self.assertEqual(dispatcher.pending_count, 0)
+
+    async def test_batch(self):
+        from vicode.lsp import jsonrpc_2_0
+        self.server.handle('echo', self.echo)
+
+        self.client.dispatcher.notify_batch(
+            [('$/test', {'i': i}) for i in range(3)])
+        await self.client.writer.flush_async()
+        self.assertEqual(self.client.writer.frame_count, 1)
+        await self.server.wait_for(self.server.notifications, 3)
+        self.assertEqual(self.server.notifications,
+                         [('$/test', {'i': i}) for i in range(3)])
+
+        # responses to a batch come back as one array
+        bodies = []
+        self.client.dispatcher.on_body = bodies.append
+        self.client.writer.put_batch([
+            jsonrpc_2_0.make_request(1001, 'echo', 1),
+            jsonrpc_2_0.make_notification('$/test', {'i': 3}),
+            jsonrpc_2_0.make_request(1002, 'echo', 2),
+        ])
+        await self.client.wait_for(bodies, 1)
+        responses = json.loads(bodies[0])
+        self.assertEqual(sorted((r['id'], r['result']) for r in responses),
+                         [(1001, 1), (1002, 2)])
+        self.assertEqual(self.server.notifications[-1], ('$/test', {'i': 3}))
+
+    async def test_offload(self):
+        dispatcher = self.client.dispatcher
+        dispatcher.offload_threshold = 1024
+        # large bodies decoded in a thread do not overtake small ones
+        for i in range(6):
+            self.server.dispatcher.notify('$/test', {'i': i, 'pad': 'x' * 2000 * (i % 2)})
+        await self.client.wait_for(self.client.notifications, 6)
+        self.assertEqual([params['i'] for _, params in self.client.notifications],
+                         list(range(6)))
+        self.assertEqual(dispatcher.offload_count, 3)
+
+    async def test_request_stream(self):
+        items = [{'label': f'item{i}', 'detail': 'x' * 100} for i in range(5000)]
+
+        async def completion(params):
+            return {'isIncomplete': False, 'items': items[:params]}
+        self.server.handle('completion', completion)
+        dispatcher = self.client.dispatcher
+
+        # large: parsed while it arrives
+        received = []
+        result = await dispatcher.request_stream_async('completion', 5000, received.append)
+        self.assertEqual(received, items)
+        self.assertEqual(result, {'isIncomplete': False, 'items': []})
+        self.assertEqual(dispatcher.stream_count, 1)
+
+        # small: decoded as a whole, same interface
+        received = []
+        result = await dispatcher.request_stream_async('completion', 10, received.append)
+        self.assertEqual(received, items[:10])
+        self.assertEqual(result, {'isIncomplete': False, 'items': []})
+        self.assertEqual(dispatcher.stream_count, 1)
+
+    async def test_notification_while_streaming(self):
+        diagnostics = [{'message': 'x' * 100, 'range': None} for _ in range(5000)]
+
+        async def completion(params):
+            # a large notification arrives before the response
+            self.server.dispatcher.notify('textDocument/publishDiagnostics',
+                                          {'uri': 'file:///a.py', 'diagnostics': diagnostics})
+            await asyncio.sleep(0.05)
+            return {'isIncomplete': False, 'items': [{'label': 'a'}]}
+        self.server.handle('completion', completion)
+        dispatcher = self.client.dispatcher
+        dispatcher.stream_threshold = 1024
+
+        received = []
+        result = await dispatcher.request_stream_async('completion', None, received.append)
+        self.assertEqual(received, [{'label': 'a'}])
+        self.assertEqual(result, {'isIncomplete': False, 'items': []})
+        self.assertEqual(self.client.notifications, [(
+            'textDocument/publishDiagnostics', {'uri': 'file:///a.py', 'diagnostics': diagnostics})])
+        self.assertEqual(dispatcher.stream_count, 0)
+
+    async def test_stats(self):
+        self.server.handle('echo', self.echo)
+        dispatcher = self.client.dispatcher
+        for i in range(10):
+            await dispatcher.request_async('echo', 'x' * 100)
+        dispatcher.notify('$/test', None)
+
+        stats = dispatcher.stats.snapshot()
+        echo = stats['requests']['echo']
+        self.assertEqual(echo['count'], 10)
+        self.assertEqual(echo['latency_ms']['count'], 10)
+        self.assertGreater(echo['response_bytes'], 1000)
+        self.assertEqual(stats['notifications_out']['$/test']['count'], 1)
+        self.assertEqual(
+            self.server.dispatcher.stats.snapshot()['server_requests']['echo']['count'], 10)
+        json.dumps(stats)
+
+
+if __name__ == '__main__':
+    unittest.main()
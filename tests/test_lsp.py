@@ -3,6 +3,7 @@ import os
 import pathlib
 import unittest
 import asyncio
+import tempfile
 
 FILE = pathlib.Path(__file__).absolute()
 HERE = FILE.parent
@@ -55,6 +56,51 @@ class TestLanguageServer(unittest.IsolatedAsyncioTestCase):
         await lsp.request_shutdown()
         self.assertTrue(True)
 
+    async def run_session(self, lsp):
+        from vicode.lsp import client
+        from vicode.lsp import protocol
+
+        publishDiagnostic_future = asyncio.Future()
+
+        def on_diagnostics(params):
+            publishDiagnostic_future.set_result(params)
+        lsp.callbacks[client.NotificationTypes.diagnostics] = on_diagnostics
+
+        await lsp.launch(asyncio.get_running_loop())
+        response = await lsp.request_initialize(protocol.InitializeParams(
+            processId=os.getpid(),
+            capabilities=protocol.ClientCapabilities(),
+        ))
+        lsp.notify_initialized(protocol.InitializedParams())
+        lsp.notify_textDocument_didOpen(protocol.DidOpenTextDocumentParams(
+            textDocument=protocol.TextDocumentItem(
+                uri=str(FILE),
+                languageId='python',
+                version=1,
+                text=FILE.read_text()
+            )
+        ))
+        diagnostic = await asyncio.wait_for(publishDiagnostic_future, 10)
+        await lsp.request_shutdown()
+        lsp.notify_exit()
+        await lsp.writer.flush_async()
+        await lsp._process.wait()
+        return response, diagnostic
+
+    async def test_record_replay(self):
+        from vicode.lsp import client
+        from vicode.lsp import session
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = pathlib.Path(tmp) / 'session.jsonl'
+            recorded = await self.run_session(client.Client(*client.LSP_COMMAND_MAP['python'], record=path))
+            messages = session.load_session(path)
+            self.assertEqual(messages[0].direction, session.SEND)
+            self.assertIn(session.RECV, [m.direction for m in messages])
+
+            replayed = await self.run_session(client.Client.replay(path, speed=0))
+            self.assertEqual(replayed, recorded)
+
 
 if __name__ == '__main__':
     unittest.main()
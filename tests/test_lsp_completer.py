@@ -0,0 +1,132 @@
+import sys
+import pathlib
+import unittest
+import asyncio
+from stub_workspace import StubWorkSpaceTestCase
+
+FILE = pathlib.Path(__file__).absolute()
+HERE = FILE.parent
+sys.path.append(str(HERE.parent / 'src'))
+
+
+class TestCompletionSession(unittest.TestCase):
+    def test_filter(self):
+        from vicode.editor.lsp_completer import CompletionSession
+        session = CompletionSession(0, 0, {'isIncomplete': False, 'items': [
+            {'label': 'Append', 'sortText': '1'},
+            {'label': 'append', 'sortText': '2'},
+            {'label': 'apply', 'sortText': '0'},
+            {'label': 'map_pending', 'sortText': '3'},
+            {'label': 'extend'},
+        ]})
+
+        def labels(prefix):
+            return [item['label'] for item in session.filter(prefix)]
+        self.assertEqual(labels(''), ['apply', 'Append', 'append', 'map_pending', 'extend'])
+        # exact case first, then ignoring case, then subsequence
+        self.assertEqual(labels('ap'), ['apply', 'append', 'Append', 'map_pending'])
+        self.assertEqual(labels('app'), ['apply', 'append', 'Append', 'map_pending'])
+        self.assertEqual(labels('appe'), ['append', 'Append', 'map_pending'])
+        # back to a shorter prefix
+        self.assertEqual(labels('a'), ['apply', 'append', 'Append', 'map_pending'])
+        self.assertEqual(labels('x'), ['extend'])
+
+
+class LspCompleterTestCase(StubWorkSpaceTestCase):
+    '''
+    LspCompleter of an EditorDocument against lsp.stub_server
+    '''
+
+    # some 40 items
+    stub_args = ('--payload-size', '4096')
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.create_workspace()
+        self.document = self.open_document(FILE)
+        self.handler = self.document.lsp
+        assert(self.handler)
+        while not self.handler.client.server_capabilities:
+            await asyncio.sleep(0.01)
+
+    async def complete(self, text: str):
+        '''
+        type text at the end of the document and complete
+        '''
+        import prompt_toolkit.completion
+        buffer = self.document.buffer
+        buffer.cursor_position = len(buffer.text)
+        # no completion while typing in the background
+        buffer.insert_text(text, fire_event=False)
+        return [c.text async for c in self.document.completer.get_completions_async(
+            buffer.document, prompt_toolkit.completion.CompleteEvent())]
+
+
+class TestLspCompleter(LspCompleterTestCase):
+    async def test_session(self):
+        completer = self.document.completer
+        items = await self.complete('\nstub_item_1')
+        self.assertEqual(completer.request_count, 1)
+        self.assertEqual(items[:2], ['stub_item_1', 'stub_item_10'])
+        # typing narrows the cached list
+        self.assertTrue(completer.in_session(self.document.buffer.document))
+        items = await self.complete('2')
+        self.assertEqual(items[0], 'stub_item_12')
+        self.assertEqual(completer.request_count, 1)
+        # a new word is a new session
+        await self.complete(' st')
+        self.assertEqual(completer.request_count, 2)
+
+    async def test_resolve(self):
+        completer = self.document.completer
+        buffer = self.document.buffer
+        await self.complete('\nstub_item_1')
+        buffer.start_completion(select_first=True)
+        while not (buffer.complete_state and buffer.complete_state.current_completion):
+            await asyncio.sleep(0.01)
+
+        async def meta():
+            for _ in range(500):
+                state = buffer.complete_state
+                if state and state.current_completion.resolved:
+                    return state.current_completion.display_meta_text
+                await asyncio.sleep(0.01)
+            self.fail('not resolved')
+        self.assertEqual(await meta(), 'stub.stub_item_1 doc of stub_item_1')
+        self.assertEqual(completer.resolve_count, 1)
+
+        # scrolling fast. only the last one is resolved
+        for _ in range(3):
+            buffer.complete_next()
+            await asyncio.sleep(0)
+        self.assertEqual(await meta(), 'stub.stub_item_12 doc of stub_item_12')
+        # the others were superseded in flight
+        self.assertEqual(self.handler.scheduler.superseded_count, 2)
+        self.assertEqual(len(completer.session.resolved), 2)
+
+        # back to the resolved one
+        count = completer.resolve_count
+        for _ in range(3):
+            buffer.complete_previous()
+        await meta()
+        self.assertEqual(completer.resolve_count, count)
+
+    async def test_capabilities(self):
+        from vicode.workspace import make_client_capabilities
+        completion_item = make_client_capabilities()['textDocument']['completion']['completionItem']
+        self.assertIn('documentation', completion_item['resolveSupport']['properties'])
+
+
+class TestLspCompleterIncomplete(LspCompleterTestCase):
+    stub_args = ('--incomplete',)
+
+    async def test_session(self):
+        completer = self.document.completer
+        await self.complete('\nstub')
+        await self.complete('_')
+        # isIncomplete asks again
+        self.assertEqual(completer.request_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
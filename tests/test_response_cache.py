@@ -0,0 +1,119 @@
+import sys
+import os
+import json
+import pathlib
+import unittest
+import asyncio
+
+FILE = pathlib.Path(__file__).absolute()
+HERE = FILE.parent
+sys.path.append(str(HERE.parent / 'src'))
+
+URI = FILE.as_uri()
+OTHER_URI = (HERE / 'other.py').as_uri()
+
+
+def did_open(uri: str, version: int = 1):
+    return {'textDocument': {'uri': uri, 'languageId': 'python', 'version': version, 'text': ''}}
+
+
+def did_change(uri: str, version: int):
+    return {'textDocument': {'uri': uri, 'version': version}, 'contentChanges': [{'text': ''}]}
+
+
+def position(method: str, uri: str, line: int):
+    return method, {'textDocument': {'uri': uri}, 'position': {'line': line, 'character': 0}}
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        from vicode.lsp.response_cache import ResponseCache
+        self.cache = ResponseCache(lambda x: json.dumps(x).encode('utf-8'), max_bytes=100)
+        self.cache.on_notification('textDocument/didOpen', did_open(URI))
+        self.cache.on_notification('textDocument/didOpen', did_open(OTHER_URI))
+
+    def put(self, method: str, uri: str, line: int, result):
+        key = self.cache.make_key(*position(method, uri, line))
+        assert(key)
+        self.cache.put(key, result, self.cache.generation)
+
+    def get(self, method: str, uri: str, line: int):
+        key = self.cache.make_key(*position(method, uri, line))
+        assert(key)
+        return self.cache.get(key)
+
+    def test_version(self):
+        self.put('textDocument/hover', URI, 0, 'a')
+        self.put('textDocument/hover', OTHER_URI, 0, 'b')
+        self.put('textDocument/references', OTHER_URI, 0, [])
+        self.assertEqual(self.get('textDocument/hover', URI, 0), (True, 'a'))
+        self.assertEqual(self.get('textDocument/hover', URI, 1), (False, None))
+
+        self.cache.on_notification('textDocument/didChange', did_change(URI, 2))
+        self.assertEqual(self.get('textDocument/hover', URI, 0), (False, None))
+        # references of the other document may point into the changed one
+        self.assertEqual(self.get('textDocument/references', OTHER_URI, 0), (False, None))
+        self.assertEqual(self.get('textDocument/hover', OTHER_URI, 0), (True, 'b'))
+
+    def test_invalidated_while_requesting(self):
+        key = self.cache.make_key(*position('textDocument/references', OTHER_URI, 0))
+        assert(key)
+        generation = self.cache.generation
+        # the other document is closed and opened again at the same version
+        self.cache.on_notification('textDocument/didClose', {'textDocument': {'uri': OTHER_URI}})
+        self.cache.on_notification('textDocument/didOpen', did_open(OTHER_URI))
+        self.cache.put(key, [], generation)
+        self.assertEqual(self.cache.get(key), (False, None))
+
+        # references may point into a document changed meanwhile
+        generation = self.cache.generation
+        self.cache.on_notification('textDocument/didChange', did_change(URI, 2))
+        self.cache.put(key, [], generation)
+        self.assertEqual(self.cache.get(key), (False, None))
+
+    def test_not_cached(self):
+        self.assertIsNone(self.cache.make_key(*position('textDocument/completion', URI, 0)))
+        self.assertIsNone(self.cache.make_key(
+            *position('textDocument/hover', (HERE / 'closed.py').as_uri(), 0)))
+
+    def test_lru(self):
+        # 12 bytes each
+        for line in range(10):
+            self.put('textDocument/hover', URI, line, 'x' * 10)
+        self.assertLessEqual(self.cache.bytes, 100)
+        self.assertEqual(len(self.cache), 8)
+        self.assertEqual(self.get('textDocument/hover', URI, 1), (False, None))
+        self.assertEqual(self.get('textDocument/hover', URI, 9)[0], True)
+
+
+class TestClientCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        from vicode.lsp import client, protocol
+        self.lsp = client.Client.stub()
+        await self.lsp.launch(asyncio.get_running_loop())
+        await self.lsp.request_initialize(protocol.InitializeParams(
+            processId=os.getpid(),
+            capabilities=protocol.ClientCapabilities(),
+        ))
+        self.lsp.notify_initialized(protocol.InitializedParams())
+
+    async def asyncTearDown(self):
+        await self.lsp.request_shutdown()
+        self.lsp.notify_exit()
+        await self.lsp.writer.flush_async()
+        await self.lsp._process.wait()
+
+    async def test_hover(self):
+        self.lsp.notify_batch([('textDocument/didOpen', did_open(URI))])
+        for line in (0, 1, 0, 1, 0):
+            await self.lsp.request_async(*position('textDocument/hover', URI, line))
+        self.assertEqual(self.lsp.stats.snapshot()['requests']['textDocument/hover']['count'], 2)
+
+        self.lsp.notify_batch([('textDocument/didChange', did_change(URI, 2))])
+        await self.lsp.request_async(*position('textDocument/hover', URI, 0))
+        self.assertEqual(self.lsp.stats.snapshot()['requests']['textDocument/hover']['count'], 3)
+        self.assertEqual(self.lsp.get_stats()['response_cache']['hits'], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
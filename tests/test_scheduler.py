@@ -0,0 +1,101 @@
+import sys
+import os
+import pathlib
+import unittest
+import asyncio
+
+FILE = pathlib.Path(__file__).absolute()
+HERE = FILE.parent
+sys.path.append(str(HERE.parent / 'src'))
+
+
+class TestRequestScheduler(unittest.IsolatedAsyncioTestCase):
+    '''
+    RequestScheduler in front of lsp.stub_server
+    '''
+
+    async def asyncSetUp(self):
+        from vicode.lsp import client, protocol, scheduler
+        self.lsp = client.Client.stub('--delay', '0.2')
+        await self.lsp.launch(asyncio.get_running_loop())
+        await self.lsp.request_initialize(protocol.InitializeParams(
+            processId=os.getpid(),
+            capabilities=protocol.ClientCapabilities(),
+        ))
+        self.lsp.notify_initialized(protocol.InitializedParams())
+        self.scheduler = scheduler.RequestScheduler(self.lsp)
+        self.task = asyncio.create_task(self.scheduler.run_async())
+
+        self.sent = []
+        self.lsp.writer.on_body = self.sent.append
+
+    async def asyncTearDown(self):
+        self.task.cancel()
+        await self.lsp.request_shutdown()
+        self.lsp.notify_exit()
+        await self.lsp.writer.flush_async()
+        await self.lsp._process.wait()
+
+    def hover(self, line: int) -> asyncio.Future:
+        return self.scheduler.request('textDocument/hover', {
+            'textDocument': {'uri': FILE.as_uri()},
+            'position': {'line': line, 'character': 0},
+        }, key=('textDocument/hover', FILE.as_uri()))
+
+    def methods(self):
+        import json
+        methods = []
+        for body in self.sent:
+            message = json.loads(body)
+            for m in (message if isinstance(message, list) else [message]):
+                methods.append(m['method'])
+        return methods
+
+    async def test_sync_first(self):
+        hover = self.hover(0)
+        self.scheduler.notify('textDocument/didOpen', {'textDocument': {
+            'uri': FILE.as_uri(), 'languageId': 'python', 'version': 1, 'text': ''}})
+        await hover
+        self.assertEqual(self.methods(),
+                         ['textDocument/didOpen', 'textDocument/hover'])
+
+    async def test_supersede(self):
+        # queued ones are dropped
+        old = [self.hover(i) for i in range(3)]
+        latest = self.hover(3)
+        self.assertTrue(await latest)
+        for future in old:
+            self.assertTrue(future.cancelled())
+        self.assertEqual(self.methods(), ['textDocument/hover'])
+
+        # an in-flight one is cancelled on the wire
+        self.sent.clear()
+        inflight = self.hover(4)
+        await asyncio.sleep(0.05)
+        latest = self.hover(5)
+        self.assertTrue(await latest)
+        self.assertTrue(inflight.cancelled())
+        self.assertEqual(sorted(self.methods()), ['$/cancelRequest',
+                                                  'textDocument/hover', 'textDocument/hover'])
+        self.assertEqual(self.scheduler.superseded_count, 4)
+
+    async def test_bulk(self):
+        from vicode.lsp import scheduler
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        bulk = [self.scheduler.request('textDocument/completion', {}, priority=scheduler.Priority.BULK)
+                for _ in range(3)]
+        await asyncio.sleep(0)
+        # does not wait behind bulk work
+        await self.hover(0)
+        self.assertLess(loop.time() - start, 0.35)
+        # the first bulk request runs alongside
+        self.assertLessEqual(sum(f.done() for f in bulk), 1)
+
+        # one at a time
+        await asyncio.gather(*bulk)
+        self.assertGreater(loop.time() - start, 0.55)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import sys
+import time
+import random
+import pathlib
+import unittest
+
+FILE = pathlib.Path(__file__).absolute()
+HERE = FILE.parent
+sys.path.append(str(HERE.parent / 'src'))
+
+LEGEND = {'tokenTypes': ['variable', 'function'], 'tokenModifiers': []}
+
+
+def encode(tokens):
+    '''
+    absolute (line, start, length, type) => relative data
+    '''
+    data = []
+    prev_line = 0
+    prev_start = 0
+    for line, start, length, token_type in sorted(tokens):
+        delta_start = start - prev_start if line == prev_line else start
+        data.extend([line - prev_line, delta_start, length, token_type, 0])
+        prev_line = line
+        prev_start = start
+    return data
+
+
+def random_tokens(rand: random.Random, lines: int):
+    tokens = set()
+    for line in range(lines):
+        if rand.random() < 0.3:
+            continue
+        col = 0
+        for _ in range(rand.randint(1, 4)):
+            col += rand.randint(0, 3)
+            length = rand.randint(1, 5)
+            tokens.add((line, col, length, rand.randint(0, 1)))
+            col += length
+    return sorted(tokens)
+
+
+class TestSemanticTokens(unittest.TestCase):
+    def test_line_tokens(self):
+        from vicode.editor.semantic_tokens import SemanticTokens
+        rand = random.Random(0)
+        absolute = random_tokens(rand, 200)
+        tokens = SemanticTokens()
+        tokens.update({'resultId': '1', 'data': encode(absolute)})
+        self.assertEqual(tokens.token_count, len(absolute))
+        for line in range(210):
+            expected = [(start, length, token_type, 0)
+                        for l, start, length, token_type in absolute if l == line]
+            self.assertEqual(tokens.get_line_tokens(line), expected, line)
+
+    def test_delta(self):
+        from vicode.editor.semantic_tokens import SemanticTokens
+        rand = random.Random(1)
+        tokens = SemanticTokens()
+        absolute = random_tokens(rand, 100)
+        tokens.update({'resultId': '1', 'data': encode(absolute)})
+        for i in range(50):
+            # the server's edits: replace some tokens, by two separate edits
+            new = list(absolute)
+            a = rand.randrange(len(new))
+            new[a:a + rand.randint(0, 3)] = random_tokens(rand, 1)[:1] and [
+                (new[a][0], new[a][1], 1, 1)]
+            b = rand.randrange(len(new))
+            del new[b:b + rand.randint(0, 2)]
+            new = sorted(set(new))
+            old_data = encode(absolute)
+            new_data = encode(new)
+            # common prefix and suffix per 5 ints, then split the middle in two edits
+            prefix = 0
+            while prefix < min(len(old_data), len(new_data)) and old_data[prefix] == new_data[prefix]:
+                prefix += 1
+            prefix -= prefix % 5
+            suffix = 0
+            while (suffix < min(len(old_data), len(new_data)) - prefix
+                   and old_data[-1 - suffix] == new_data[-1 - suffix]):
+                suffix += 1
+            suffix -= suffix % 5
+            old_mid = len(old_data) - suffix - prefix
+            new_mid = new_data[prefix:len(new_data) - suffix]
+            half = (old_mid // 10) * 5
+            edits = [
+                {'start': prefix + half, 'deleteCount': old_mid - half, 'data': new_mid[half:]},
+                {'start': prefix, 'deleteCount': half, 'data': new_mid[:half]},
+            ]
+            tokens.update({'resultId': str(i + 2), 'edits': edits})
+            self.assertEqual(list(tokens.data), new_data)
+            absolute = new
+            for line in range(100):
+                expected = [(start, length, token_type, 0)
+                            for l, start, length, token_type in absolute if l == line]
+                self.assertEqual(tokens.get_line_tokens(line), expected)
+
+    def test_lexer(self):
+        import prompt_toolkit.document
+        import prompt_toolkit.lexers
+        from vicode.editor.semantic_tokens import SemanticTokens, SemanticTokensLexer
+        tokens = SemanticTokens()
+        tokens.set_legend(LEGEND)
+        text = 'x = f(y)\n😀 = f(a)'
+        tokens.update({'data': encode([
+            (0, 0, 1, 0), (0, 4, 1, 1), (0, 6, 1, 0),
+            # after a surrogate pair
+            (1, 5, 1, 1),
+        ])})
+        lexer = SemanticTokensLexer(tokens, prompt_toolkit.lexers.SimpleLexer('class:base'))
+        get_line = lexer.lex_document(prompt_toolkit.document.Document(text))
+        self.assertEqual(get_line(0), [
+            ('class:base class:semantic.variable', 'x'),
+            ('class:base', ' = '),
+            ('class:base class:semantic.function', 'f'),
+            ('class:base', '('),
+            ('class:base class:semantic.variable', 'y'),
+            ('class:base', ')'),
+        ])
+        self.assertEqual(get_line(1), [
+            ('class:base', '😀 = '),
+            ('class:base class:semantic.function', 'f'),
+            ('class:base', '(a)'),
+        ])
+
+        # a new result is a new lexer hash
+        hash = lexer.invalidation_hash()
+        tokens.update({'data': []})
+        self.assertNotEqual(lexer.invalidation_hash(), hash)
+        self.assertEqual(get_line(0), [('class:base', 'x = f(y)')])
+
+    def test_large(self):
+        from vicode.editor.semantic_tokens import SemanticTokens
+        # 100k lines, 4 tokens each
+        data = []
+        for line in range(100000):
+            data.extend([1 if line else 0, 0, 3, 0, 0])
+            for _ in range(3):
+                data.extend([0, 4, 3, 1, 0])
+        tokens = SemanticTokens()
+        start = time.perf_counter()
+        tokens.update({'resultId': '1', 'data': data})
+        update = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tokens.update({'resultId': '2', 'edits': [{'start': 5 * 200003, 'deleteCount': 5, 'data': [0, 4, 3, 0, 0]}]})
+        delta = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for line in range(50000, 50100):
+            tokens.get_line_tokens(line)
+        lookup = time.perf_counter() - start
+        print(f'\n400k tokens: full {update * 1000:.1f} ms, delta {delta * 1000:.1f} ms, '
+              f'100 lines {lookup * 1000:.2f} ms')
+        self.assertEqual(tokens.get_line_tokens(50000)[3], (12, 3, 0, 0))
+        self.assertLess(lookup, 0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import sys
+import os
+import time
+import pathlib
+import unittest
+import asyncio
+import tracemalloc
+from stub_workspace import StubWorkSpaceTestCase
+
+FILE = pathlib.Path(__file__).absolute()
+HERE = FILE.parent
+sys.path.append(str(HERE.parent / 'src'))
+
+
+def report(name: str, count: int, elapsed: float, peak: int):
+    print(f'\n{name}: {count} in {elapsed:.3f}s {count / elapsed:.0f}/s peak {peak / 1024 / 1024:.1f}MiB',
+          file=sys.stderr)
+
+
+class TestStress(StubWorkSpaceTestCase):
+    '''
+    drive Client, WorkSpace and Diagnostics through lsp.stub_server
+    '''
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        tracemalloc.start()
+
+    async def asyncTearDown(self):
+        tracemalloc.stop()
+        await super().asyncTearDown()
+
+    async def initialize(self, lsp):
+        from vicode.lsp import protocol
+        await lsp.launch(asyncio.get_running_loop())
+        await lsp.request_initialize(protocol.InitializeParams(
+            processId=os.getpid(),
+            capabilities=protocol.ClientCapabilities(),
+        ))
+        lsp.notify_initialized(protocol.InitializedParams())
+
+    async def shutdown(self, lsp):
+        await lsp.request_shutdown()
+        lsp.notify_exit()
+        await lsp.writer.flush_async()
+        await lsp._process.wait()
+
+    def open(self, lsp, uri: str):
+        from vicode.lsp import protocol
+        lsp.notify_textDocument_didOpen(protocol.DidOpenTextDocumentParams(
+            textDocument=protocol.TextDocumentItem(
+                uri=uri, languageId='python', version=1, text='')))
+
+    async def test_client_diagnostics(self):
+        from vicode.lsp import client
+        publishes = 500
+        lsp = client.Client.stub('--diagnostics', '100',
+                                 '--publishes', str(publishes))
+        done = asyncio.Event()
+        received = 0
+
+        def on_diagnostics(params):
+            nonlocal received
+            received += 1
+            if received == publishes:
+                done.set()
+        lsp.callbacks[client.NotificationTypes.diagnostics] = on_diagnostics
+        await self.initialize(lsp)
+
+        start = time.perf_counter()
+        self.open(lsp, str(FILE))
+        await asyncio.wait_for(done.wait(), 60)
+        elapsed = time.perf_counter() - start
+        report('publishDiagnostics x100', received, elapsed,
+               tracemalloc.get_traced_memory()[1])
+
+        await self.shutdown(lsp)
+
+    async def test_client_requests(self):
+        from vicode.lsp import client
+        lsp = client.Client.stub('--delay', '0.01',
+                                 '--payload-size', str(1024 * 1024))
+        await self.initialize(lsp)
+
+        count = 20
+        params = {'textDocument': {'uri': str(FILE)},
+                  'position': {'line': 0, 'character': 0}}
+        start = time.perf_counter()
+        results = await asyncio.gather(*[lsp.rpcDispatcher.request_async('textDocument/completion', params)
+                                         for _ in range(count)])
+        elapsed = time.perf_counter() - start
+        self.assertTrue(all(r['items'] for r in results))
+        report('completion 1MiB', count, elapsed,
+               tracemalloc.get_traced_memory()[1])
+        self.assertEqual(lsp.rpcDispatcher.pending_count, 0)
+
+        await self.shutdown(lsp)
+
+    async def test_workspace_diagnostics(self):
+        from vicode.lsp import client
+        from vicode.layout.diagnostics import Diagnostics
+        import prompt_toolkit.key_binding
+
+        diagnostics_count = 20
+        publishes = 50
+        workspace = self.create_workspace(lsp_command_map={'python': client.stub_command(
+            '--diagnostics', str(diagnostics_count), '--publishes', str(publishes))})
+        handler = workspace.get_or_launch_lsp('python')
+        assert(handler)
+        diagnostics = Diagnostics(
+            prompt_toolkit.key_binding.KeyBindings(), 'python')
+        handler.client.callbacks[client.NotificationTypes.diagnostics] = diagnostics.on_diagnostics
+
+        while not handler.ready:
+            await asyncio.sleep(0.01)
+        start = time.perf_counter()
+        if handler.activate(FILE):
+            handler.open(FILE, 'python', FILE.read_text())
+        while len(diagnostics._items) < diagnostics_count * publishes:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        report('Diagnostics items', len(diagnostics._items), elapsed,
+               tracemalloc.get_traced_memory()[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import sys
+import pathlib
+import tempfile
+import unittest
+import asyncio
+from stub_workspace import StubWorkSpaceTestCase
+
+FILE = pathlib.Path(__file__).absolute()
+HERE = FILE.parent
+sys.path.append(str(HERE.parent / 'src'))
+
+LINES = 100000
+
+
+class TestRangeDataProcessor(unittest.TestCase):
+    def test_inlay_hints(self):
+        import prompt_toolkit.document
+        import prompt_toolkit.layout.processors
+        from vicode.editor.viewport import RangeData, RangeDataProcessor
+        data = RangeData()
+        data.set_inlay_hints([
+            {'position': {'line': 0, 'character': 1}, 'label': ':int', 'paddingLeft': False},
+            {'position': {'line': 0, 'character': 5}, 'label': [{'value': 'x='}]},
+            # outside
+            {'position': {'line': 9, 'character': 0}, 'label': 'no'},
+        ], 0, 5)
+        data.set_code_lenses([
+            {'range': {'start': {'line': 0, 'character': 0}}, 'command': {'title': 'run'}},
+        ], 0, 5)
+        self.assertEqual(list(data.inlay_hints), [0])
+
+        text = 'a = f(b)'
+        ti = prompt_toolkit.layout.processors.TransformationInput(
+            None, prompt_toolkit.document.Document(text), 0, lambda i: i, [('', text)], 80, 1)
+        transformation = RangeDataProcessor(data).apply_transformation(ti)
+        self.assertEqual(''.join(f[1] for f in transformation.fragments),
+                         'a:int = fx=(b)  run')
+        self.assertEqual(transformation.source_to_display(0), 0)
+        self.assertEqual(transformation.source_to_display(1), 5)
+        self.assertEqual(transformation.source_to_display(6), 12)
+        for i in range(len(text)):
+            self.assertEqual(transformation.display_to_source(
+                transformation.source_to_display(i)), i)
+        # on a hint
+        self.assertEqual(transformation.display_to_source(2), 1)
+
+
+class TestViewport(StubWorkSpaceTestCase):
+    '''
+    EditorDocument range data from lsp.stub_server
+    '''
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        path = pathlib.Path(self.tmp.name) / 'large.py'
+        path.write_text(''.join(f'x{i} = {i}\n' for i in range(LINES - 1)))
+
+        self.create_workspace(path)
+        self.document = self.open_document(path)
+        self.document.viewport.delay = 0.01
+        self.handler = self.document.lsp
+        assert(self.handler)
+        while not self.handler.client.server_capabilities:
+            await asyncio.sleep(0.01)
+
+    async def asyncTearDown(self):
+        await super().asyncTearDown()
+        self.tmp.cleanup()
+
+    def count(self, method: str) -> int:
+        requests = self.handler.client.stats.snapshot()['requests']
+        return requests[method]['count'] if method in requests else 0
+
+    async def scroll(self, first: int, last: int):
+        methods = ['textDocument/semanticTokens/range',
+                   'textDocument/inlayHint', 'textDocument/codeLens']
+        counts = [self.count(method) for method in methods]
+        self.document.viewport.update(first, last)
+        for _ in range(200):
+            await asyncio.sleep(0.02)
+            if (all(self.count(method) > count for method, count in zip(methods, counts))
+                    and not self.handler.client.rpcDispatcher.pending_count):
+                break
+        # the results are applied by done callbacks
+        await asyncio.sleep(0.01)
+
+    async def test_scroll(self):
+        document = self.document
+        await self.scroll(0, 39)
+        self.assertEqual(document.viewport.requested, (0, 79))
+        self.assertEqual(document.semantic_tokens.token_count, 80)
+        self.assertEqual(sorted(document.range_data.inlay_hints), list(range(80)))
+        self.assertEqual(sorted(document.range_data.code_lenses), list(range(0, 80, 10)))
+
+        # inside the requested lines
+        document.viewport.update(20, 59)
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.count('textDocument/inlayHint'), 1)
+
+        # far away. the previous data is dropped
+        await self.scroll(50000, 50039)
+        self.assertEqual(document.viewport.requested, (49960, 50079))
+        self.assertEqual(document.semantic_tokens.token_count, 120)
+        self.assertEqual(document.semantic_tokens.get_line_tokens(0), [])
+        self.assertEqual(document.semantic_tokens.get_line_tokens(50000), [(0, 1, 0, 0)])
+        self.assertEqual(min(document.range_data.inlay_hints), 49960)
+        self.assertEqual(len(document.range_data.code_lenses), 12)
+
+        # debounced
+        for line in range(0, 1000, 100):
+            document.viewport.update(line, line + 39)
+        await self.scroll(1000, 1039)
+        self.assertEqual(self.count('textDocument/inlayHint'), 3)
+        self.assertEqual(self.count('textDocument/semanticTokens/range'), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
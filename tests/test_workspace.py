@@ -0,0 +1,252 @@
+import sys
+import pathlib
+import unittest
+import unittest.mock
+import asyncio
+import tempfile
+from stub_workspace import StubWorkSpaceTestCase
+
+FILE = pathlib.Path(__file__).absolute()
+HERE = FILE.parent
+
+
+class TestWorkSpace(StubWorkSpaceTestCase):
+    '''
+    ClientHandler against lsp.stub_server
+    '''
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.handler = self.create_workspace().get_or_launch_lsp('python')
+        assert(self.handler)
+
+    async def wait_sent(self, method: str, count: int) -> int:
+        for _ in range(500):
+            sent = self.handler.client.stats.snapshot()['notifications_out'].get(method)
+            if sent and sent['count'] >= count:
+                return sent['count']
+            await asyncio.sleep(0.01)
+        self.fail(f'{method} x {count}')
+
+    def sent(self, method: str) -> int:
+        sent = self.handler.client.stats.snapshot()['notifications_out'].get(method)
+        return sent['count'] if sent else 0
+
+    async def test_keep_open(self):
+        handler = self.handler
+        handler.max_open = 2
+        while not handler.ready:
+            await asyncio.sleep(0.01)
+        paths = sorted(HERE.glob('*.py'))[:3]
+        a, b, c = paths
+
+        # switching between open documents is free on the wire
+        for path in (a, b, a, b, a):
+            if handler.activate(path):
+                handler.open(path, 'python', path.read_text())
+        await self.wait_sent('textDocument/didOpen', 2)
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.sent('textDocument/didOpen'), 2)
+        self.assertEqual(self.sent('textDocument/didClose'), 0)
+
+        # over the limit, the least recently used is closed
+        if handler.activate(c):
+            handler.open(c, 'python', c.read_text())
+        await self.wait_sent('textDocument/didClose', 1)
+        self.assertTrue(handler.is_open(a))
+        self.assertFalse(handler.is_open(b))
+        self.assertTrue(handler.is_open(c))
+        self.assertEqual(handler.get_stats()['open_documents'], 2)
+
+
+class TestSupervisor(StubWorkSpaceTestCase):
+    '''
+    restart and idle stop of the server of an EditorDocument
+    '''
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        # the restarts are not waited for
+        self.patches = [
+            unittest.mock.patch('vicode.workspace.RESTART_DELAY', 0.01),
+            unittest.mock.patch('vicode.workspace.MAX_RESTARTS', 2),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    async def asyncTearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        await super().asyncTearDown()
+
+    def launch(self, command, idle_timeout=None):
+        self.create_workspace(lsp_command_map={'python': command},
+                              idle_timeout=idle_timeout)
+        self.document = self.open_document(FILE)
+        self.handler = self.document.lsp
+        assert(self.handler)
+
+    async def wait_state(self, state):
+        for _ in range(500):
+            if self.handler.state == state:
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f'{self.handler.state} != {state}')
+
+    def sent(self, method: str) -> int:
+        sent = self.handler.client.stats.snapshot()['notifications_out'].get(method)
+        return sent['count'] if sent else 0
+
+    async def test_restart(self):
+        from vicode.lsp import client
+        from vicode.workspace import ServerState
+        self.launch(client.stub_command())
+        await self.wait_state(ServerState.READY)
+        first = self.handler.client
+        self.assertEqual(self.sent('textDocument/didOpen'), 1)
+        callbacks = first.callbacks
+
+        first._process.kill()
+        await first.closed.wait()
+        while self.handler.client is first:
+            await asyncio.sleep(0.01)
+        await self.wait_state(ServerState.READY)
+        self.assertIsNot(self.handler.client, first)
+        self.assertEqual(self.handler.restart_count, 1)
+        self.assertIs(self.handler.client.callbacks, callbacks)
+        # the open document is sent again
+        for _ in range(100):
+            if self.sent('textDocument/didOpen'):
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.sent('textDocument/didOpen'), 1)
+        self.assertEqual(self.document.sync.version, 2)
+
+    async def test_give_up(self):
+        from vicode.workspace import ServerState
+        # exits before initialize
+        self.launch([sys.executable, '-c', 'pass'])
+        await self.wait_state(ServerState.FAILED)
+        self.assertEqual(self.handler.restart_count, 2)
+        self.assertFalse(self.document.completer._get_handler())
+        # fails now, not never
+        future = self.handler.request('textDocument/hover', {})
+        with self.assertRaises(ConnectionError):
+            await asyncio.wait_for(future, 1)
+
+    async def test_idle(self):
+        from vicode.lsp import client
+        from vicode.workspace import ServerState
+        self.launch(client.stub_command(), idle_timeout=0.2)
+        await self.wait_state(ServerState.READY)
+        first = self.handler.client
+        await self.wait_state(ServerState.IDLE)
+        await asyncio.wait_for(first._process.wait(), 5)
+        self.assertTrue(first.exit_sent)
+        self.assertEqual(self.handler.idle_stop_count, 1)
+
+        # the next use relaunches, with the document
+        self.handler.idle_timeout = None
+        self.workspace.on_viewport_changed(self.document)
+        await self.wait_state(ServerState.READY)
+        self.assertIsNot(self.handler.client, first)
+        self.assertEqual(self.handler.restart_count, 0)
+        for _ in range(100):
+            if self.sent('textDocument/didOpen'):
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(self.sent('textDocument/didOpen'), 1)
+
+
+class TestWarmUp(StubWorkSpaceTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        from vicode.lsp import client
+        from vicode.editor.editor_document import FILE_TYPE_MAP
+        self.tmp = tempfile.TemporaryDirectory()
+        root = pathlib.Path(self.tmp.name)
+        (root / 'src').mkdir()
+        (root / 'src' / 'a.py').write_text('a = 1\n')
+        (root / 'notes.txt').write_text('text\n')
+        (root / 'node_modules').mkdir()
+        (root / 'node_modules' / 'b.js').write_text('')
+        self.root = root
+        self.file_types = unittest.mock.patch.dict(
+            FILE_TYPE_MAP, {'.txt': 'text', '.js': 'javascript'})
+        self.file_types.start()
+        self.create_workspace(root, {
+            'python': client.stub_command(),
+            'text': client.stub_command(),
+        })
+
+    async def asyncTearDown(self):
+        await super().asyncTearDown()
+        self.file_types.stop()
+        self.tmp.cleanup()
+
+    def test_scan(self):
+        from vicode.workspace import scan_filetypes
+        # node_modules is skipped
+        self.assertEqual(sorted(scan_filetypes(self.root)), ['python', 'text'])
+        self.assertEqual(len(scan_filetypes(self.root, limit=1)), 1)
+
+    async def test_warm_up(self):
+        assert(self.workspace)
+        task = asyncio.get_running_loop().create_task(
+            self.workspace.warm_up_async(concurrency=1))
+        while not task.done():
+            handlers = list(self.workspace.lsp.values())
+            if len(handlers) == 2:
+                # one at a time
+                self.assertTrue(handlers[0].ready)
+            await asyncio.sleep(0.001)
+        await task
+        self.assertEqual(sorted(self.workspace.lsp), ['python', 'text'])
+        for handler in self.workspace.lsp.values():
+            self.assertTrue(handler.ready)
+            self.assertEqual(handler.get_stats()['open_documents'], 0)
+
+
+# answers nothing and ignores SIGTERM
+STUBBORN = [sys.executable, '-c', '; '.join([
+    'import signal, time',
+    'signal.signal(signal.SIGTERM, signal.SIG_IGN)',
+    'print(flush=True)',
+    'time.sleep(60)',
+])]
+
+
+class TestShutdown(StubWorkSpaceTestCase):
+    async def test_shutdown(self):
+        from vicode.lsp import client
+        from vicode.workspace import ServerState
+        workspace = self.create_workspace(lsp_command_map={
+            'python': client.stub_command(),
+            'stubborn': STUBBORN,
+        })
+        python = workspace.get_or_launch_lsp('python')
+        stubborn = workspace.get_or_launch_lsp('stubborn')
+        assert(python and stubborn)
+        self.assertTrue(await python.wait_ready_async())
+        # its stdout is open
+        while not stubborn.client.launched:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.2)
+
+        report = await workspace.shutdown_async(timeout=0.3, kill_timeout=0.2)
+        self.assertEqual(report['servers'], {'python': 'exit', 'stubborn': 'kill'})
+        # at once, not one after another
+        self.assertLess(report['seconds'], 0.3 + 0.2 + 0.2 + 0.5)
+        for handler in (python, stubborn):
+            self.assertIsNotNone(handler.client._process.returncode)
+            self.assertEqual(handler.state, ServerState.EXITED)
+
+        # not restarted
+        await asyncio.sleep(0.1)
+        self.assertEqual(python.restart_count + stubborn.restart_count, 0)
+        with self.assertRaises(ConnectionError):
+            await python.request('textDocument/hover', {})
+
+
+if __name__ == '__main__':
+    unittest.main()